@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the automatic captures of `pygpssurvey.autocapture` on a
+    simulated 20 Hz stop-and-go survey: the rover walks `--stops` legs of
+    10 m at 1 m/s, stopping 8 s after each, with a 1 cm position noise.
+    The cost of the motion detection by fix is reported, and the
+    stationary captures are checked (one by stop).
+
+    Usage: python benchmarks/bench_autocapture.py [--stops 200]
+           [--rate 20] [--noise 0.01]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.fix import Fix
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey.autocapture import AutoCapture
+
+
+def track(stops, rate, leg=10., speed=1., stop=8.):
+    '''Yield the (time, east) of the survey.'''
+    t = 0.
+    east = 0.
+    dt = 1. / rate
+    for i in range(stops):
+        for j in range(int(leg / speed * rate)):
+            east += speed * dt
+            t += dt
+            yield t, east
+        for j in range(int(stop * rate)):
+            t += dt
+            yield t, east
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stops', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20.)
+    parser.add_argument('--noise', type=float, default=0.01)
+    args = parser.parse_args()
+
+    plane = LocalTangentPlane(5.5538, 45.4788)
+    random.seed(0)
+    fixes = []
+    for received, east in track(args.stops, args.rate):
+        lon, lat = plane.to_lonlat(east + random.gauss(0, args.noise),
+                                   random.gauss(0, args.noise))
+        fixes.append((received, Fix(lon=lon, lon_dir='E', lat=lat,
+                                    lat_dir='N', alt=553.8, alt_units='M',
+                                    quality=4)))
+
+    for spec in ('stationary=5', 'distance=2', 'stationary=5;interval=1'):
+        auto = AutoCapture.from_string(spec)
+        update = auto.update
+        triggers = Counter()
+        start = time.process_time()
+        for received, fix in fixes:
+            trigger = update(fix, received)
+            if trigger is not None:
+                triggers[trigger[0]] += 1
+        elapsed = time.process_time() - start
+        print('%-24s %d fixes, %.2f us/fix (%.3f%% of a CPU at %g Hz), '
+              'captures: %s' % (spec, len(fixes), elapsed / len(fixes) * 1e6,
+                                elapsed / len(fixes) * args.rate * 100,
+                                args.rate, dict(triggers)))
+        if spec == 'stationary=5' and triggers['stationary'] != args.stops:
+            sys.exit('%d stops, %d stationary captures'
+                     % (args.stops, triggers['stationary']))
+
+
+if __name__ == '__main__':
+    main()
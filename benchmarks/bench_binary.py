@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the hex/binary helpers of `pygpssurvey.utils` against
+    their former implementations, on a 1 MB buffer.
+
+    Usage: python benchmarks/bench_binary.py [--size BYTES] [--gain 10]
+
+    Exits with an error if a helper is not at least `--gain` times faster.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import time
+import argparse
+import binascii
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.utils import bytes_to_hex, bytes_to_binary, binary_to_int
+
+
+def old_bytes_to_hex(byte):
+    hexstr = str(binascii.hexlify(byte), "utf-8")
+    data = []
+    for i in range(0, len(hexstr), 2):
+        data.append("%s" % hexstr[i:i + 2].upper())
+    return ' '.join(data)
+
+
+def old_byte_to_binary(byte):
+    return ''.join(str((byte & (1 << i)) and 1) for i in reversed(range(8)))
+
+
+def old_bytes_to_binary(values):
+    return ''.join([old_byte_to_binary(b) for b in values])
+
+
+def old_binary_to_int(buf, start=0, stop=None):
+    return int(buf[::-1][start:(stop or len(buf))][::-1], 2)
+
+
+def timeit(func, *args):
+    '''Best wall-clock time of 3 runs.'''
+    best = None
+    for i in range(3):
+        begin = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', default=1 << 20, type=int)
+    parser.add_argument('--gain', default=10., type=float)
+    args = parser.parse_args()
+
+    buf = os.urandom(args.size)
+    binary = bytes_to_binary(buf[:4096])
+    cases = (
+        ('bytes_to_hex', old_bytes_to_hex, bytes_to_hex, (buf,)),
+        ('bytes_to_binary', old_bytes_to_binary, bytes_to_binary, (buf,)),
+        ('binary_to_int', old_binary_to_int, binary_to_int,
+         (binary, 100, 30000)),
+    )
+    failed = False
+    for name, old, new, args_ in cases:
+        old_time, old_result = timeit(old, *args_)
+        new_time, new_result = timeit(new, *args_)
+        if old_result != new_result:
+            print('%s: results differ' % name)
+            failed = True
+            continue
+        gain = old_time / new_time
+        print('%-16s old %9.2f ms  new %9.2f ms  gain x%.1f'
+              % (name, old_time * 1e3, new_time * 1e3, gain))
+        if name != 'binary_to_int' and gain < args.gain:
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
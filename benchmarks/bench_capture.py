@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the pipelined point captures: `--points` captures are
+    queued at once and done back to back on a simulated GGA stream, written
+    to a GeoPackage and a session database by the capture thread, then the
+    epochs accounting of the captures is checked (no epoch between two
+    captures, every epoch read is in a capture).
+
+    Usage: python benchmarks/bench_capture.py [--points 1000]
+           [--measuresnb 5] [--dir /tmp]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.commands import Commands
+from pygpssurvey.session import Session
+from pygpssurvey.capture import CapturePipeline
+from bench_ubx import epochs, gga
+
+
+class StreamLink(object):
+    '''Link giving the data of a GGA stream by chunks.'''
+    url = 'stream'
+
+    def __init__(self, data, chunk=512):
+        self.data = data
+        self.chunk = chunk
+        self.pos = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read(self, size=None, timeout=None):
+        data = self.data[self.pos:self.pos + self.chunk]
+        self.pos += self.chunk
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--points', type=int, default=1000)
+    parser.add_argument('--measuresnb', type=int, default=5)
+    parser.add_argument('--dir', default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    count = args.points * args.measuresnb + 100
+    data = ''.join(gga(*epoch) for epoch in epochs(count))
+    output = os.path.join(args.dir, 'bench_capture.gpkg')
+    sessionfile = os.path.join(args.dir, 'bench_capture.sqlite')
+    for filename in (output, sessionfile):
+        if os.path.exists(filename):
+            os.remove(filename)
+    session = Session(sessionfile)
+    device = GPSSurvey(StreamLink(data))
+    commands = Commands(['script:' + 'M ' * args.points + 'Q'])
+    # keep the pipeline to check its accounting
+    pipelines = []
+
+    class Pipeline(CapturePipeline):
+        def __init__(self, *args):
+            CapturePipeline.__init__(self, *args)
+            pipelines.append(self)
+
+    import pygpssurvey.device
+    pygpssurvey.device.CapturePipeline = Pipeline
+    start = time.time()
+    device.getpointsposition(output, io.StringIO(),
+                             measuresnb=args.measuresnb, commands=commands,
+                             outputformat='gpkg', session=session)
+    elapsed = time.time() - start
+    session.close()
+
+    captures = pipelines[0].completed
+    gaps = [capture.gap for capture in captures[1:]]
+    captured = sum(capture.seen for capture in captures)
+    print('%d points of %d epochs in %.2fs (%.0f epochs/s), session and '
+          'GeoPackage written by the capture thread'
+          % (len(captures), args.measuresnb, elapsed,
+             device.epochsequence / elapsed))
+    print('epochs read %d, captured %d (epochs #%d-#%d), max gap between '
+          'captures %d' % (device.epochsequence, captured, captures[0].first,
+                           captures[-1].last, max(gaps) if gaps else 0))
+    if max(gaps or [0]) or captured != captures[-1].last - captures[0].first + 1:
+        sys.exit('epochs lost between captures')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the fix smoothing filters of `pygpssurvey.kalman`: cost by
+    epoch of the pure Python and NumPy filters, and scatter of the raw and
+    smoothed positions of a static receiver with noisy fixes.
+
+    Usage: python benchmarks/bench_kalman.py [--epochs 20000] [--sigma 0.1]
+           [--processnoise 0.01]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import time
+import math
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.fix import Fix
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey.kalman import make_filter
+
+LON, LAT, ALT = 5.5538, 45.4788, 553.8
+
+
+def fixes(count, sigma):
+    '''Generate 1 Hz fixes of a static receiver with a horizontal error
+    of `sigma` meters.'''
+    random.seed(0)
+    plane = LocalTangentPlane(LON, LAT)
+    start = datetime.datetime(2018, 1, 1, 12)
+    for i in range(count):
+        noise = sigma / math.sqrt(2)
+        lon, lat = plane.to_lonlat(random.gauss(0, noise),
+                                   random.gauss(0, noise))
+        yield Fix(timestamp=(start + datetime.timedelta(seconds=i)).time(),
+                  lon=lon, lon_dir='E', lat=lat, lat_dir='N',
+                  alt=ALT + random.gauss(0, 2 * sigma), alt_units='M',
+                  quality=5, numsats=9, sigma=sigma)
+
+
+def scatter(fixes):
+    '''Horizontal RMS distance (meters) of fixes to the true position.'''
+    plane = LocalTangentPlane(LON, LAT)
+    total = 0.
+    for fix in fixes:
+        east, north = plane.to_local(fix.lon, fix.lat)
+        total += east * east + north * north
+    return math.sqrt(total / len(fixes))
+
+
+def jitter(fixes):
+    '''Horizontal RMS distance (meters) between successive fixes, the
+    jumps of the display.'''
+    plane = LocalTangentPlane(LON, LAT)
+    positions = [plane.to_local(fix.lon, fix.lat) for fix in fixes]
+    total = 0.
+    for (e1, n1), (e2, n2) in zip(positions, positions[1:]):
+        total += (e2 - e1) ** 2 + (n2 - n1) ** 2
+    return math.sqrt(total / (len(positions) - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--epochs', type=int, default=20000)
+    parser.add_argument('--sigma', type=float, default=0.1)
+    parser.add_argument('--processnoise', type=float, default=0.01)
+    args = parser.parse_args()
+
+    raw = list(fixes(args.epochs, args.sigma))
+    print('raw      scatter %.3f m, jitter %.3f m'
+          % (scatter(raw), jitter(raw)))
+    for backend in ('python', 'numpy'):
+        try:
+            smoother = make_filter(backend, processnoise=args.processnoise)
+        except ImportError:
+            print('%-8s not available' % backend)
+            continue
+        start = time.perf_counter()
+        smoothed = [smoother.update(fix) for fix in raw]
+        elapsed = time.perf_counter() - start
+        print('%-8s %.1f us/epoch, scatter %.3f m, jitter %.3f m'
+              % (backend, elapsed / args.epochs * 1e6, scatter(smoothed),
+                 jitter(smoothed)))
+
+
+if __name__ == '__main__':
+    main()
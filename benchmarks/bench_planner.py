@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the stake-out planner of `pygpssurvey.planner`: the points
+    of a generated grid (shuffled) and random points are ordered by nearest
+    neighbour then 2-opt, and the walking lengths of the file order, of the
+    nearest neighbour route and of the final route are reported.
+
+    Usage: python benchmarks/bench_planner.py [--points 10000]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey import planner
+
+
+def run(name, lons, lats):
+    plane = LocalTangentPlane(lons[0], lats[0])
+    xs, ys = [], []
+    for lon, lat in zip(lons, lats):
+        x, y = plane.to_local(lon, lat)
+        xs.append(x)
+        ys.append(y)
+    start = time.time()
+    tour = planner.nearest_neighbour_tour(xs, ys)
+    nearest = time.time() - start
+    nnlength = planner.path_length(xs, ys, tour)
+    planner.two_opt(xs, ys, tour)
+    elapsed = time.time() - start
+    if sorted(tour) != list(range(len(xs))) or tour[0] != 0:
+        sys.exit('%s: the route does not visit every point once' % name)
+    print('%-7s %d points: file order %.0f m, nearest neighbour %.0f m '
+          '(%.2fs), 2-opt %.0f m (%.2fs total)'
+          % (name, len(xs), planner.path_length(xs, ys, range(len(xs))),
+             nnlength, nearest, planner.path_length(xs, ys, tour), elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--points', type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    side = int(math.sqrt(args.points))
+    corners = [(5.5538, 45.4788), (5.5538 + side * 1.28e-5, 45.4788),
+               (5.5538, 45.4788 + side * 0.9e-5)]
+    points = planner.grid(corners, 1.)
+    random.shuffle(points)
+    run('grid', [point[2] for point in points], [point[3] for point in points])
+    run('random', [5.5538 + random.random() * 1e-3 for i in range(args.points)],
+        [45.4788 + random.random() * 1e-3 for i in range(args.points)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+    Regression and timing gates of the parsing and averaging path: the
+    recorded frames (rawoutput.txt) are replayed through `GPSSurvey` and
+    the point is compared to the golden one (output.txt), then a generated
+    survey is replayed with several read chunk sizes, its points compared
+    to the expected ones, and the time by epoch reported.
+
+    Exits with an error if a point differs, or if an epoch takes more than
+    the --gate time (default: the `EPOCH_BUDGET` of the tests, which run
+    the same gates on smaller surveys).
+
+    Usage: python benchmarks/bench_replay.py [--points 2000] [--gate 500]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+from pygpssurvey.device import GPSSurvey
+from tests import replay
+
+
+def check(name, output, golden):
+    errors = replay.compare_points(replay.read_points(io.StringIO(output)),
+                                   golden)
+    if errors:
+        sys.exit('%s: %s' % (name, '\n'.join(errors[:10])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--measuresnb', type=int, default=10)
+    parser.add_argument('--chunks', default='37,512,4096',
+                        help='Read chunk sizes, comma separated')
+    parser.add_argument('--gate', type=float, default=replay.EPOCH_BUDGET,
+                        help='Maximum time by epoch (microseconds), 0 to '
+                             'disable')
+    args = parser.parse_args()
+
+    recorded = replay.read_rawoutput(os.path.join(ROOT, 'rawoutput.txt'))
+    golden = replay.read_points(os.path.join(ROOT, 'output.txt'))
+    for chunk in (1, 37, 512):
+        output, raw, device = replay.replay(GPSSurvey, recorded, chunk)
+        check('recorded (chunk %d)' % chunk, output, golden)
+    print('recorded: %d points match output.txt' % len(golden))
+
+    survey, golden = replay.synthetic_survey(args.points, args.measuresnb)
+    epochs = args.points * args.measuresnb
+    slowest = 0.
+    for chunk in [int(chunk) for chunk in args.chunks.split(',')]:
+        start = time.perf_counter()
+        output, raw, device = replay.replay(GPSSurvey, survey, chunk)
+        elapsed = time.perf_counter() - start
+        check('synthetic (chunk %d)' % chunk, output, golden)
+        perepoch = elapsed / epochs * 1e6
+        slowest = max(slowest, perepoch)
+        print('synthetic: %d points, %d epochs, chunk %d: %.2fs '
+              '(%.1f us/epoch)' % (args.points, epochs, chunk, elapsed,
+                                   perepoch))
+    if args.gate and slowest > args.gate:
+        sys.exit('%.1f us/epoch, slower than the %.1f us gate'
+                 % (slowest, args.gate))
+
+
+if __name__ == '__main__':
+    main()
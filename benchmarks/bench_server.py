@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+'''
+    Load test of the live fixes server of `pygpssurvey.server`: fixes are
+    published at `--rate` Hz while `--clients` local clients (half
+    server-sent events, half WebSocket) receive them, then the delivery
+    latency (publish to receive) and the messages received are reported.
+
+    Usage: python benchmarks/bench_server.py [--clients 100] [--rate 20]
+           [--duration 10]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.fix import Fix
+from pygpssurvey.server import LiveServer, read_websocket_frame
+from pygpssurvey.commands import Commands
+
+
+async def sse_client(port, latencies, stop):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    writer.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+    while not stop.is_set():
+        line = await reader.readuntil(b'\n\n')
+        data = json.loads(line[6:])
+        latencies.append(time.time() - data['time'])
+    writer.close()
+
+
+async def websocket_client(port, latencies, stop):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write(('GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket'
+                  '\r\nConnection: Upgrade\r\nSec-WebSocket-Key: %s\r\n'
+                  'Sec-WebSocket-Version: 13\r\n\r\n' % key).encode('ascii'))
+    await reader.readuntil(b'\r\n\r\n')
+    while not stop.is_set():
+        opcode, payload = await read_websocket_frame(reader)
+        data = json.loads(payload)
+        latencies.append(time.time() - data['time'])
+    writer.close()
+
+
+async def capture(port):
+    reader, writer = await asyncio.open_connection('localhost', port)
+    writer.write(b'POST /capture HTTP/1.1\r\nContent-Length: 0\r\n\r\n')
+    status = await reader.readline()
+    writer.close()
+    return status
+
+
+async def clients(port, count, duration):
+    stop = asyncio.Event()
+    latencies = []
+    tasks = [asyncio.ensure_future((sse_client if i % 2 else websocket_client)
+                                   (port, latencies, stop))
+             for i in range(count)]
+    await asyncio.sleep(duration)
+    status = await capture(port)
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, status
+
+
+def publisher(server, rate, stop):
+    fix = Fix(lon=5.5538, lon_dir='E', lat=45.4788, lat_dir='N', alt=553.8,
+              alt_units='M', quality=4, numsats=12, hdop=0.8, sigma=0.012)
+    while not stop.is_set():
+        server.publish(fix)
+        time.sleep(1. / rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=20.)
+    parser.add_argument('--duration', type=float, default=10.)
+    args = parser.parse_args()
+
+    commands = Commands([])
+    server = LiveServer(port=0, commands=commands).start()
+    stop = threading.Event()
+    thread = threading.Thread(target=publisher,
+                              args=(server, args.rate, stop))
+    thread.start()
+    cpu = time.process_time()
+    latencies, status = asyncio.run(clients(server.port, args.clients,
+                                            args.duration))
+    cpu = time.process_time() - cpu
+    stop.set()
+    thread.join()
+    server.stop()
+
+    latencies.sort()
+    expected = args.clients * args.rate * args.duration
+    print('%d clients, %d fixes published, %d received (%.0f%% of %d)'
+          % (args.clients, server.published, len(latencies),
+             100. * len(latencies) / expected, expected))
+    if latencies:
+        print('latency p50 %.2f ms, p99 %.2f ms, max %.2f ms'
+              % (latencies[len(latencies) // 2] * 1e3,
+                 latencies[int(len(latencies) * 0.99)] * 1e3,
+                 latencies[-1] * 1e3))
+    print('CPU %.2f s (server and clients) for %.0f s, capture: %s, '
+          'queued command: %s' % (cpu, args.duration,
+                                  status.decode().strip(), commands.get()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the UBX NAV-PVT decoding against the NMEA GGA parsing of
+    the same epochs, from the received data to the `Fix` records.
+
+    Usage: python benchmarks/bench_ubx.py [--epochs 20000] [--chunk 1024]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import time
+import argparse
+import functools
+import operator
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.ubx import (ubx_frame, NAV, NAV_PVT, NAV_HPPOSLLH,
+                             NAV_PVT_STRUCT, NAV_HPPOSLLH_STRUCT)
+
+
+class NullLink(object):
+    '''Link never read, the data is fed to the device directly.'''
+    url = 'null'
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def nmea_checksum(body):
+    return functools.reduce(operator.xor, (ord(c) for c in body), 0)
+
+
+def epochs(count):
+    '''Generate (second, lon, lat, alt) of a slowly moving rover.'''
+    for i in range(count):
+        yield (i, 5.3323 + i * 1e-8, 45.2872 + i * 1e-8, 553.4 + (i % 7) * 0.01)
+
+
+def gga(second, lon, lat, alt):
+    hh, mm, ss = (second // 3600) % 24, (second // 60) % 60, second % 60
+    body = ('GPGGA,%02d%02d%02d.00,%02d%08.5f,N,%03d%08.5f,E,4,12,0.80,'
+            '%.1f,M,47.4,M,1.0,0000' % (hh, mm, ss, int(lat),
+                                        (lat % 1) * 60, int(lon),
+                                        (lon % 1) * 60, alt))
+    return '$%s*%02X\r\n' % (body, nmea_checksum(body))
+
+
+def ubx(second, lon, lat, alt, highprecision):
+    hh, mm, ss = (second // 3600) % 24, (second // 60) % 60, second % 60
+    itow = second * 1000
+    lon7, lat7 = int(lon * 1e7), int(lat * 1e7)
+    pvt = NAV_PVT_STRUCT.pack(itow, 2018, 4, 30, hh, mm, ss, 0x07, 20, 0,
+                              3, 0x83, 0, 12, lon7, lat7, int(alt * 1e3),
+                              int(alt * 1e3), 14, 20, 0, 0, 0, 0, 0, 0, 0,
+                              80, 0, 0, 0)
+    frames = ubx_frame(NAV, NAV_PVT, pvt)
+    if highprecision:
+        hp = NAV_HPPOSLLH_STRUCT.pack(0, 0, itow, lon7, lat7, int(alt * 1e3),
+                                      int(alt * 1e3), 3, -2, 0, 1, 140, 200)
+        frames += ubx_frame(NAV, NAV_HPPOSLLH, hp)
+    return frames
+
+
+def run(device, data, chunk):
+    '''Feed `data` by chunks and decode all the fixes.'''
+    fixes = 0
+    begin = time.perf_counter()
+    for i in range(0, len(data), chunk):
+        device.feedframes(data[i:i + chunk])
+        while device.frames:
+            if device.decodefix(device.frames.popleft()) is not None:
+                fixes += 1
+    return fixes, time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--epochs', default=20000, type=int)
+    parser.add_argument('--chunk', default=1024, type=int)
+    args = parser.parse_args()
+
+    nmea = ''.join(gga(*epoch) for epoch in epochs(args.epochs))
+    pvt = b''.join(ubx(*epoch, highprecision=False)
+                   for epoch in epochs(args.epochs))
+    pvthp = b''.join(ubx(*epoch, highprecision=True)
+                     for epoch in epochs(args.epochs))
+
+    results = (
+        ('NMEA GGA', run(GPSSurvey(NullLink()), nmea, args.chunk), len(nmea)),
+        ('UBX NAV-PVT', run(GPSSurvey(NullLink(), protocol='ubx'), pvt,
+                            args.chunk), len(pvt)),
+        ('UBX NAV-PVT+HPPOSLLH', run(GPSSurvey(NullLink(), protocol='ubx'),
+                                     pvthp, args.chunk), len(pvthp)),
+    )
+    for name, (fixes, elapsed), size in results:
+        print('%-22s %6d fixes %8d bytes %8.1f ms %6.2f us/fix'
+              % (name, fixes, size, elapsed * 1e3, elapsed * 1e6 / fixes))
+
+
+if __name__ == '__main__':
+    main()
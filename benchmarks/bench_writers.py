@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark of the points writers of `pygpssurvey.writers`: writes the
+    same points in CSV, GeoJSON and GeoPackage files, then queries the
+    GeoPackage R-tree spatial index.
+
+    Usage: python benchmarks/bench_writers.py [--points 1000000] [--dir /tmp]
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pygpssurvey.writers import make_writer, FORMATS
+
+
+def points(count):
+    '''Generate `count` points on a 1000 x 1000 grid of ~0.1 m cells.'''
+    for i in range(count):
+        yield (i + 1, 'P%d' % (i + 1), 5.33 + (i % 1000) * 1e-6, 'E',
+               45.28 + (i // 1000) * 1e-6, 'N', 550. + (i % 7) * 1e-3, 'M')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--dir', default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    for format in FORMATS:
+        filename = os.path.join(args.dir, 'bench_points.%s' % format)
+        if os.path.exists(filename):
+            os.remove(filename)
+        start = time.time()
+        writer = make_writer(filename, format)
+        writer.writemany(points(args.points))
+        writer.flush()
+        elapsed = time.time() - start
+        print('%-8s %d points in %.2fs (%.1f us/point), %.1f MB'
+              % (format, args.points, elapsed, elapsed / args.points * 1e6,
+                 os.path.getsize(filename) / 1e6))
+        if format == 'gpkg':
+            start = time.time()
+            found = writer.query(5.3301, 45.2801, 5.3302, 45.2802)
+            elapsed = time.time() - start
+            print('gpkg query: %d points in %.2fms'
+                  % (len(found), elapsed * 1e3))
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,7 +11,16 @@
 '''
 # Make sure the logger is configured early:
 from .logger import LOGGER, active_logger
-from .device import GPSSurvey
 
 VERSION = '0.1dev'
 __version__ = VERSION
+
+
+def __getattr__(name):
+    '''Import `GPSSurvey` on first use, so that importing the package (and
+    running the command-line script) does not load the board
+    dependencies.'''
+    if name == 'GPSSurvey':
+        from .device import GPSSurvey
+        return GPSSurvey
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -9,18 +9,16 @@
     :license: GNU GPL v3.
 
 '''
-import os
 import argparse
-import time
-import copy
-from datetime import datetime
 
 # Make sure the logger is configured early:
 from . import VERSION
 from .logger import active_logger
-from .device import GPSSurvey
 from .compat import stdout
 
+# The commands implementations (device, filters...) are imported when a
+# command is executed, so that the parser (--help, --version) starts fast.
+
 
 def setstdcmd(cmdtype, device):
     '''set standard command'''
@@ -30,14 +28,151 @@ def setstdcmd(cmdtype, device):
             stdout.write(("%s : " + fields[i]['valuefmt'] + "\n")%(fields[i]['name'],fields[i]['value']))
 
 
+def get_fixfilter(args):
+    '''Build the fix filter from the command-line arguments.'''
+    from .filters import FixFilter
+    if args.fixfilterconfig is not None:
+        return FixFilter.from_config(args.fixfilterconfig)
+    if args.fixfilter is not None:
+        return FixFilter.from_string(args.fixfilter)
+    return FixFilter.from_pointfixfilter(args.pointfixfilter)
+
+
+def get_smoother(args):
+    '''Make the guidance smoothing filter of the command arguments.'''
+    if not args.smooth:
+        return None
+    from .kalman import make_filter
+    return make_filter(processnoise=args.processnoise)
+
+
+def get_autocapture(args):
+    '''Make the automatic captures of the command arguments.'''
+    if args.auto is None:
+        return None
+    from .autocapture import AutoCapture
+    return AutoCapture.from_string(args.auto)
+
+
+def add_decimation_arguments(parser):
+    '''Add the decimation options to a subparser.'''
+    from .decimation import decimator_from_string
+    help = ('all, every:N (one fix every N), interval:SECONDS (average of '
+            'each interval) or change:METERS (fixes moved beyond METERS)')
+    parser.add_argument('--displaydecimation', default=None,
+                        type=decimator_from_string, metavar='DECIMATION',
+                        help='Decimation of the fixes displayed, only the '
+                             'fixes are displayed if given: ' + help)
+    parser.add_argument('--rawdecimation', default=None,
+                        type=decimator_from_string, metavar='DECIMATION',
+                        help='Decimation of the fixes of the points written '
+                             'to the raw output: ' + help + '; the averages '
+                             'are written as GGA sentences')
+    parser.add_argument('--trackdecimation', default=None,
+                        type=decimator_from_string, metavar='DECIMATION',
+                        help='Decimation of the fixes of the points stored '
+                             'in the --session: ' + help + '; the points are '
+                             'always averaged on all their fixes')
+
+
 def getpointsposition_cmd(args, device):
     '''Getpointsposition command.'''
-    device.getpointsposition(args.output, args.rawoutput, delim=args.delim, stdoutdisplay=args.stdoutdisplay, measuresnb=args.measuresnb, pointfixfilter=args.pointfixfilter, pointnamememory=args.pointnamememory)
+    device.getpointsposition(args.output, args.rawoutput, delim=args.delim, stdoutdisplay=args.stdoutdisplay, measuresnb=args.measuresnb, pointfixfilter=get_fixfilter(args), pointnamememory=args.pointnamememory, floatfmt=args.floatfmt, outputformat=args.format, session=args.sessionstore, commands=args.commandsqueue, window=args.window, ringsize=args.ringsize, autocapture=get_autocapture(args), displaydecimator=args.displaydecimation, rawdecimator=args.rawdecimation, trackdecimator=args.trackdecimation, quittimeout=args.quittimeout)
 
 
 def setpointsimplantation_cmd(args, device):
     '''Setpointsimplantation command.'''
-    device.setpointsimplantation(args.output, args.rawoutput, args.input, delim=args.delim, stdoutdisplay=args.stdoutdisplay, measuresnb=args.measuresnb, pointfixfilter=args.pointfixfilter, pointnamememory=args.pointnamememory, utmzoneletter=args.utmzoneletter, utmzonenumber=args.utmzonenumber)
+    device.setpointsimplantation(args.output, args.rawoutput, args.input, delim=args.delim, stdoutdisplay=args.stdoutdisplay, measuresnb=args.measuresnb, pointfixfilter=get_fixfilter(args), pointnamememory=args.pointnamememory, utmzoneletter=args.utmzoneletter, utmzonenumber=args.utmzonenumber, floatfmt=args.floatfmt, outputformat=args.format, session=args.sessionstore, smoother=get_smoother(args), commands=args.commandsqueue, window=args.window, ringsize=args.ringsize, autocapture=get_autocapture(args), reorder=args.reorder, displaydecimator=args.displaydecimation, rawdecimator=args.rawdecimation, trackdecimator=args.trackdecimation, quittimeout=args.quittimeout)
+
+
+def grid_cmd(args):
+    '''Grid command.'''
+    from .planner import grid, grid_rows
+    corners = []
+    for corner in args.corner:
+        try:
+            corners.append(tuple(float(value) for value in corner.split(',')))
+        except ValueError:
+            raise ValueError('Bad corner "%s", expected lon,lat[,alt]' % corner)
+    points = grid(corners, args.spacing, args.yspacing)
+    args.output.writelines(grid_rows(points, args.delim, args.floatfmt))
+    args.output.close()
+    stdout.write('%d points written\n' % len(points))
+
+
+def open_session(args):
+    '''Open the session database, recording the device and the command
+    settings.'''
+    from .session import Session
+    session = Session(args.session)
+    session.setdevice(url=args.url, protocol=args.protocol, version=VERSION)
+    session.setsettings(dict((key, value) for key, value in vars(args).items()
+                             if value is None or
+                             isinstance(value, (str, int, float, bool))))
+    return session
+
+
+def run_cmd(args):
+    '''Connect the device and execute the command.'''
+    from .device import GPSSurvey
+    from .commands import Commands
+    device = GPSSurvey.from_url(args.url, args.timeout, args.stalltimeout, protocol=args.protocol, opentimeout=args.opentimeout)
+    device.timings = args.timings
+    args.sessionstore = None
+    args.commandsqueue = None
+    try:
+        args.commandsqueue = Commands(args.commands)
+        args.commandsqueue.start()
+        if args.session is not None:
+            args.sessionstore = open_session(args)
+        if args.serve is not None:
+            host, _, port = args.serve.rpartition(':')
+            device.startserver(host or 'localhost', int(port), args.commandsqueue)
+        if args.corrections is not None:
+            device.startcorrections(args.corrections)
+        args.func(args, device)
+    finally:
+        if args.commandsqueue is not None:
+            args.commandsqueue.stop()
+        if args.sessionstore is not None:
+            args.sessionstore.close()
+        device.close()
+
+
+def run_profiled(args, run):
+    '''Run a command, under the --profile profiler if any, with the stage
+    timings.'''
+    from .profiling import Profiler, Timings, NULL_TIMINGS
+    if args.profile is None:
+        args.timings = NULL_TIMINGS
+        return run(args)
+    args.timings = Timings()
+    profiler = Profiler(args.profile, args.profiler, args.profileinterval)
+    profiler.start()
+    try:
+        run(args)
+    finally:
+        profiler.stop()
+        args.timings.save(args.profile + '.stages')
+
+
+def add_profile_arguments(parser):
+    '''Add the profiling options to a subparser.'''
+    parser.add_argument('--profile', action="store", default=None,
+                        metavar='FILE',
+                        help="Profile the command and write the profile to "
+                             "FILE, and the wall-clock timings of the "
+                             "acquisition stages (read, frame, parse, filter, "
+                             "project, write) to FILE.stages")
+    parser.add_argument('--profiler', action="store", default="cprofile",
+                        choices=('cprofile', 'sampling'),
+                        help="cprofile: deterministic profile written as a "
+                             "pstats file; sampling: stacks sampled by a "
+                             "thread, written as collapsed stacks for flame "
+                             "graphs (default: cprofile)")
+    parser.add_argument('--profileinterval', default=0.005, type=float,
+                        help="Sampling profiler interval in seconds "
+                             "(default: 0.005)")
 
 
 def get_cmd_parser(cmd, subparsers, help, func):
@@ -45,6 +180,39 @@ def get_cmd_parser(cmd, subparsers, help, func):
     parser = subparsers.add_parser(cmd, help=help, description=help)
     parser.add_argument('--timeout', default=10.0, type=float,
                         help="Connection link timeout")
+    parser.add_argument('--stalltimeout', default=30.0, type=float,
+                        help="Reconnect the link after this number of seconds "
+                             "without data, 0 to disable (default: 30)")
+    parser.add_argument('--opentimeout', default=10.0, type=float,
+                        help="Give up opening the connection link after "
+                             "this number of seconds (default: 10)")
+    parser.add_argument('--protocol', action="store", default="nmea",
+                        choices=('nmea', 'ubx'),
+                        help='Protocol of the frames sent by the board: NMEA '
+                             'text or u-blox UBX binary NAV-PVT/NAV-HPPOSLLH '
+                             '(default: nmea)')
+    parser.add_argument('--corrections', action="store", default=None,
+                        help="RTCM3 corrections forwarded to the board, "
+                             "read from a PyLink URL (e.g. tcp:basehost:2101) "
+                             "or a file")
+    parser.add_argument('--session', action="store", default=None,
+                        help="SQLite database where the points, their epochs, "
+                             "the device information and the settings are "
+                             "also stored (appended if it exists)")
+    parser.add_argument('--commands', action="append", default=None,
+                        metavar='SOURCE',
+                        help="Source of the interactive commands, can be "
+                             "repeated: keyboard, stdin, file:<path> (e.g. a "
+                             "named pipe), unix:<path> or tcp:<host>:<port> "
+                             "(listening socket), script:<keys> (e.g. "
+                             "\"M 2.5 N M Q\", numbers are seconds to wait) "
+                             "(default: keyboard)")
+    parser.add_argument('--serve', action="store", default=None,
+                        metavar='[HOST:]PORT',
+                        help="Publish the live fixes on a local HTTP server: "
+                             "/fix, /stats, /events (server-sent events), "
+                             "/ws (WebSocket), POST /capture and /undo")
+    add_profile_arguments(parser)
     parser.add_argument('--debug', action="store_true", default=False,
                         help='Display log')
     parser.add_argument('url', action="store",
@@ -79,16 +247,35 @@ def main():
                            help='Filename where raw NMEA frames of GPS points to locate are written (default: "rawoutput.txt"')
     subparser.add_argument('--delim', action="store", default=";",
                            help='CSV char delimiter (default: ";"')
+    subparser.add_argument('--floatfmt', action="store", default="%.12g",
+                           help='Format of the coordinates written (default: "%%.12g")')
+    subparser.add_argument('--format', action="store", default="csv",
+                           choices=('csv', 'geojson', 'gpkg'),
+                           help='Format of the points output: CSV, newline-delimited GeoJSON or GeoPackage (default: "csv")')
     subparser.add_argument('--stdoutdisplay', action="store_true", default=False,
                            help='Display on the standard out if defined output is a file')
     subparser.add_argument('--measuresnb', default=10, type=int,
                         help="Number of measurements to do obtain a mean point")
+    subparser.add_argument('--window', default=None, type=float,
+                           help='Capture the points at once from the fixes of the last WINDOW seconds already received, instead of the next --measuresnb ones')
+    subparser.add_argument('--ringsize', default=1024, type=int,
+                           help='Number of the last fixes kept for the --window captures (default: 1024)')
+    add_decimation_arguments(subparser)
+    subparser.add_argument('--quittimeout', default=30., type=float,
+                           help='After Q, wait at most QUITTIMEOUT seconds for the point captures in progress, Q again to quit at once (default: 30)')
+    subparser.add_argument('--auto', action="store", default=None,
+                           help='Capture the points automatically, e.g. "stationary=5" (after 5 s without moving) or "distance=10;interval=30" (every 10 m or 30 s while moving), tuned with maxspeed (m/s), maxspread (m) and smoothing (s); the points are written with their averaging statistics')
     subparser.add_argument('--dir', action="store", default="",
                            help='Directory where output is written (default: ""')
     subparser.add_argument('--pointfixfilter', action="store_true", default=False,
                            help='Do not add the point located in Fix GPS (Fix Qualification = 1) ')
     subparser.add_argument('--pointnamememory', action="store_true", default=False,
                            help='Memorise a specified point name')
+    subparser.add_argument('--fixfilter', action="store", default=None,
+                           help='Fix filter rules, e.g. "quality=4,5;minsats=8,5:12;maxhdop=2;maxdiffage=10;maxgstsigma=0.05" (overrides --pointfixfilter)')
+    subparser.add_argument('--fixfilterconfig', action='store', default=None,
+                           type=argparse.FileType('r'),
+                           help='Configuration file with the fix filter rules in a [fixfilter] section (overrides --fixfilter)')
         
     # setpointsimplantation command
     subparser = get_cmd_parser('setpointsimplantation', subparsers,
@@ -105,20 +292,67 @@ def main():
                            help='Filename where raw NMEA frames of GPS points to locate are written (default: "rawoutput.txt"')
     subparser.add_argument('--delim', action="store", default=";",
                            help='CSV char delimiter (default: ";"')
+    subparser.add_argument('--floatfmt', action="store", default="%.12g",
+                           help='Format of the coordinates written (default: "%%.12g")')
+    subparser.add_argument('--format', action="store", default="csv",
+                           choices=('csv', 'geojson', 'gpkg'),
+                           help='Format of the points output: CSV, newline-delimited GeoJSON or GeoPackage (default: "csv")')
     subparser.add_argument('--stdoutdisplay', action="store_true", default=False,
                            help='Display on the standard out if defined output is a file')
     subparser.add_argument('--measuresnb', default=10, type=int,
                         help="Number of measurements to do obtain a mean point")
+    subparser.add_argument('--window', default=None, type=float,
+                           help='Capture the points at once from the fixes of the last WINDOW seconds already received, instead of the next --measuresnb ones')
+    subparser.add_argument('--ringsize', default=1024, type=int,
+                           help='Number of the last fixes kept for the --window captures (default: 1024)')
+    add_decimation_arguments(subparser)
+    subparser.add_argument('--quittimeout', default=30., type=float,
+                           help='After Q, wait at most QUITTIMEOUT seconds for the point captures in progress, Q again to quit at once (default: 30)')
+    subparser.add_argument('--auto', action="store", default=None,
+                           help='Capture the points automatically, e.g. "stationary=5" (after 5 s without moving) or "distance=10;interval=30" (every 10 m or 30 s while moving), tuned with maxspeed (m/s), maxspread (m) and smoothing (s); the points are written with their averaging statistics')
     subparser.add_argument('--dir', action="store", default="",
                            help='Directory where output is written (default: ""')
     subparser.add_argument('--pointfixfilter', action="store_true", default=False,
                            help='Do not add the point located in Fix GPS (Fix Qualification = 1) ')
     subparser.add_argument('--pointnamememory', action="store_true", default=False,
                            help='Memorise a specified point name')
+    subparser.add_argument('--fixfilter', action="store", default=None,
+                           help='Fix filter rules, e.g. "quality=4,5;minsats=8,5:12;maxhdop=2;maxdiffage=10;maxgstsigma=0.05" (overrides --pointfixfilter)')
+    subparser.add_argument('--fixfilterconfig', action='store', default=None,
+                           type=argparse.FileType('r'),
+                           help='Configuration file with the fix filter rules in a [fixfilter] section (overrides --fixfilter)')
     subparser.add_argument('--utmzoneletter', action="store", default=None,
                            help='UTM zone letter')
     subparser.add_argument('--utmzonenumber', default=0, type=int,
                            help='UTM zone number')
+    subparser.add_argument('--smooth', action="store_true", default=False,
+                           help='Smooth the guidance display with a constant-velocity Kalman filter')
+    subparser.add_argument('--processnoise', default=0.01, type=float,
+                           help='Process noise (m2/s3) of the --smooth filter: the lower, the smoother and the slower to follow the movements (default: 0.01)')
+    subparser.add_argument('--reorder', action="store_true", default=False,
+                           help='Stake out the points in a short walking order (nearest neighbour and 2-opt route from the first point) instead of the file order')
+
+    # grid command (no device)
+    subparser = subparsers.add_parser('grid', help='Generate a grid of points to implant.',
+                                      description='Generate a regular grid of points to implant from its corners, written as an --input file of setpointsimplantation.')
+    subparser.add_argument('output', action='store',
+                           type=argparse.FileType('w'),
+                           help='Filename where the grid points are written')
+    subparser.add_argument('--corner', action='append', required=True,
+                           metavar='LON,LAT[,ALT]',
+                           help='Corner of the grid (degrees), given 3 times (parallelogram: first corner, end of the first row, end of the first column) or 4 times (quadrilateral, in order around it)')
+    subparser.add_argument('--spacing', default=1., type=float,
+                           help='Distance (m) between the columns (default: 1)')
+    subparser.add_argument('--yspacing', default=None, type=float,
+                           help='Distance (m) between the rows (default: --spacing)')
+    subparser.add_argument('--delim', action="store", default=";",
+                           help='CSV char delimiter (default: ";"')
+    subparser.add_argument('--floatfmt', action="store", default="%.12g",
+                           help='Format of the coordinates written (default: "%%.12g")')
+    subparser.add_argument('--debug', action="store_true", default=False,
+                           help='Display log')
+    add_profile_arguments(subparser)
+    subparser.set_defaults(func=grid_cmd, nodevice=True)
         
     # Parse argv arguments
     try:
@@ -130,14 +364,13 @@ def main():
             isfunc = False
 
         if (isfunc == True):
+            run = args.func if getattr(args, 'nodevice', False) else run_cmd
             if args.debug:
                 active_logger()
-                device = GPSSurvey.from_url(args.url, args.timeout)
-                args.func(args, device)
+                run_profiled(args, run)
             else:
                 try:                
-                    device = GPSSurvey.from_url(args.url, args.timeout)
-                    args.func(args, device)
+                    run_profiled(args, run)
                 except Exception as e:
                     parser.error('%s' % e)
         else:
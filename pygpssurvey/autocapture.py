@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.autocapture
+    -----------------------
+
+    Automatic point captures, for profiles and grids: a point is captured
+    when the rover has been stationary for some seconds (stop-and-go), or
+    every some meters or seconds while it moves (continuous kinematic).
+
+    The motion is detected with incremental statistics updated on each fix
+    in a few float operations: a smoothed velocity vector, and the running
+    mean and spread of the positions of the current stop.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+
+from .geodesy import LocalTangentPlane
+from .compat import OrderedDict
+
+#: Triggers of the automatic captures.
+STATIONARY = 'stationary'
+DISTANCE = 'distance'
+INTERVAL = 'interval'
+
+
+class RunningStats(object):
+    '''Running mean and variance of a value (Welford's algorithm).'''
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class AutoCapture(object):
+    ''' Decides the automatic captures from the stream of fixes.
+
+    The velocity is an exponential average of the velocity vectors between
+    consecutive fixes (averaging the vectors, not the speeds, cancels the
+    position noise). The rover is stationary while this speed stays below
+    `maxspeed` and the fixes stay within `maxspread` of the mean position of
+    the stop.
+
+    :param stationary: Capture a point after `stationary` seconds without
+        moving, once by stop (default: None, no stop-and-go capture).
+    :param distance: Capture a point every `distance` meters while moving
+        (default: None).
+    :param interval: Capture a point every `interval` seconds while moving
+        (default: None).
+    :param maxspeed: Speed (m/s) above which the rover moves.
+    :param maxspread: Distance (m) to the mean position of the stop above
+        which the rover moves.
+    :param smoothing: Time constant (seconds) of the velocity average.
+    :param maxgap: Seconds without fix after which the motion is
+        unknown again.
+    '''
+
+    def __init__(self, stationary=None, distance=None, interval=None,
+                 maxspeed=0.1, maxspread=0.1, smoothing=1., maxgap=2.):
+        if stationary is None and distance is None and interval is None:
+            raise ValueError('No automatic capture trigger')
+        self.stationary = stationary
+        self.distance = distance
+        self.interval = interval
+        self.maxspeed = maxspeed
+        self.maxspread = maxspread
+        self.smoothing = smoothing
+        self.maxgap = maxgap
+        self.east = RunningStats()      # positions of the current stop
+        self.north = RunningStats()
+        self.plane = None
+        self.captured = None    # (time, east, north) of the last capture
+        self.candidate = None   # (trigger, time, east, north) to confirm
+        self.reset()
+
+    def reset(self):
+        '''Forget the motion (after a gap in the fixes).'''
+        self.last = None        # (time, east, north) of the last fix
+        self.veast = self.vnorth = 0.
+        self.stopstart = None   # time of the first fix of the current stop
+        self.stopcaptured = False
+        self.east.reset()
+        self.north.reset()
+
+    @property
+    def speed(self):
+        '''Smoothed speed (m/s).'''
+        return math.hypot(self.veast, self.vnorth)
+
+    def moving(self):
+        '''True unless the rover is in a stop.'''
+        return self.stopstart is None
+
+    def update(self, fix, received):
+        ''' Update the motion with a fix.
+
+        :param fix: A `Fix` with a position.
+        :param received: Its reception time.
+        :return: None, or the (trigger, seconds) of a capture: the point is
+            the average of the fixes of the last `seconds` (0 for the last
+            fix only); call `confirm` once it is captured, else it is tried
+            again on the next fix.
+        '''
+        self.candidate = None
+        if self.plane is None:
+            self.plane = LocalTangentPlane(fix.lon, fix.lat)
+        east, north = self.plane.to_local(fix.lon, fix.lat)
+        if self.captured is None:
+            self.captured = (received, east, north)
+        last = self.last
+        self.last = (received, east, north)
+        if last is None:
+            return None
+        dt = received - last[0]
+        if dt <= 0:
+            return None
+        if dt > self.maxgap:
+            self.reset()
+            self.last = (received, east, north)
+            return None
+        alpha = min(1., dt / self.smoothing)
+        self.veast += alpha * ((east - last[1]) / dt - self.veast)
+        self.vnorth += alpha * ((north - last[2]) / dt - self.vnorth)
+
+        still = self.speed <= self.maxspeed
+        if still and self.stopstart is not None and self.east.count:
+            still = (math.hypot(east - self.east.mean,
+                                north - self.north.mean) <= self.maxspread)
+        if not still:
+            if self.stopstart is not None:
+                self.stopstart = None
+                self.stopcaptured = False
+                self.east.reset()
+                self.north.reset()
+        else:
+            if self.stopstart is None:
+                self.stopstart = received
+            self.east.add(east)
+            self.north.add(north)
+            if (self.stationary is not None and not self.stopcaptured and
+                    received - self.stopstart >= self.stationary):
+                return self.capture(STATIONARY, received - self.stopstart,
+                                    received, east, north)
+            return None
+
+        captured = self.captured
+        if (self.distance is not None and
+                math.hypot(east - captured[1], north - captured[2]) >=
+                self.distance):
+            return self.capture(DISTANCE, 0., received, east, north)
+        if (self.interval is not None and
+                received - captured[0] >= self.interval):
+            return self.capture(INTERVAL, 0., received, east, north)
+        return None
+
+    def capture(self, trigger, seconds, received, east, north):
+        self.candidate = (trigger, received, east, north)
+        return trigger, seconds
+
+    def confirm(self):
+        '''Account for the capture returned by the last `update`, the next
+        ones being measured from it.'''
+        if self.candidate is None:
+            return
+        trigger, received, east, north = self.candidate
+        self.candidate = None
+        self.captured = (received, east, north)
+        if trigger == STATIONARY:
+            self.stopcaptured = True
+
+    @classmethod
+    def from_string(cls, spec):
+        ''' Build from a command-line specification.
+
+        :param spec: Settings separated by ";", e.g. "stationary=5" or
+            "distance=10;interval=30;maxspeed=0.2".
+        '''
+        settings = OrderedDict()
+        for item in spec.split(';'):
+            if not item.strip():
+                continue
+            key, sep, value = item.partition('=')
+            key = key.strip().lower()
+            if not sep or key not in ('stationary', 'distance', 'interval',
+                                      'maxspeed', 'maxspread', 'smoothing',
+                                      'maxgap'):
+                raise ValueError('Bad automatic capture setting "%s"'
+                                 % item.strip())
+            settings[key] = float(value)
+        return cls(**settings)
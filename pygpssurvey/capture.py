@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.capture
+    -------------------
+
+    Point captures overlapped with the acquisition: the reading loop only
+    hands the fixes to the capture in progress, the averaging and the
+    writing of the captured points are done by a worker thread, and the
+    next queued capture starts on the next epoch.
+
+    Each fix read gets a sequence number, the captures record the range of
+    epochs they saw, so that the epochs between two captures are counted.
+
+    The last epochs are also kept in an `EpochRing`: with a `window`, a
+    point is captured at once from the epochs of the last `window` seconds
+    already received, without waiting for new ones (retroactive capture).
+    `undo` cancels the last capture, or removes the last point written.
+
+    With an `AutoCapture`, the points are also captured automatically when
+    the rover stops or moves, and written with their averaging statistics
+    (`AUTO_POINT_KEYS`).
+
+    The fixes of the points written to the raw output and to the session
+    can be decimated; the points are averaged on all their fixes.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import time
+import threading
+from collections import deque
+from queue import Queue
+
+from .logger import LOGGER
+from .compat import stdout
+from .ringbuffer import EpochRing
+from .writers import POINT_KEYS
+from .geodesy import LocalTangentPlane
+from .autocapture import RunningStats
+from .profiling import NULL_TIMINGS
+
+#: Queued to the worker with a capture, to remove its point.
+UNDO = 'undo'
+
+#: Averaging statistics of the points: number of fixes averaged, seconds
+#: between the first and the last, standard deviations (meters) and what
+#: triggered the capture ("key", "stationary", "distance" or "interval").
+STATS_KEYS = ('epochs', 'duration', 'sdeast', 'sdnorth', 'sdalt', 'trigger')
+
+#: Columns of the points output with their statistics.
+AUTO_POINT_KEYS = POINT_KEYS + STATS_KEYS
+
+
+class Capture(object):
+    ''' A point occupation: the fixes accepted from its first epoch until
+    `measuresnb` are collected.
+
+    :param pointnum: Number of the point.
+    :param pointname: Name of the point.
+    :param measuresnb: Number of accepted fixes averaged.
+    :param trigger: What triggered the capture (default: "key").
+    '''
+
+    def __init__(self, pointnum, pointname, measuresnb, trigger='key'):
+        self.pointnum = pointnum
+        self.pointname = pointname
+        self.measuresnb = measuresnb
+        self.trigger = trigger
+        self.fixes = []
+        # running statistics of the accepted positions
+        self.lon = RunningStats()
+        self.lat = RunningStats()
+        self.alt = RunningStats()
+        self.times = []     # reception times of the fixes
+        self.first = None   # sequence numbers of the first and last epochs
+        self.last = None
+        self.seen = 0       # epochs seen, accepted or not
+        self.gap = None     # epochs since the previous capture
+        self.rawoffset = None   # where its raw fixes were written
+        self.sessionid = None
+
+    @property
+    def done(self):
+        return len(self.fixes) >= self.measuresnb
+
+    def add(self, sequence, fix, accepted, received=None):
+        '''Account an epoch, keeping its fix if `accepted`.'''
+        if self.first is None:
+            self.first = sequence
+        self.last = sequence
+        self.seen += 1
+        if accepted:
+            self.fixes.append(fix)
+            self.times.append(time.time() if received is None else received)
+            self.lon.add(fix.lon)
+            self.lat.add(fix.lat)
+            self.alt.add(fix.alt or 0.)
+
+    def mean(self):
+        ''' Average position of the fixes.
+
+        :return: (lon, lon_dir, lat, lat_dir, alt, alt_units).
+        '''
+        lastfix = self.fixes[-1]
+        return (self.lon.mean, lastfix.lon_dir, self.lat.mean,
+                lastfix.lat_dir, self.alt.mean, lastfix.alt_units)
+
+    def stats(self):
+        ''' Averaging statistics of the fixes.
+
+        :return: The values of `STATS_KEYS`.
+        '''
+        plane = LocalTangentPlane(self.lon.mean, self.lat.mean)
+        return (len(self.fixes), self.times[-1] - self.times[0],
+                self.lon.std * plane.xscale, self.lat.std * plane.yscale,
+                self.alt.std, self.trigger)
+
+    def values(self, point=None):
+        '''The point and its statistics, as a dict of `AUTO_POINT_KEYS`.'''
+        point = (self.pointnum, self.pointname) + (point or self.mean())
+        return dict(zip(AUTO_POINT_KEYS, point + self.stats()))
+
+    def __repr__(self):
+        return ('<Capture %s epochs #%s-#%s %d/%d accepted, gap %s>'
+                % (self.pointnum, self.first, self.last, len(self.fixes),
+                   self.seen, self.gap))
+
+
+class CapturePipeline(object):
+    ''' Queue of point captures fed by the reading loop.
+
+    `request` queues a capture, `feed` gives each epoch to the capture in
+    progress (a few appends, the reading is never paused), and the
+    completed captures are averaged and written by a worker thread: raw
+    fixes, point row, session.
+
+    :param pointwriter: The `writers.PointWriter` of the points.
+    :param rawoutput: File object where the raw fixes of the points are
+        written.
+    :param fixfilter: The `FixFilter` of the captured fixes.
+    :param measuresnb: Number of fixes averaged by point.
+    :param session: A `Session` where the points are also stored.
+    :param stdoutdisplay: Display the captures progress.
+    :param window: Capture the points from the epochs of the last `window`
+        seconds (default: None, from the next `measuresnb` epochs).
+    :param ringsize: Number of epochs kept for the retroactive captures.
+    :param autocapture: An `AutoCapture` deciding the automatic captures.
+    :param timings: The `profiling.Timings` of the filter and write stages.
+    :param rawdecimator: The `decimation.Decimator` of the fixes written to
+        the raw output (default: None, all of them).
+    :param trackdecimator: The `decimation.Decimator` of the fixes stored
+        in the session (default: None, all of them).
+    '''
+
+    def __init__(self, pointwriter, rawoutput, fixfilter, measuresnb=10,
+                 session=None, stdoutdisplay=False, window=None,
+                 ringsize=1024, autocapture=None, timings=NULL_TIMINGS,
+                 rawdecimator=None, trackdecimator=None):
+        self.pointwriter = pointwriter
+        self.rawoutput = rawoutput
+        self.fixfilter = fixfilter
+        self.measuresnb = measuresnb
+        self.session = session
+        self.stdoutdisplay = stdoutdisplay
+        self.window = window
+        self.ring = EpochRing(ringsize)
+        self.autocapture = autocapture
+        self.timings = timings
+        self.rawdecimator = rawdecimator
+        self.trackdecimator = trackdecimator
+        self.pending = deque()
+        self.active = None
+        self.lastsequence = None    # last epoch of the previous capture
+        self.submitted = []     # captures queued to the worker, not undone
+        self.completed = []
+        self.quitting = None    # time of the quit command
+        self.queue = Queue()
+        self.worker = threading.Thread(target=self.run, name='capture')
+        self.worker.daemon = True
+        self.worker.start()
+
+    def request(self, pointnum, pointname=''):
+        ''' Capture a point: at once from the epochs of the last `window`
+        seconds, else queued and started on the next epoch.'''
+        if self.window:
+            capture = self.retroactive(pointnum, pointname, self.window)
+            if capture is not None:
+                return capture
+            LOGGER.info('point %s: no fix accepted in the last %ss, captured '
+                        'from the next epochs' % (pointnum, self.window))
+        capture = Capture(pointnum, pointname, self.measuresnb)
+        self.pending.append(capture)
+        return capture
+
+    def retroactive(self, pointnum, pointname, seconds, trigger='key'):
+        ''' Capture a point from the epochs of the last `seconds` kept in the
+        ring (the last epoch if `seconds` is 0), in O(window).
+
+        :return: The capture, queued to the worker, or None if none of the
+            epochs is accepted.
+        '''
+        capture = Capture(pointnum, pointname, 1, trigger)
+        accept = self.fixfilter.accept
+        with self.timings.filter:
+            for sequence, received, fix in (self.ring.window(seconds)
+                                            if seconds else self.ring.last(1)):
+                capture.add(sequence, fix, accept(fix), received)
+        if not capture.done:
+            return None
+        if self.stdoutdisplay:
+            stdout.write('saving mean point position %s of the last %.1fs '
+                         '(%s)\n' % (pointnum, seconds, trigger))
+        self.complete(capture)
+        return capture
+
+    def trigger(self, pointnum, pointname, trigger):
+        ''' Capture a point automatically, unless key captures are in
+        progress.
+
+        :param trigger: The (trigger, seconds) given by `feed`.
+        :return: The capture, or None if no point is captured (the trigger
+            is then given again by the next epochs).
+        '''
+        if self.busy():
+            return None
+        capture = self.retroactive(pointnum, pointname, trigger[1], trigger[0])
+        if capture is not None and self.autocapture is not None:
+            self.autocapture.confirm()
+        return capture
+
+    def undo(self):
+        ''' Cancel the last capture requested, or remove the last point
+        written (by the worker, after the points queued before).
+
+        :return: The capture undone, None if there is none or if its point
+            cannot be removed from the points output (e.g. a CSV written to
+            a pipe).
+        '''
+        if self.pending:
+            capture = self.pending.pop()
+        elif self.active is not None:
+            capture, self.active = self.active, None
+        elif self.submitted:
+            if not self.pointwriter.canundo():
+                capture = self.submitted[-1]
+                LOGGER.warning('point %s cannot be removed from the points '
+                               'output, not deleted' % capture.pointnum)
+                if self.stdoutdisplay:
+                    stdout.write('point %s cannot be deleted\n'
+                                 % capture.pointnum)
+                return None
+            capture = self.submitted.pop()
+            self.queue.put((UNDO, capture))
+        else:
+            return None
+        if self.stdoutdisplay:
+            stdout.write('delete point %s\n' % capture.pointnum)
+        return capture
+
+    def busy(self):
+        '''True while captures are in progress or queued.'''
+        return self.active is not None or bool(self.pending)
+
+    def waiting(self, timeout=None):
+        ''' Check if the acquisition must go on after the quit command, to
+        complete the captures in progress: while they are busy, for at most
+        `timeout` seconds (None: no limit) after the first call.'''
+        if not self.busy():
+            return False
+        now = time.time()
+        if self.quitting is None:
+            self.quitting = now
+            if self.stdoutdisplay:
+                stdout.write('completing the captures in progress before '
+                             'quitting, Q again to quit now\n')
+        return timeout is None or now - self.quitting < timeout
+
+    def feed(self, sequence, fix):
+        ''' Keep an epoch in the ring, and give it to the capture in
+        progress.
+
+        :param sequence: Sequence number of the epoch.
+        :param fix: Its `Fix`.
+        :return: The (trigger, seconds) of an automatic capture to do with
+            `trigger`, or None.
+        '''
+        received = time.time()
+        self.ring.append(sequence, fix, received)
+        if self.active is not None or self.pending:
+            if self.active is None:
+                self.start(self.pending.popleft(), sequence)
+            capture = self.active
+            with self.timings.filter:
+                accepted = self.fixfilter.accept(fix)
+            capture.add(sequence, fix, accepted, received)
+            if capture.done:
+                self.active = None
+                self.complete(capture)
+        if self.autocapture is not None and fix.quality:
+            return self.autocapture.update(fix, received)
+        return None
+
+    def start(self, capture, sequence):
+        self.gap(capture, sequence)
+        self.active = capture
+        if self.stdoutdisplay:
+            stdout.write('begin saving mean point position %s\n'
+                         % capture.pointnum)
+
+    def gap(self, capture, sequence):
+        '''Set the epochs between the previous capture and a capture
+        starting at `sequence` (negative if they overlap).'''
+        if self.lastsequence is not None:
+            capture.gap = sequence - self.lastsequence - 1
+
+    def complete(self, capture):
+        '''Queue a completed capture to the worker.'''
+        if capture.gap is None:
+            self.gap(capture, capture.first)
+        self.lastsequence = capture.last
+        self.submitted.append(capture)
+        self.queue.put(capture)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if isinstance(item, tuple):     # (UNDO, capture)
+                    capture = item[1]
+                    self.remove(capture)
+                else:
+                    capture = item
+                    with self.timings.write:
+                        self.write(capture)
+            except Exception as e:
+                LOGGER.error('Point %s not written or removed: %s'
+                             % (capture.pointnum, e))
+            finally:
+                self.queue.task_done()
+
+    def write(self, capture):
+        '''Average and write a completed capture (worker thread).'''
+        point = capture.mean()
+        capture.rawoffset = self.rawoffset()
+        self.rawoutput.write('%s\n' % capture.pointnum)
+        self.rawoutput.write(''.join(
+            '%s\n' % fix for fix, received in self.decimate(
+                self.rawdecimator, capture)))
+        if len(self.pointwriter.keys) > len(POINT_KEYS):
+            self.pointwriter.write(capture.values(point))
+        else:
+            self.pointwriter.write((capture.pointnum, capture.pointname)
+                                   + point)
+        self.pointwriter.flush()
+        if self.session is not None:
+            capture.sessionid = self.session.beginpoint(capture.pointnum,
+                                                        capture.pointname)
+            for fix, received in self.decimate(self.trackdecimator, capture):
+                self.session.addepoch(fix, received)
+            self.session.endpoint(*point)
+        self.completed.append(capture)
+        LOGGER.info('point %s: epochs #%s-#%s, %d accepted of %d, %s epochs '
+                    'since the previous point'
+                    % (capture.pointnum, capture.first, capture.last,
+                       len(capture.fixes), capture.seen,
+                       '-' if capture.gap is None else capture.gap))
+        if self.stdoutdisplay:
+            stdout.write('end saving mean point position %s\n'
+                         % capture.pointnum)
+
+    def decimate(self, decimator, capture):
+        '''The (fix, reception time) of a capture kept by a decimator.'''
+        if decimator is None:
+            return zip(capture.fixes, capture.times)
+        return decimator.decimate(capture.fixes, capture.times)
+
+    def rawoffset(self):
+        try:
+            if self.rawoutput.seekable():
+                self.rawoutput.flush()
+                return self.rawoutput.tell()
+        except (AttributeError, ValueError):
+            pass
+        return None
+
+    def remove(self, capture):
+        '''Remove the last point written (worker thread).'''
+        if not self.completed or self.completed[-1] is not capture:
+            LOGGER.error('point %s not written, not removed'
+                         % capture.pointnum)
+            return
+        if not self.pointwriter.undo():
+            # the raw fixes and the session are kept with the point row
+            LOGGER.error('point %s not removed from the points output'
+                         % capture.pointnum)
+            return
+        self.completed.pop()
+        if capture.rawoffset is not None:
+            self.rawoutput.seek(capture.rawoffset)
+            self.rawoutput.truncate()
+        if self.session is not None and capture.sessionid is not None:
+            self.session.deletepoint(capture.sessionid)
+        LOGGER.info('point %s removed' % capture.pointnum)
+
+    def close(self):
+        '''Write the completed captures and stop the worker; the captures
+        not completed are dropped.'''
+        for capture in ([self.active] if self.active else []) + list(
+                self.pending):
+            LOGGER.warning('point %s capture not completed (%d fixes), '
+                           'dropped' % (capture.pointnum, len(capture.fixes)))
+            if self.stdoutdisplay:
+                stdout.write('point %s not saved\n' % capture.pointnum)
+        self.active = None
+        self.pending.clear()
+        self.queue.put(None)
+        self.worker.join()
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.commands
+    --------------------
+
+    Interactive commands input. The keys (M, D, P, N, F, L, Q...) are read
+    by background threads, from the keyboard (Windows console or POSIX
+    terminal), from a pipe or file, from a local socket, or from a script,
+    and queued as events for the acquisition loop, which only checks the
+    queue between two frame reads.
+
+    A source is given by a string:
+
+    - ``keyboard``: the Windows console or the terminal of stdin;
+    - ``stdin`` or ``file:<path>``: every non-blank char read is a key, e.g.
+      from a named pipe;
+    - ``unix:<path>`` or ``tcp:<host>:<port>``: a listening socket, every
+      non-blank char received from its clients is a key;
+    - ``script:<keys>``: the keys of the script, separated by numbers of
+      seconds to wait, e.g. ``script:M 2.5 N M Q``.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import os
+import sys
+import time
+import socket
+import threading
+import selectors
+from queue import Queue, Empty
+
+from .logger import LOGGER
+from .utils import LazyModule
+
+# Loaded on first use (msvcrt only exists on Windows)
+msvcrt = LazyModule('msvcrt')
+
+
+class CommandSource(threading.Thread):
+    '''Base class of the threads reading commands into a queue.
+
+    :param name: Name of the source, in the logs.
+    '''
+
+    def __init__(self, name):
+        threading.Thread.__init__(self, name='commands-%s' % name)
+        self.daemon = True
+        self.queue = None
+        self.stopped = threading.Event()
+
+    def push(self, data):
+        '''Queue the keys of received data (blank chars are ignored).'''
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        for key in data:
+            if not key.isspace():
+                self.queue.put(key)
+
+    def stop(self, timeout=1.):
+        '''Stop reading and wait for the thread end.'''
+        self.stopped.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
+
+
+class SelectorSource(CommandSource):
+    '''Source reading file descriptors or sockets with `selectors`, woken
+    up by a socket pair when stopped.'''
+
+    def __init__(self, name, selector=selectors.DefaultSelector):
+        CommandSource.__init__(self, name)
+        self.selector = selector()
+        self.wakeup, self.waker = socket.socketpair()
+        self.selector.register(self.wakeup, selectors.EVENT_READ)
+
+    def register(self, fileobj, callback):
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def unregister(self, fileobj):
+        self.selector.unregister(fileobj)
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                for key, events in self.selector.select():
+                    if key.fileobj is self.wakeup:
+                        return
+                    key.data(key.fileobj)
+        except Exception as e:
+            LOGGER.info('%s failed: %s' % (self.name, e))
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        self.selector.close()
+        self.wakeup.close()
+        self.waker.close()
+
+    def stop(self, timeout=1.):
+        self.stopped.set()
+        try:
+            self.waker.send(b'\0')
+        except OSError:
+            pass
+        CommandSource.stop(self, timeout)
+
+
+class StreamSource(SelectorSource):
+    ''' Reads the keys from a file object (pipe, named pipe, file), until
+    its end.
+
+    :param stream: A file object with a file descriptor.
+    '''
+
+    def __init__(self, stream, name='stream'):
+        # select (unlike epoll) accepts the regular files, e.g. /dev/null
+        SelectorSource.__init__(self, name, selectors.SelectSelector)
+        self.stream = stream
+        self.fd = stream.fileno()
+        self.register(self.fd, self.read)
+
+    def read(self, fd):
+        data = os.read(fd, 1024)
+        if not data:
+            self.unregister(fd)
+            self.stopped.set()
+            return
+        self.push(data)
+
+
+class TerminalSource(StreamSource):
+    ''' Reads the keys pressed in a POSIX terminal, without echo nor waiting
+    for the end of the line (termios cbreak mode, restored when stopped).
+
+    :param stream: The terminal file object (default: stdin).
+    '''
+
+    def __init__(self, stream=None):
+        StreamSource.__init__(self, stream or sys.stdin, 'terminal')
+        self.settings = None
+
+    def run(self):
+        import termios
+        import tty
+        self.settings = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        StreamSource.run(self)
+
+    def cleanup(self):
+        if self.settings is not None:
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.settings)
+        StreamSource.cleanup(self)
+
+
+class SocketSource(SelectorSource):
+    ''' Reads the keys sent by the clients of a listening socket, e.g.
+    ``echo M | nc -U /tmp/pygpssurvey.sock``.
+
+    :param address: A Unix socket path, or a (host, port) tuple.
+    '''
+
+    def __init__(self, address):
+        SelectorSource.__init__(self, 'socket')
+        self.address = address
+        if isinstance(address, tuple):
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(address)
+        self.server.listen(4)
+        self.server.setblocking(False)
+        self.register(self.server, self.accept)
+
+    def accept(self, server):
+        client, address = server.accept()
+        client.setblocking(False)
+        self.register(client, self.read)
+
+    def read(self, client):
+        try:
+            data = client.recv(1024)
+        except OSError:
+            data = b''
+        if not data:
+            self.unregister(client)
+            client.close()
+            return
+        self.push(data)
+
+    def cleanup(self):
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self.wakeup:
+                key.fileobj.close()
+        if not isinstance(self.address, tuple):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+        SelectorSource.cleanup(self)
+
+
+class ConsoleSource(CommandSource):
+    '''Reads the keys pressed in the Windows console (`msvcrt`), polled by
+    the thread.
+
+    :param interval: Polling interval (seconds).
+    '''
+
+    def __init__(self, interval=0.05):
+        CommandSource.__init__(self, 'console')
+        self.interval = interval
+
+    def run(self):
+        while not self.stopped.is_set():
+            while msvcrt.kbhit():
+                self.push(msvcrt.getch())
+            time.sleep(self.interval)
+
+
+class ScriptSource(CommandSource):
+    ''' Queues the keys of a script, to drive a session without keyboard
+    (benchmarks, replays).
+
+    :param script: Keys, separated by numbers of seconds to wait, e.g.
+        "M 2.5 N M Q".
+    '''
+
+    def __init__(self, script):
+        CommandSource.__init__(self, 'script')
+        self.script = script
+
+    def run(self):
+        for token in self.script.split():
+            if self.stopped.is_set():
+                return
+            try:
+                delay = float(token)
+            except ValueError:
+                self.push(token)
+            else:
+                self.stopped.wait(delay)
+
+
+def source_from_string(spec):
+    '''Create the `CommandSource` of a string, see the module
+    documentation.'''
+    kind, _, arg = spec.partition(':')
+    if kind == 'keyboard':
+        if sys.platform == 'win32':
+            return ConsoleSource()
+        if sys.stdin.isatty():
+            return TerminalSource()
+        return StreamSource(sys.stdin, 'stdin')
+    if kind == 'stdin':
+        return StreamSource(sys.stdin, 'stdin')
+    if kind == 'file':
+        # opened read-write, so that a named pipe does not block nor end
+        # when its writers close it
+        fd = os.open(arg, os.O_RDWR if _is_fifo(arg) else os.O_RDONLY)
+        return StreamSource(os.fdopen(fd, 'rb', 0), 'file')
+    if kind == 'unix':
+        return SocketSource(arg)
+    if kind == 'tcp':
+        host, _, port = arg.rpartition(':')
+        return SocketSource((host or 'localhost', int(port)))
+    if kind == 'script':
+        return ScriptSource(arg)
+    raise ValueError('Unknown commands source: %s' % spec)
+
+
+def _is_fifo(path):
+    import stat
+    return stat.S_ISFIFO(os.stat(path).st_mode)
+
+
+class Commands(object):
+    ''' Queue of the commands of several sources.
+
+    :param sources: `CommandSource` objects or strings (default: the
+        keyboard).
+    '''
+
+    def __init__(self, sources=None):
+        self.queue = Queue()
+        self.sources = []
+        self.started = False
+        if sources is None:
+            sources = ['keyboard']
+        for source in sources:
+            self.add(source)
+
+    def add(self, source):
+        '''Add a source, started if the commands are.'''
+        if not isinstance(source, CommandSource):
+            source = source_from_string(source)
+        source.queue = self.queue
+        self.sources.append(source)
+        if self.started:
+            source.start()
+
+    def start(self):
+        '''Start reading the sources.'''
+        if not self.started:
+            self.started = True
+            for source in self.sources:
+                source.start()
+
+    def get(self, timeout=None):
+        ''' Get the next command without blocking, None if there is none.
+
+        :param timeout: Wait up to `timeout` seconds for a command.
+        '''
+        try:
+            if timeout:
+                return self.queue.get(timeout=timeout)
+            return self.queue.get_nowait()
+        except Empty:
+            return None
+
+    def put(self, key):
+        '''Queue a command.'''
+        self.queue.put(key)
+
+    def stop(self):
+        '''Stop reading the sources (restoring the terminal).'''
+        for source in self.sources:
+            if source.is_alive():
+                source.stop()
+        self.started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
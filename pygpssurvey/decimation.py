@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.decimation
+    ----------------------
+
+    Decimation of the fix stream, to display, log or store fewer epochs of
+    the 10-20 Hz receivers. The points are still averaged on all their
+    fixes, only the outputs are decimated.
+
+    A decimator is given by a string:
+
+    - ``all``: every fix (no decimation);
+    - ``every:<n>``: one fix every `n`;
+    - ``interval:<seconds>``: the average of the fixes of each interval;
+    - ``change:<meters>``: the fixes more than `meters` away from the last
+      fix kept (or of another quality).
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+
+from .fix import Fix
+from .geodesy import LocalTangentPlane
+from .kalman import seconds_of_day
+
+
+class Decimator(object):
+    '''Keeps every fix; base class of the decimators.
+
+    `push` gives each (fix, reception time) and returns the (fix, time) to
+    output or None, `flush` returns the pending output at the end of the
+    stream, `reset` starts a new stream.
+    '''
+
+    def reset(self):
+        pass
+
+    def push(self, fix, received):
+        return fix, received
+
+    def flush(self):
+        return None
+
+    def decimate(self, fixes, times):
+        '''Decimate a stream of fixes, e.g. of a capture.
+
+        :return: The list of (fix, time) kept.
+        '''
+        self.reset()
+        push = self.push
+        kept = [item for item in (push(fix, received) for fix, received
+                                  in zip(fixes, times)) if item is not None]
+        last = self.flush()
+        if last is not None:
+            kept.append(last)
+        return kept
+
+    def __str__(self):
+        return 'all'
+
+
+class EveryNth(Decimator):
+    '''Keeps the first fix, then one every `n`.
+
+    :param n: Decimation factor.
+    '''
+
+    def __init__(self, n):
+        if n < 1:
+            raise ValueError('Decimation factor must be at least 1')
+        self.n = n
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+
+    def push(self, fix, received):
+        count = self.count
+        self.count = count + 1 if count + 1 < self.n else 0
+        return (fix, received) if count == 0 else None
+
+    def __str__(self):
+        return 'every:%d' % self.n
+
+
+class IntervalAverage(Decimator):
+    ''' Averages the fixes of each interval of `seconds` of their time of
+    day (of their reception time if they have none): the average is output
+    when the first fix of the next interval is received, or by `flush`.
+    The average has the attributes of the last fix of the interval and its
+    mean position, the altitude being averaged on the fixes which have
+    one; it has no sentence, so it is written to the raw output as a
+    synthesized GGA sentence (see `Fix.to_gga`), replayed as the other
+    fixes.
+
+    :param seconds: Length of the intervals.
+    '''
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError('Decimation interval must be positive')
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        self.interval = None
+        self.count = 0
+        self.altcount = 0
+        self.lon = self.lat = self.alt = 0.
+        self.last = None
+        self.received = None
+
+    def push(self, fix, received):
+        epoch = seconds_of_day(fix.timestamp)
+        interval = (received if epoch is None else epoch) // self.seconds
+        output = None
+        if interval != self.interval:
+            output = self.flush()
+            self.interval = interval
+        if fix.lon is not None and fix.lat is not None:
+            self.count += 1
+            self.lon += fix.lon
+            self.lat += fix.lat
+            if fix.alt is not None:
+                self.altcount += 1
+                self.alt += fix.alt
+        self.last = fix
+        self.received = received
+        return output
+
+    def flush(self):
+        '''Output the average of the current interval.'''
+        last = self.last
+        if last is None:
+            return None
+        count = self.count
+        altcount = self.altcount
+        output = (Fix(timestamp=last.timestamp,
+                      lon=self.lon / count if count else None,
+                      lon_dir=last.lon_dir,
+                      lat=self.lat / count if count else None,
+                      lat_dir=last.lat_dir,
+                      alt=self.alt / altcount if altcount else None,
+                      alt_units=last.alt_units, quality=last.quality,
+                      numsats=last.numsats, hdop=last.hdop,
+                      diffage=last.diffage, sigma=last.sigma),
+                  self.received)
+        interval = self.interval
+        self.reset()
+        self.interval = interval
+        return output
+
+    def __str__(self):
+        return 'interval:%g' % self.seconds
+
+
+class OnChange(Decimator):
+    ''' Keeps the fixes more than `threshold` meters (horizontally) away
+    from the last fix kept, or of another quality.
+
+    :param threshold: Distance in meters.
+    '''
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.plane = None
+        self.reset()
+
+    def reset(self):
+        self.kept = None    # (east, north, quality) of the last fix kept
+
+    def push(self, fix, received):
+        if fix.lon is None or fix.lat is None:
+            return None
+        if self.plane is None:
+            self.plane = LocalTangentPlane(fix.lon, fix.lat)
+        east, north = self.plane.to_local(fix.lon, fix.lat)
+        kept = self.kept
+        if (kept is None or fix.quality != kept[2] or
+                math.hypot(east - kept[0], north - kept[1]) > self.threshold):
+            self.kept = (east, north, fix.quality)
+            return fix, received
+        return None
+
+    def __str__(self):
+        return 'change:%g' % self.threshold
+
+
+def decimator_from_string(spec):
+    '''Create the `Decimator` of a string, see the module documentation.'''
+    kind, _, arg = spec.partition(':')
+    try:
+        if kind == 'all':
+            return Decimator()
+        if kind == 'every':
+            return EveryNth(int(arg))
+        if kind == 'interval':
+            return IntervalAverage(float(arg))
+        if kind == 'change':
+            return OnChange(float(arg))
+    except ValueError:
+        raise ValueError('Bad decimation "%s"' % spec)
+    raise ValueError('Unknown decimation: %s' % spec)
@@ -10,16 +10,34 @@
 
 '''
 from __future__ import division, unicode_literals
-import msvcrt
 import time
-import pynmea2
-import utm
-from pylink import link_from_url
+from collections import deque
 
 from .logger import LOGGER
-from .utils import (cached_property, retry, bytes_to_hex, hex_to_bytes,
-                    ListDict, is_bytes)
-from .compat import stdout
+from .link import SupervisedLink
+from .fix import Fix, gst_sigma
+from .filters import FixFilter
+from .ubx import UBXReader
+from .rtcm import CorrectionForwarder
+from .writers import make_writer, POINT_KEYS, FLOAT_FORMAT
+from .geodesy import Target, nearest
+from .commands import Commands
+from .capture import CapturePipeline, AUTO_POINT_KEYS
+from . import planner
+from .profiling import NULL_TIMINGS
+from .utils import (cached_property, retry, retry_metrics, bytes_to_hex,
+                    hex_to_bytes, ListDict, is_bytes, is_text, LazyModule)
+from .compat import stdout, OrderedDict
+
+# Loaded on first use
+pynmea2 = LazyModule('pynmea2')
+pylink = LazyModule('pylink')
+
+#: Protocols of the frames received.
+PROTOCOLS = ('nmea', 'ubx')
+
+#: `PyLink` URL schemes, other correction sources are filenames.
+LINK_SCHEMES = ('tcp', 'udp', 'serial', 'gsm')
 
 
 class NoDeviceException(Exception):
@@ -55,103 +73,336 @@ class GPSSurvey(object):
     data and parsing it into usable scalar values.
 
     :param link: A `PyLink` connection.
+    :param pool: The `LinkPool` of the connection, if any.
+    :param protocol: Protocol of the frames received, "nmea" or "ubx"
+        (default: "nmea").
     '''
     
-    def __init__(self, link):
+    def __init__(self, link, pool=None, protocol='nmea'):
+        if protocol not in PROTOCOLS:
+            raise ValueError('protocol must be one of %s' % ', '.join(PROTOCOLS))
         self.link = link
+        self.pool = pool
+        self.protocol = protocol
+        self.ubxreader = UBXReader() if protocol == 'ubx' else None
         self.link.open()
-        self.recframe=[]    # reception frame empty
+        self.recframe = ''  # partial sentence received, kept across reads
+        self.frames = deque()   # parsed frames not yet processed
+        self.lastgst = None # position error statistics frame of the next fix
+        self.lastgga = None # timestamp of the last fix released without error estimate
+        self.gstafter = False   # the receiver sends the GST after the GGA
+        self.pendingfix = None  # fix waiting for the GST of its epoch
+        self.forwarder = None   # RTCM3 corrections forwarding thread
+        self.server = None  # live fixes server
+        self.epochsequence = 0  # number of fixes decoded by the loops
+        self.timings = NULL_TIMINGS # stage timings, see `profiling`
 
     @classmethod
-    def from_url(cls, url, timeout=10):
+    def from_url(cls, url, timeout=10, stalltimeout=30., pool=None, protocol='nmea', opentimeout=10.):
         ''' Get device from url.
 
+        The connection is supervised and reopened automatically when it
+        fails (see `SupervisedLink`).
+
         :param url: A `PyLink` connection URL.
         :param timeout: Set a read timeout value.
+        :param stalltimeout: Reconnect after this number of seconds without
+            data, 0 to disable (default: 30).
+        :param pool: A `LinkPool` sharing the connection with other devices
+            using the same URL (default: None, not shared).
+        :param protocol: Protocol of the frames received, "nmea" or "ubx"
+            (default: "nmea").
+        :param opentimeout: Give up opening the connection after this
+            number of seconds (default: 10).
+        '''
+        if pool is not None:
+            return cls(pool.acquire(url, timeout, stalltimeout=stalltimeout, opentimeout=opentimeout), pool=pool, protocol=protocol)
+        link = SupervisedLink(pylink.link_from_url(url), stalltimeout=stalltimeout, opentimeout=opentimeout)
+        link.settimeout(timeout)
+        return cls(link, protocol=protocol)
+
+    @classmethod
+    async def afrom_url(cls, url, timeout=10, stalltimeout=30., protocol='nmea', opentimeout=10.):
+        ''' Get device from url, opening the connection without blocking
+        the event loop (see `from_url`).
         '''
-        link = link_from_url(url)
+        link = SupervisedLink(pylink.link_from_url(url), stalltimeout=stalltimeout, opentimeout=opentimeout)
         link.settimeout(timeout)
-        return cls(link)
+        await link.aopen()
+        return cls(link, protocol=protocol)
+
+    def startcorrections(self, source, **kwargs):
+        ''' start forwarding RTCM3 corrections to the board, in a thread
+        running concurrently with the frames reading.
+
+        :param source: A `PyLink` URL, a filename, or a link or binary file
+            object, where the corrections are read.
+        :param kwargs: `CorrectionForwarder` parameters.
+        '''
+        self.stopcorrections()
+        if is_text(source):
+            if source.split(':')[0].lower() in LINK_SCHEMES:
+                source = SupervisedLink(pylink.link_from_url(source))
+            else:
+                source = open(source, 'rb')
+        self.forwarder = CorrectionForwarder(source, self.link, **kwargs)
+        self.forwarder.start()
+        return self.forwarder
+
+    def stopcorrections(self):
+        ''' stop forwarding RTCM3 corrections and log its statistics.'''
+        if self.forwarder is not None:
+            self.forwarder.stop(1.)
+            self.forwarder.report()
+            self.forwarder.source.close()
+            self.forwarder = None
+
+    def startserver(self, host='localhost', port=8080, commands=None):
+        ''' start the HTTP/WebSocket server publishing the live fixes (see
+        `server.LiveServer`), in a thread.
+
+        :param host: Listening address (default: "localhost").
+        :param port: Listening port (default: 8080).
+        :param commands: The `Commands` queue where the capture/undo
+            requests are put.
+        '''
+        from .server import LiveServer
+        self.stopserver()
+        self.server = LiveServer(host, port, commands, stats=self.stats)
+        return self.server.start()
+
+    def stopserver(self):
+        ''' stop the live fixes server.'''
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def stats(self):
+        ''' Return the connection and corrections statistics.'''
+        stats = OrderedDict()
+        stats['url'] = getattr(self.link, 'url', None)
+        stats['protocol'] = self.protocol
+        stats['reconnects'] = getattr(self.link, 'reconnects', 0)
+        stats['downtime'] = getattr(self.link, 'total_downtime', 0.)
+        if self.forwarder is not None:
+            stats['corrections'] = self.forwarder.stats()
+        return stats
+
+    def close(self):
+        ''' close the connection, or release it if it comes from a pool.'''
+        self.stopserver()
+        self.stopcorrections()
+        if getattr(self.link, 'reconnects', 0):
+            LOGGER.info('%d reconnections, total downtime %.1fs'
+                        % (self.link.reconnects, self.link.total_downtime))
+        for name, counters in retry_metrics().items():
+            LOGGER.info('%s: %d calls, %d retries, %d failures'
+                        % (name, counters['calls'], counters['retries'],
+                           counters['failures']))
+        if self.pool is not None:
+            self.pool.release(self.link.poolurl)
+        else:
+            self.link.close()
 
     def updatereceptionframe(self, size=None, timeout=None):
         ''' update reception frame by getting bytes received.
         The maximum amount of data to be received at once
         is specified by `size`.
+        Returns the next parsed NMEA frame, or None if no complete frame was
+        received. A read can give several frames, they are returned by the
+        next calls without reading the link.
         '''
-        bytes = self.link.read(size=size, timeout=timeout)
-        if (len(bytes) > 0):
-            for l in range(len(bytes)):
-                self.recframe.append(bytes[l])
-        try:
-            nmeaframe = pynmea2.parse(bytes)
-        except:
-            nmeaframe = None
-        return nmeaframe
+        if not self.frames:
+            with self.timings.read:
+                data = self.link.read(size=size, timeout=timeout)
+            self.feedframes(data)
+        if self.frames:
+            return self.frames.popleft()
+        return None
+
+    async def aupdatereceptionframe(self, size=None, timeout=None):
+        ''' asyncio version of `updatereceptionframe`, the link is read in
+        an executor thread.
+        '''
+        if not self.frames:
+            with self.timings.read:
+                data = await self.link.aread(size=size, timeout=timeout)
+            self.feedframes(data)
+        if self.frames:
+            return self.frames.popleft()
+        return None
+
+    def publishfix(self, fix):
+        ''' publish a fix decoded by the acquisition loop on the live
+        server, if it is started.'''
+        if self.server is not None:
+            self.server.publish(fix)
+
+    def feedframes(self, data):
+        ''' split received data into NMEA frames, parsed and queued in
+        `frames`; the last partial sentence is kept in `recframe`.
+        With the UBX protocol, the fixes decoded are queued instead.
+        '''
+        if not len(data):
+            return
+        with self.timings.frame:
+            if self.ubxreader is not None:
+                navframes = self.ubxreader.split(data)
+            else:
+                if is_bytes(data):
+                    data = data.decode('utf-8', 'replace')
+                lines = (self.recframe + data).split('\n')
+                self.recframe = lines.pop()
+        with self.timings.parse:
+            if self.ubxreader is not None:
+                self.frames.extend(self.ubxreader.decodeframes(navframes))
+                return
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self.frames.append(pynmea2.parse(line))
+                except pynmea2.ParseError:
+                    LOGGER.info('Bad NMEA frame: %r' % line)
+
+    def decodefix(self, nmeaframe):
+        ''' decode a parsed NMEA frame into a `Fix` (UBX frames are already
+        decoded by the `UBXReader`).
+        Returns None if the frame does not complete a position epoch.
+
+        The error estimate (GST) of a fix must have the timestamp of its
+        GGA. A GST received before the GGA is kept for it; once the
+        receiver is seen sending the GST after the GGA, each GGA fix is held
+        until the GST of its epoch, and released without error estimate by
+        the next other frame (or by a read giving no frame, `nmeaframe` is
+        None) if it does not come.
+        '''
+        pending = self.pendingfix
+        if isinstance(nmeaframe, Fix) or (nmeaframe is None):
+            self.pendingfix = None
+            return pending if nmeaframe is None else nmeaframe
+        with self.timings.parse:
+            sentence_type = getattr(nmeaframe, 'sentence_type', None)
+            self.pendingfix = None
+            if sentence_type == 'GGA':
+                gst, self.lastgst = self.lastgst, None
+                fix = Fix.from_gga(nmeaframe, gst)
+                if (fix.sigma is None) and self.gstafter:
+                    self.pendingfix = fix
+                    return pending
+                self.lastgga = nmeaframe.timestamp if fix.sigma is None else None
+                return fix
+            if sentence_type == 'GST':
+                if (pending is not None) and (pending.timestamp == nmeaframe.timestamp):
+                    pending.sigma = gst_sigma(nmeaframe)
+                    return pending
+                if (self.lastgga is not None) and (self.lastgga == nmeaframe.timestamp):
+                    self.gstafter = True    # the GST of the last GGA, the next ones will wait for it
+                else:
+                    self.lastgst = nmeaframe
+            return pending
+
+    def logfilterstats(self, fixfilter, stdoutdisplay=False):
+        ''' log the accepted and rejected epochs counters of `fixfilter`.'''
+        stats = ', '.join('%s: %d' % item for item in fixfilter.stats().items())
+        LOGGER.info('fix filter epochs (%s)' % stats)
+        if (stdoutdisplay == True):
+            stdout.write('fix filter epochs (' + stats + ')\n')
         
-    def getpointsposition(self, output, rawoutput, delim=";", stdoutdisplay=False, measuresnb=10, pointfixfilter=False, pointnamememory=False, dir=""):
+    def getpointsposition(self, output, rawoutput, delim=";", stdoutdisplay=False, measuresnb=10, pointfixfilter=False, pointnamememory=False, dir="", floatfmt=FLOAT_FORMAT, outputformat="csv", session=None, commands=None, window=None, ringsize=1024, autocapture=None, displaydecimator=None, rawdecimator=None, trackdecimator=None, quittimeout=30.):
         ''' Get points position
 
         :param output: Filename where output is written
         :param delim: CSV char delimiter (default: ";")
         :param stdoutdisplay: Display on the standard out if defined output is a file        
         :param measuresnb: Number of measurements to do obtain a mean point (default: 10)        
+        :param pointfixfilter: A `FixFilter`, or True to not add the points located in GPS fix (default: False)
         :param pointnamememory: Memorise a specified point name (default: False)
         :param dir: Directory where output is written (default: "")
+        :param floatfmt: Format of the coordinates written (default: "%.12g")
+        :param outputformat: Format of the points output, "csv", "geojson"
+            or "gpkg" (default: "csv")
+        :param session: A `Session` where the points and their epochs are
+            also stored
+        :param commands: The `Commands` giving the keys (default: the
+            keyboard)
+        :param window: Capture the points from the fixes of the last
+            `window` seconds already received (default: None, from the next
+            `measuresnb` fixes)
+        :param ringsize: Number of fixes kept for the `window` captures
+            (default: 1024)
+        :param autocapture: An `AutoCapture` capturing the points when the
+            rover stops or moves, written with their averaging statistics
+            (default: None)
+        :param displaydecimator: A `decimation.Decimator` of the fixes
+            displayed, only the fixes are displayed if given (default: None,
+            all the frames)
+        :param rawdecimator: A `decimation.Decimator` of the fixes of the
+            points written to `rawoutput` (default: None, all of them)
+        :param trackdecimator: A `decimation.Decimator` of the fixes of the
+            points stored in `session` (default: None, all of them)
+        :param quittimeout: After the quit command, wait at most this number
+            of seconds for the captures in progress, None for no limit
+            (default: 30); they are dropped if not completed
         '''
 
         samplesnb = 0
         pointnum = 1
         pointname = ""
-        output.write('pointnum' + delim + 'pointname' + delim + 'lon' + delim + 'lon_dir' + delim + 'lat' + delim + 'lat_dir' + delim + 'alt' + delim + 'alt_units' + '\n')
-        key = '&'
-        if (pointfixfilter == True):
-            gps_qual_min = 1
-        else :
-            gps_qual_min = 0
+        pointwriter = make_writer(output, outputformat, delim, floatfmt, AUTO_POINT_KEYS if autocapture is not None else POINT_KEYS)
+        quitrequested = False                                                   # not reset by the next commands
+        fixfilter = FixFilter.from_pointfixfilter(pointfixfilter)
+        owncommands = commands is None
+        if owncommands:
+            commands = Commands()
+        commands.start()
+        captures = CapturePipeline(pointwriter, rawoutput, fixfilter, measuresnb, session, stdoutdisplay, window, ringsize, autocapture, self.timings, rawdecimator, trackdecimator)
                
-        while ((ord(key) != ord('Q')) and (ord(key) != ord('q'))):
+        while (not quitrequested) or captures.waiting(quittimeout):         # the queued captures are completed before quitting
             try:
                 nmeaframe = self.updatereceptionframe(None,0.1)                             # update reception frame if needed
+                fix = self.decodefix(nmeaframe)
+                if fix is not None:
+                    self.epochsequence += 1
+                    self.publishfix(fix)
+                    trigger = captures.feed(self.epochsequence, fix)
+                    if (trigger is not None) and (captures.trigger(pointnum, pointname, trigger) is not None):     # automatic capture
+                        pointnum += 1
                 if (stdoutdisplay == True) and (nmeaframe!=None):
-                    stdout.write(str(nmeaframe) + '\n')
+                    if (displaydecimator is None):
+                        stdout.write(str(nmeaframe) + '\n')
+                    elif (fix is not None):
+                        shown = displaydecimator.push(fix, time.time())     # fixes only, decimated
+                        if shown is not None:
+                            stdout.write(str(shown[0]) + '\n')
                             
-                if msvcrt.kbhit():                                              # key press detection
-                    key = msvcrt.getch()
+                command = commands.get()                                        # key press detection
+                if command is not None:
+                    key = command
                     if (ord(key) == ord('M')) or (ord(key) == ord('m')):                                            # to memorise GPS point
-                        if (stdoutdisplay == True):
-                            stdout.write('begin saving mean point position ' + str(pointnum) + '\n')
-                        measuresnbtodo = measuresnb
-                        rawoutput.write(str(pointnum) + '\n')
-                        longitudetab = []
-                        latitudetab = []
-                        altitudetab = []
-                        while (measuresnbtodo > 0): # et time out de 5xmeasuresnb non dépassé
-                            nmeaframe = self.updatereceptionframe(None,0.1)                             # update reception frame if needed
-                            try:
-                                if (nmeaframe.gps_qual > gps_qual_min):                                
-                                    rawoutput.write(str(nmeaframe) + '\n')
-                                    if (stdoutdisplay == True):
-                                        stdout.write(str(nmeaframe) + '\n')
-                                    if (int(nmeaframe.gps_qual) > 0):
-                                        longitudetab.append(float(nmeaframe.longitude))
-                                        latitudetab.append(float(nmeaframe.latitude))
-                                        altitudetab.append(float(nmeaframe.altitude))
-                                        measuresnbtodo -= 1
-                            except:
-                                pass
-                        if (stdoutdisplay == True):
-                            stdout.write('end saving mean point position ' + str(pointnum) + '\n')
-                        output.write(str(pointnum) + delim + pointname + delim + str(sum(longitudetab)/len(longitudetab)) + delim + nmeaframe.lon_dir + delim + str(sum(latitudetab)/len(latitudetab)) + delim + nmeaframe.lat_dir + delim + str(sum(altitudetab)/len(altitudetab)) + delim + nmeaframe.altitude_units + '\n')
+                        captures.request(pointnum, pointname)           # captured from the next epoch, written by the capture thread
                         pointnum += 1
 
+                    elif (ord(key) == ord('Q')) or (ord(key) == ord('q')):                                          # to quit
+                        if quitrequested and (captures.quitting is not None):   # Q again, quit without completing the captures
+                            break
+                        quitrequested = True
+
                     elif (ord(key) == ord('D')) or (ord(key) == ord('d')):                                          # to delete last GPS point
-                        # effacement de la dernière ligne (donc dernier point)
-                        print('D')
+                        undone = captures.undo()                        # last capture cancelled, or last point removed
+                        if undone is not None:
+                            pointnum = undone.pointnum
 
             except KeyboardInterrupt:                                           # 'Ctrl' + 'C' detected
                 break            
+        captures.close()
+        if owncommands:
+            commands.stop()
+        pointwriter.close()
+        self.logfilterstats(fixfilter, stdoutdisplay)
         
-    def setpointsimplantation(self, output, rawoutput, input, delim=";", stdoutdisplay=False, measuresnb=10, pointfixfilter=False, pointnamememory=False, utmzoneletter=None, utmzonenumber=0, dir=""):
+    def setpointsimplantation(self, output, rawoutput, input, delim=";", stdoutdisplay=False, measuresnb=10, pointfixfilter=False, pointnamememory=False, utmzoneletter=None, utmzonenumber=0, dir="", floatfmt=FLOAT_FORMAT, outputformat="csv", session=None, smoother=None, commands=None, window=None, ringsize=1024, autocapture=None, reorder=False, displaydecimator=None, rawdecimator=None, trackdecimator=None, quittimeout=30.):
         ''' Get points position
 
         :param output: Filename where output is written
@@ -159,10 +410,40 @@ class GPSSurvey(object):
         :param delim: CSV char delimiter (default: ";")
         :param stdoutdisplay: Display on the standard out if defined output is a file        
         :param measuresnb: Number of measurements to do obtain a mean point (default: 10)        
+        :param pointfixfilter: A `FixFilter`, or True to not add the points located in GPS fix (default: False)
         :param pointnamememorize: Memorise a specified point name (default: False)
         :param utmzoneletter: UTM zone letter (default: None)
         :param utmzonenumber: UTM zone number (default: 0)
         :param dir: Directory where output is written (default: "")
+        :param floatfmt: Format of the coordinates written (default: "%.12g")
+        :param outputformat: Format of the points output, "csv", "geojson"
+            or "gpkg" (default: "csv")
+        :param session: A `Session` where the points and their epochs are
+            also stored
+        :param smoother: A `kalman.KalmanFilter` smoothing the positions of
+            the guidance display (default: None, raw positions)
+        :param commands: The `Commands` giving the keys (default: the
+            keyboard)
+        :param window: Capture the points from the fixes of the last
+            `window` seconds already received (default: None, from the next
+            `measuresnb` fixes)
+        :param ringsize: Number of fixes kept for the `window` captures
+            (default: 1024)
+        :param autocapture: An `AutoCapture` capturing the points when the
+            rover stops or moves, written with their averaging statistics
+            (default: None)
+        :param displaydecimator: A `decimation.Decimator` of the fixes
+            displayed, only the fixes are displayed if given (default: None,
+            all the frames)
+        :param rawdecimator: A `decimation.Decimator` of the fixes of the
+            points written to `rawoutput` (default: None, all of them)
+        :param trackdecimator: A `decimation.Decimator` of the fixes of the
+            points stored in `session` (default: None, all of them)
+        :param quittimeout: After the quit command, wait at most this number
+            of seconds for the captures in progress, None for no limit
+            (default: 30); they are dropped if not completed
+        :param reorder: Stake out the points in a short walking order from
+            the first one, instead of the file order (default: False)
         '''
 
         samplesnb = 0
@@ -170,6 +451,8 @@ class GPSSurvey(object):
         pointname = ""
         index_ref = 1
         pointslist = self.pointslist(input, delim)
+        if reorder:
+            pointslist = planner.reorder(pointslist)
         if (len(pointslist)<2):
             lon_ref = None
             lat_ref = None
@@ -178,62 +461,63 @@ class GPSSurvey(object):
             lon_ref = pointslist[index_ref][2]
             lat_ref = pointslist[index_ref][4]
                     
-        output.write('pointnum' + delim + 'pointname' + delim + 'lon' + delim + 'lon_dir' + delim + 'lat' + delim + 'lat_dir' + delim + 'alt' + delim + 'alt_units' + '\n')
-        key = '&'
-        if (pointfixfilter == True):
-            gps_qual_min = 1
-        else :
-            gps_qual_min = 0
+        # guidance constants are computed once by target
+        targets = [Target.from_row(row, zonenumber=utmzonenumber, zoneletter=utmzoneletter) for row in pointslist]
+        validtargets = [i for i in range(1, len(targets)) if targets[i] is not None]
+        position = None
+        pointwriter = make_writer(output, outputformat, delim, floatfmt, AUTO_POINT_KEYS if autocapture is not None else POINT_KEYS)
+        quitrequested = False                                                   # not reset by the next commands
+        fixfilter = FixFilter.from_pointfixfilter(pointfixfilter)
+        owncommands = commands is None
+        if owncommands:
+            commands = Commands()
+        commands.start()
+        captures = CapturePipeline(pointwriter, rawoutput, fixfilter, measuresnb, session, stdoutdisplay, window, ringsize, autocapture, self.timings, rawdecimator, trackdecimator)
                
-        while ((ord(key) != ord('Q')) and (ord(key) != ord('q'))):
+        while (not quitrequested) or captures.waiting(quittimeout):         # the queued captures are completed before quitting
             try:
                 nmeaframe = self.updatereceptionframe(None,0.1)                             # update reception frame if needed
-                if (stdoutdisplay == True) and (nmeaframe!=None):
+                fix = self.decodefix(nmeaframe)
+                if fix is not None:
+                    self.epochsequence += 1
+                    self.publishfix(fix)
+                    trigger = captures.feed(self.epochsequence, fix)
+                    if (trigger is not None) and (captures.trigger(pointnum, pointname, trigger) is not None):     # automatic capture
+                        pointnum += 1
+                shownframe, displayfix = nmeaframe, fix
+                if (stdoutdisplay == True) and (displaydecimator is not None):
+                    kept = displaydecimator.push(fix, time.time()) if fix is not None else None     # fixes only, decimated
+                    shownframe = displayfix = kept[0] if kept is not None else None
+                if (stdoutdisplay == True) and (shownframe!=None):
                     if ((lon_ref == None) or (lat_ref == None)):
-                        stdout.write(str(nmeaframe) + '\n')
-                    else:
-                        if (utmzoneletter == None):
-                            lon_gap = str(float(nmeaframe.longitude)-float(lon_ref))
-                            lat_gap = str(float(nmeaframe.latitude)-float(lat_ref))
-                        else:
-                            lat_utm, lon_utm, zonenumber_utm, zoneletter_utm = utm.from_latlon(nmeaframe.latitude,nmeaframe.longitude)
-                            lat_ref_utm, lon_ref_utm, zonenumber_utm, zoneletter_utm = utm.from_latlon(float(lat_ref),float(lon_ref))
-                            lon_gap = lon_utm - lon_ref_utm
-                            lat_gap = lat_utm - lat_ref_utm
-                        stdout.write(num_ref + ',' + lon_ref + ',' + lat_ref + ',' + str(lon_gap) + ',' + str(lat_gap) + '\n')
+                        stdout.write(str(shownframe) + '\n')
+                    elif (displayfix is not None) and (displayfix.quality > 0) and (targets[index_ref] is not None):
+                        target = targets[index_ref]
+                        with self.timings.project:
+                            shown = smoother.update(displayfix) if smoother is not None else displayfix
+                            east_gap, north_gap, distance, azimuth = target.guidance(shown.lon, shown.lat)
+                            if (utmzoneletter != None):
+                                east_gap, north_gap = target.utmoffset(shown.lon, shown.lat)
+                        stdout.write(num_ref + ',' + lon_ref + ',' + lat_ref + ',%.3f,%.3f,%.3f,%.1f\n' % (east_gap, north_gap, distance, azimuth))
+                if (fix is not None) and (fix.quality > 0):
+                    position = fix
                             
-                if msvcrt.kbhit():                                              # key press detection
-                    key = msvcrt.getch()
+                command = commands.get()                                        # key press detection
+                if command is not None:
+                    key = command
                     if (ord(key) == ord('M')) or (ord(key) == ord('m')):                                            # to memorise GPS point
-                        if (stdoutdisplay == True):
-                            stdout.write('begin saving mean point position ' + str(pointnum) + '\n')
-                        measuresnbtodo = measuresnb
-                        rawoutput.write(str(pointnum) + '\n')
-                        longitudetab = []
-                        latitudetab = []
-                        altitudetab = []
-                        while (measuresnbtodo > 0): # et time out de 5xmeasuresnb non dépassé
-                            nmeaframe = self.updatereceptionframe(None,0.1)                             # update reception frame if needed
-                            try:
-                                if (nmeaframe.gps_qual > gps_qual_min):                                
-                                    rawoutput.write(str(nmeaframe) + '\n')
-                                    if (stdoutdisplay == True):
-                                        stdout.write(str(nmeaframe) + '\n')
-                                    if (int(nmeaframe.gps_qual) > 0):
-                                        longitudetab.append(float(nmeaframe.longitude))
-                                        latitudetab.append(float(nmeaframe.latitude))
-                                        altitudetab.append(float(nmeaframe.altitude))
-                                        measuresnbtodo -= 1
-                            except:
-                                pass
-                        if (stdoutdisplay == True):
-                            stdout.write('end saving mean point position ' + str(pointnum) + '\n')
-                        output.write(str(pointnum) + delim + pointname + delim + str(sum(longitudetab)/len(longitudetab)) + delim + nmeaframe.lon_dir + delim + str(sum(latitudetab)/len(latitudetab)) + delim + nmeaframe.lat_dir + delim + str(sum(altitudetab)/len(altitudetab)) + delim + nmeaframe.altitude_units + '\n')
+                        captures.request(pointnum, pointname)           # captured from the next epoch, written by the capture thread
                         pointnum += 1
 
+                    elif (ord(key) == ord('Q')) or (ord(key) == ord('q')):                                          # to quit
+                        if quitrequested and (captures.quitting is not None):   # Q again, quit without completing the captures
+                            break
+                        quitrequested = True
+
                     elif (ord(key) == ord('D')) or (ord(key) == ord('d')):                                          # to delete last GPS point
-                        # effacement de la dernière ligne (donc dernier point)
-                        print('D')
+                        undone = captures.undo()                        # last capture cancelled, or last point removed
+                        if undone is not None:
+                            pointnum = undone.pointnum
                     elif (ord(key) == ord('P')) or (ord(key) == ord('p')):                                          # to find previous GPS point
                         if (len(pointslist) > 2):
                             if (index_ref > 1):
@@ -252,6 +536,15 @@ class GPSSurvey(object):
                             num_ref = pointslist[index_ref][0]
                             lon_ref = pointslist[index_ref][2]
                             lat_ref = pointslist[index_ref][4]
+                    elif (ord(key) == ord('F')) or (ord(key) == ord('f')):                                          # to find nearest GPS point
+                        if (position is not None) and (len(validtargets) > 0):
+                            nearestindex, distance = nearest(position.lon, position.lat, [targets[i].lon for i in validtargets], [targets[i].lat for i in validtargets])
+                            index_ref = validtargets[nearestindex]
+                            num_ref = pointslist[index_ref][0]
+                            lon_ref = pointslist[index_ref][2]
+                            lat_ref = pointslist[index_ref][4]
+                            if (stdoutdisplay == True):
+                                stdout.write('nearest point ' + num_ref + ' at %.3f m\n' % distance)
                     elif (ord(key) == ord('L')) or (ord(key) == ord('l')):                                          # to list GPS points
                         stdout.write('\n')
                         for i in range(len(pointslist)):
@@ -262,6 +555,11 @@ class GPSSurvey(object):
                         stdout.write('\n')
             except KeyboardInterrupt:                                           # 'Ctrl' + 'C' detected
                 break            
+        captures.close()
+        if owncommands:
+            commands.stop()
+        pointwriter.close()
+        self.logfilterstats(fixfilter, stdoutdisplay)
 
     def pointslist(self, input, delim):
         list=[]
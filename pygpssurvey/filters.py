@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.filters
+    -------------------
+
+    Fix quality filtering of the decoded epochs.
+
+    A filter is described by a set of rules, e.g. from the command line::
+
+        quality=4,5;minsats=8,5:12;maxhdop=2.0;maxdiffage=10;maxgstsigma=0.05
+
+    or from the ``[fixfilter]`` section of a configuration file::
+
+        [fixfilter]
+        quality = 4,5
+        minsats = 8,5:12
+
+    ``quality`` is the set of accepted GGA fix qualities (values or ranges,
+    e.g. ``2-8``), ``minsats`` a default minimum number of satellites and
+    optional ``quality:count`` overrides (here RTK float needs 12
+    satellites), ``maxhdop`` the maximum horizontal dilution of precision,
+    ``maxdiffage`` the maximum age of differential data (seconds) and
+    ``maxgstsigma`` the maximum horizontal standard deviation (meters) given
+    by the GST sentence.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+
+from .compat import OrderedDict
+
+#: All GGA fix qualities giving a position (0 means no fix).
+ALL_FIXES = frozenset(range(1, 9))
+
+#: Fix qualities kept by the historical `pointfixfilter` option
+#: (GPS fix, quality 1, is rejected).
+DIFFERENTIAL_FIXES = frozenset(range(2, 9))
+
+RULES = ('quality', 'minsats', 'maxhdop', 'maxdiffage', 'maxgstsigma')
+
+
+class BadFilterException(Exception):
+    '''No valid fix filter.'''
+    def __str__(self):
+        if self.args:
+            return '%s %s' % (self.__doc__, self.args[0])
+        return self.__doc__
+
+
+def parse_qualities(value):
+    '''Parse a set of fix qualities, e.g. "4,5" or "2-8".'''
+    qualities = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            first, last = item.split('-', 1)
+            qualities.update(range(int(first), int(last) + 1))
+        else:
+            qualities.add(int(item))
+    return frozenset(qualities)
+
+
+def parse_minsats(value):
+    '''Parse a minimum number of satellites, e.g. "8" or "8,5:12".
+    Returns the default minimum and a dict of per-quality minimums.'''
+    default = None
+    perquality = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' in item:
+            quality, count = item.split(':', 1)
+            perquality[int(quality)] = int(count)
+        else:
+            default = int(item)
+    return default, perquality
+
+
+class FixFilter(object):
+    '''Compiled fix filter, evaluated once per epoch on a decoded `Fix`.
+
+    Only the configured rules are compiled, in a fixed order, and the first
+    failing rule rejects the epoch. Rejected epochs are counted by rule in
+    `rejected`.
+
+    :param qualities: Accepted fix qualities (default: any fix).
+    :param minsats: Minimum number of satellites in use.
+    :param minsats_by_quality: Dict of per-quality minimum number of
+        satellites, overriding `minsats`.
+    :param maxhdop: Maximum horizontal dilution of precision.
+    :param maxdiffage: Maximum age of differential data (seconds).
+    :param maxgstsigma: Maximum GST horizontal standard deviation (meters),
+        epochs without GST estimate are rejected.
+    '''
+
+    def __init__(self, qualities=None, minsats=None, minsats_by_quality=None,
+                 maxhdop=None, maxdiffage=None, maxgstsigma=None):
+        self.qualities = frozenset(qualities or ALL_FIXES)
+        self.minsats = minsats
+        self.minsats_by_quality = dict(minsats_by_quality or {})
+        self.maxhdop = maxhdop
+        self.maxdiffage = maxdiffage
+        self.maxgstsigma = maxgstsigma
+        self.rules = self._compile()
+        self.reset()
+
+    def _compile(self):
+        '''Build the list of (name, predicate) of the configured rules.'''
+        rules = []
+        qualities = self.qualities
+        rules.append(('quality', lambda fix: fix.quality in qualities))
+
+        if self.minsats is not None or self.minsats_by_quality:
+            default = self.minsats or 0
+            byquality = self.minsats_by_quality
+
+            def minsats(fix):
+                numsats = fix.numsats
+                return (numsats is not None and
+                        numsats >= byquality.get(fix.quality, default))
+            rules.append(('minsats', minsats))
+
+        if self.maxhdop is not None:
+            maxhdop = self.maxhdop
+            rules.append(('maxhdop', lambda fix: (fix.hdop is not None and
+                                                  fix.hdop <= maxhdop)))
+
+        if self.maxdiffage is not None:
+            maxdiffage = self.maxdiffage
+            rules.append(('maxdiffage',
+                          lambda fix: (fix.diffage is not None and
+                                       fix.diffage <= maxdiffage)))
+
+        if self.maxgstsigma is not None:
+            maxgstsigma = self.maxgstsigma
+            rules.append(('maxgstsigma',
+                          lambda fix: (fix.sigma is not None and
+                                       fix.sigma <= maxgstsigma)))
+        return tuple(rules)
+
+    def reset(self):
+        '''Reset the epoch counters.'''
+        self.accepted = 0
+        self.rejected = OrderedDict((name, 0) for name, rule in self.rules)
+
+    def accept(self, fix):
+        '''Return True if `fix` passes all rules, count it otherwise.'''
+        for name, rule in self.rules:
+            if not rule(fix):
+                self.rejected[name] += 1
+                return False
+        self.accepted += 1
+        return True
+
+    __call__ = accept
+
+    def stats(self):
+        '''Return the accepted and rejected epochs counters.'''
+        stats = OrderedDict(accepted=self.accepted)
+        for name, count in self.rejected.items():
+            stats['rejected_' + name] = count
+        return stats
+
+    @classmethod
+    def from_dict(cls, settings):
+        ''' Build a filter from a dict of rule strings.
+
+        :param settings: Dict with the `RULES` keys.
+        '''
+        kwargs = {}
+        for key, value in settings.items():
+            key = key.strip().lower()
+            value = str(value).strip()
+            if not value:
+                continue
+            try:
+                if key == 'quality':
+                    kwargs['qualities'] = parse_qualities(value)
+                elif key == 'minsats':
+                    default, perquality = parse_minsats(value)
+                    kwargs['minsats'] = default
+                    kwargs['minsats_by_quality'] = perquality
+                elif key in ('maxhdop', 'maxdiffage', 'maxgstsigma'):
+                    kwargs[key] = float(value)
+                else:
+                    raise BadFilterException('(unknown rule "%s")' % key)
+            except ValueError:
+                raise BadFilterException('(bad value "%s" for "%s")'
+                                         % (value, key))
+        return cls(**kwargs)
+
+    @classmethod
+    def from_string(cls, spec):
+        ''' Build a filter from a command-line specification.
+
+        :param spec: Rules separated by ";", e.g. "quality=4;maxhdop=2".
+        '''
+        settings = OrderedDict()
+        for item in spec.split(';'):
+            if not item.strip():
+                continue
+            if '=' not in item:
+                raise BadFilterException('(bad rule "%s")' % item.strip())
+            key, value = item.split('=', 1)
+            settings[key] = value
+        return cls.from_dict(settings)
+
+    @classmethod
+    def from_config(cls, config, section='fixfilter'):
+        ''' Build a filter from a configuration file.
+
+        :param config: Filename or file object of an INI configuration file.
+        :param section: Section of the rules (default: "fixfilter").
+        '''
+        from configparser import ConfigParser
+        parser = ConfigParser()
+        if hasattr(config, 'read'):
+            parser.read_file(config)
+        else:
+            with open(config) as configfile:
+                parser.read_file(configfile)
+        if not parser.has_section(section):
+            raise BadFilterException('(no [%s] section)' % section)
+        return cls.from_dict(OrderedDict(parser.items(section)))
+
+    @classmethod
+    def from_pointfixfilter(cls, pointfixfilter):
+        ''' Build a filter from the `pointfixfilter` argument, which can be
+        a `FixFilter` or the historical boolean (True rejects GPS fixes).'''
+        if isinstance(pointfixfilter, cls):
+            return pointfixfilter
+        if pointfixfilter:
+            return cls(qualities=DIFFERENTIAL_FIXES)
+        return cls()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.fix
+    ---------------
+
+    Decoded GPS epoch record shared by the acquisition, filtering and
+    averaging code.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+import operator
+import functools
+
+from .compat import OrderedDict
+
+
+def _to_int(value):
+    '''Convert a NMEA field to int, None if empty or not valid.'''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    '''Convert a NMEA field to float, None if empty or not valid.'''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Fix(object):
+    '''One decoded position epoch.
+
+    The NMEA fields are converted once, so that filtering and averaging
+    never have to go back to the sentence.
+
+    :param sentence: The source sentence, written as is in the raw output
+        (None for the fixes decoded from binary frames or averaged, written
+        as a synthesized GGA sentence, see `to_gga`).
+    '''
+    __slots__ = ('timestamp', 'lon', 'lon_dir', 'lat', 'lat_dir', 'alt',
+                 'alt_units', 'quality', 'numsats', 'hdop', 'diffage',
+                 'sigma', 'sentence')
+
+    def __init__(self, timestamp=None, lon=None, lon_dir='', lat=None,
+                 lat_dir='', alt=None, alt_units='', quality=0, numsats=None,
+                 hdop=None, diffage=None, sigma=None, sentence=None):
+        self.timestamp = timestamp
+        self.lon = lon
+        self.lon_dir = lon_dir
+        self.lat = lat
+        self.lat_dir = lat_dir
+        self.alt = alt
+        self.alt_units = alt_units
+        self.quality = quality
+        self.numsats = numsats
+        self.hdop = hdop
+        self.diffage = diffage
+        self.sigma = sigma
+        self.sentence = sentence
+
+    @classmethod
+    def from_gga(cls, gga, gst=None):
+        ''' Decode a `pynmea2` GGA sentence.
+
+        :param gga: A parsed GGA sentence.
+        :param gst: A parsed GST sentence, if any, giving the position
+            error estimate; only used if it has the timestamp of the GGA.
+        '''
+        if (gst is not None) and (gst.timestamp != gga.timestamp):
+            gst = None
+        quality = _to_int(gga.gps_qual) or 0
+        try:
+            lon = float(gga.longitude)
+            lat = float(gga.latitude)
+        except (TypeError, ValueError):
+            lon = lat = None
+            quality = 0
+        return cls(timestamp=gga.timestamp,
+                   lon=lon, lon_dir=gga.lon_dir or '',
+                   lat=lat, lat_dir=gga.lat_dir or '',
+                   alt=_to_float(gga.altitude),
+                   alt_units=gga.altitude_units or '',
+                   quality=quality,
+                   numsats=_to_int(gga.num_sats),
+                   hdop=_to_float(gga.horizontal_dil),
+                   diffage=_to_float(gga.age_gps_data),
+                   sigma=gst_sigma(gst),
+                   sentence=gga)
+
+    def to_dict(self):
+        '''Convert to a dict of JSON serializable values (the sentence is
+        not included).'''
+        return OrderedDict((
+            ('timestamp', None if self.timestamp is None else
+             self.timestamp.isoformat()),
+            ('lon', self.lon), ('lon_dir', self.lon_dir),
+            ('lat', self.lat), ('lat_dir', self.lat_dir),
+            ('alt', self.alt), ('alt_units', self.alt_units),
+            ('quality', self.quality), ('numsats', self.numsats),
+            ('hdop', self.hdop), ('diffage', self.diffage),
+            ('sigma', self.sigma)))
+
+    def to_gga(self):
+        ''' Synthesize the NMEA GGA sentence of the fix, with its checksum.
+        The coordinates are written with 7 decimals of minutes (0.2 mm), the
+        error estimate is not written (GGA has no such field).'''
+        timestamp = self.timestamp
+        if timestamp is None:
+            time = ''
+        else:
+            time = '%02d%02d%02d.%02d' % (timestamp.hour, timestamp.minute,
+                                          timestamp.second,
+                                          timestamp.microsecond // 10000)
+        if self.lon is None or self.lat is None:
+            lat = lat_dir = lon = lon_dir = ''
+        else:
+            lat = nmea_degrees(abs(self.lat), 2)
+            lat_dir = 'N' if self.lat >= 0 else 'S'
+            lon = nmea_degrees(abs(self.lon), 3)
+            lon_dir = 'E' if self.lon >= 0 else 'W'
+        optional = lambda fmt, value: '' if value is None else fmt % value
+        return nmea_sentence(','.join((
+            'GPGGA', time, lat, lat_dir, lon, lon_dir, str(self.quality or 0),
+            optional('%02d', self.numsats), optional('%.2f', self.hdop),
+            optional('%.4f', self.alt), self.alt_units or 'M', '', 'M',
+            optional('%.1f', self.diffage), '')))
+
+    def __str__(self):
+        if self.sentence is not None:
+            return str(self.sentence)
+        # decoded from a binary frame (e.g. UBX) or averaged
+        return self.to_gga()
+
+    def __repr__(self):
+        return '<Fix %s %s %s %s q=%s>' % (self.timestamp, self.lon,
+                                           self.lat, self.alt, self.quality)
+
+
+def gst_sigma(gst):
+    '''Horizontal standard deviation (meters) of a GST sentence, None if
+    not available.'''
+    if gst is None:
+        return None
+    lat = _to_float(gst.std_dev_latitude)
+    lon = _to_float(gst.std_dev_longitude)
+    if lat is None or lon is None:
+        return None
+    return math.sqrt(lat * lat + lon * lon)
+
+
+def nmea_sentence(body):
+    '''Add the "$" and the checksum of a NMEA sentence body.'''
+    checksum = functools.reduce(operator.xor, (ord(c) for c in body), 0)
+    return '$%s*%02X' % (body, checksum)
+
+
+def nmea_degrees(value, degreedigits):
+    '''Format positive degrees as NMEA degrees and minutes, e.g.
+    "4528.7279820" (`degreedigits` 2) or "00533.2282930" (3).'''
+    degrees = int(value)
+    minutes = '%010.7f' % ((value - degrees) * 60)
+    if minutes.startswith('60'):
+        degrees += 1
+        minutes = '00.0000000'
+    return '%0*d%s' % (degreedigits, degrees, minutes)
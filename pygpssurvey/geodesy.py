@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.geodesy
+    -------------------
+
+    Distances and bearings on the WGS 84 ellipsoid, for the stake-out
+    guidance and the nearest target search.
+
+    `haversine`, `bearing` and `vincenty` take scalars, or sequences /
+    NumPy arrays of coordinates which are computed at once with NumPy when
+    it is installed. A `Target` caches the constants of its local tangent
+    plane (and of its UTM zone), so that the guidance towards it costs a
+    few multiplications by fix.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+import functools
+
+from .utils import cached_property, LazyModule
+
+utm = LazyModule('utm')
+
+#: WGS 84 semi-major axis (meters) and flattening.
+WGS84_A = 6378137.
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+#: Mean earth radius (meters) of the spherical formulas.
+EARTH_RADIUS = 6371008.8
+
+
+class _Math(object):
+    '''Scalar functions, with the names of the NumPy ones.'''
+    sin = staticmethod(math.sin)
+    cos = staticmethod(math.cos)
+    tan = staticmethod(math.tan)
+    sqrt = staticmethod(math.sqrt)
+    arctan = staticmethod(math.atan)
+    arctan2 = staticmethod(math.atan2)
+    arcsin = staticmethod(math.asin)
+    radians = staticmethod(math.radians)
+    degrees = staticmethod(math.degrees)
+    abs = staticmethod(abs)
+    max = staticmethod(lambda value: value)
+    minimum = staticmethod(min)
+
+    @staticmethod
+    def where(condition, value, other):
+        return value if condition else other
+
+
+def _is_array(value):
+    return hasattr(value, 'shape') or isinstance(value, (list, tuple))
+
+
+def vectorized(func):
+    '''Decorate a function written for the `_Math` or NumPy functions
+    (given as first argument), to call it with scalars or with sequences.
+    Without NumPy, the sequences are computed element by element.'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not any(_is_array(arg) for arg in args):
+            return func(_Math, *args, **kwargs)
+        try:
+            import numpy
+        except ImportError:
+            size = max(len(arg) for arg in args if _is_array(arg))
+            columns = [arg if _is_array(arg) else [arg] * size
+                       for arg in args]
+            return [func(_Math, *values, **kwargs)
+                    for values in zip(*columns)]
+        args = [numpy.asarray(arg, dtype=float) for arg in args]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return func(numpy, *args, **kwargs)
+    return wrapper
+
+
+@vectorized
+def haversine(m, lon1, lat1, lon2, lat2, radius=EARTH_RADIUS):
+    '''Great-circle distance (meters) between two points (degrees), on a
+    sphere of `radius`.'''
+    lat1 = m.radians(lat1)
+    lat2 = m.radians(lat2)
+    sindlat = m.sin((lat2 - lat1) / 2)
+    sindlon = m.sin(m.radians(lon2 - lon1) / 2)
+    h = sindlat * sindlat + m.cos(lat1) * m.cos(lat2) * sindlon * sindlon
+    return 2 * radius * m.arcsin(m.sqrt(m.minimum(h, 1.)))
+
+
+@vectorized
+def bearing(m, lon1, lat1, lon2, lat2):
+    '''Initial great-circle bearing (degrees from north, clockwise, in
+    [0, 360)) from the first point to the second.'''
+    lat1 = m.radians(lat1)
+    lat2 = m.radians(lat2)
+    dlon = m.radians(lon2 - lon1)
+    azimuth = m.degrees(m.arctan2(m.sin(dlon) * m.cos(lat2),
+                                  m.cos(lat1) * m.sin(lat2) -
+                                  m.sin(lat1) * m.cos(lat2) * m.cos(dlon)))
+    return (azimuth + 360.) % 360.
+
+
+@vectorized
+def vincenty(m, lon1, lat1, lon2, lat2, tolerance=1e-12, maxiter=200):
+    ''' Distance (meters) and initial bearing (degrees) between two points
+    on the WGS 84 ellipsoid, by Vincenty's inverse formula (sub-millimetre
+    accuracy; may not converge for nearly antipodal points).
+
+    :return: A tuple (distance, bearing).
+    '''
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+    u1 = m.arctan((1 - f) * m.tan(m.radians(lat1)))
+    u2 = m.arctan((1 - f) * m.tan(m.radians(lat2)))
+    sinu1, cosu1 = m.sin(u1), m.cos(u1)
+    sinu2, cosu2 = m.sin(u2), m.cos(u2)
+    dlon = m.radians(lon2 - lon1)
+    lam = dlon
+    for i in range(maxiter):
+        sinlam, coslam = m.sin(lam), m.cos(lam)
+        sinsigma = m.sqrt((cosu2 * sinlam) ** 2 +
+                          (cosu1 * sinu2 - sinu1 * cosu2 * coslam) ** 2)
+        cossigma = sinu1 * sinu2 + cosu1 * cosu2 * coslam
+        sigma = m.arctan2(sinsigma, cossigma)
+        # coincident points
+        sinalpha = (cosu1 * cosu2 * sinlam /
+                    m.where(sinsigma == 0, 1., sinsigma))
+        cos2alpha = 1 - sinalpha * sinalpha
+        # equatorial line
+        cos2sigmam = m.where(cos2alpha == 0, 0., cossigma - 2 * sinu1 *
+                             sinu2 / m.where(cos2alpha == 0, 1., cos2alpha))
+        c = f / 16 * cos2alpha * (4 + f * (4 - 3 * cos2alpha))
+        previous = lam
+        lam = dlon + (1 - c) * f * sinalpha * (
+            sigma + c * sinsigma * (cos2sigmam + c * cossigma *
+                                    (-1 + 2 * cos2sigmam * cos2sigmam)))
+        if m.max(m.abs(lam - previous)) < tolerance:
+            break
+    u2 = cos2alpha * (a * a - b * b) / (b * b)
+    ka = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    kb = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    dsigma = kb * sinsigma * (cos2sigmam + kb / 4 * (
+        cossigma * (-1 + 2 * cos2sigmam * cos2sigmam) -
+        kb / 6 * cos2sigmam * (-3 + 4 * sinsigma * sinsigma) *
+        (-3 + 4 * cos2sigmam * cos2sigmam)))
+    distance = b * ka * (sigma - dsigma)
+    azimuth = m.degrees(m.arctan2(cosu2 * m.sin(lam), cosu1 * sinu2 -
+                                  sinu1 * cosu2 * m.cos(lam)))
+    return distance, (azimuth + 360.) % 360.
+
+
+def nearest(lon, lat, lons, lats):
+    ''' Find the nearest point of `lons`, `lats` to (lon, lat).
+
+    :return: A tuple (index, distance in meters), (None, None) if there
+        are no points.
+    '''
+    if not len(lons):
+        return None, None
+    distances = haversine(lon, lat, lons, lats)
+    index = min(range(len(distances)), key=distances.__getitem__)
+    return index, float(distances[index])
+
+
+class LocalTangentPlane(object):
+    ''' East-north plane tangent to the WGS 84 ellipsoid at an origin.
+    The distances are accurate to the millimetre within about 100 m of the
+    origin, and the error grows with the square of the distance.
+
+    The radii of curvature of the origin are computed once, so that the
+    conversion of a position costs two subtractions and two
+    multiplications.
+
+    :param lon: Longitude of the origin (degrees).
+    :param lat: Latitude of the origin (degrees).
+    '''
+
+    def __init__(self, lon, lat):
+        self.lon = lon
+        self.lat = lat
+        sinlat = math.sin(math.radians(lat))
+        w2 = 1 - WGS84_E2 * sinlat * sinlat
+        # prime vertical and meridian radii of curvature
+        normal = WGS84_A / math.sqrt(w2)
+        meridian = WGS84_A * (1 - WGS84_E2) / (w2 * math.sqrt(w2))
+        #: Meters by degree of longitude and of latitude at the origin.
+        self.xscale = math.radians(normal * math.cos(math.radians(lat)))
+        self.yscale = math.radians(meridian)
+
+    def to_local(self, lon, lat):
+        '''Convert degrees (scalars or NumPy arrays) to (east, north)
+        meters from the origin.'''
+        return (lon - self.lon) * self.xscale, (lat - self.lat) * self.yscale
+
+    def to_lonlat(self, east, north):
+        '''Convert (east, north) meters from the origin to degrees.'''
+        return self.lon + east / self.xscale, self.lat + north / self.yscale
+
+    def distance(self, lon, lat):
+        '''Distance (meters) from the origin.'''
+        east, north = self.to_local(lon, lat)
+        return math.hypot(east, north)
+
+
+class Target(object):
+    ''' A point to stake out, with its cached guidance constants.
+
+    The guidance is computed in the local tangent plane of the target, and
+    with `vincenty` beyond `planerange` meters.
+
+    :param lon: Longitude (degrees).
+    :param lat: Latitude (degrees).
+    :param name: Name or number of the point.
+    :param zonenumber: UTM zone number forced for the UTM offsets (default:
+        the zone of the target).
+    :param zoneletter: UTM zone letter forced for the UTM offsets.
+    '''
+
+    #: Distance (meters) beyond which the local plane is not used.
+    planerange = 200.
+
+    def __init__(self, lon, lat, name='', zonenumber=None, zoneletter=None):
+        self.lon = lon
+        self.lat = lat
+        self.name = name
+        self.zonenumber = zonenumber or None
+        self.zoneletter = zoneletter
+
+    @classmethod
+    def from_row(cls, row, **kwargs):
+        ''' Build a target from a row of the input points file (number,
+        name, lon, lon_dir, lat, ...), None if it is not valid.'''
+        try:
+            return cls(float(row[2]), float(row[4]), row[0].strip(), **kwargs)
+        except (IndexError, ValueError):
+            return None
+
+    @cached_property
+    def plane(self):
+        '''`LocalTangentPlane` of the target.'''
+        return LocalTangentPlane(self.lon, self.lat)
+
+    def utm(self, lon, lat):
+        '''UTM (easting, northing) of a position, in the zone of the
+        target.'''
+        easting, northing, number, letter = utm.from_latlon(
+            lat, lon, self.zonenumber, self.zoneletter)
+        return easting, northing
+
+    @cached_property
+    def utmjacobian(self):
+        '''Derivatives of the UTM coordinates by the east and north local
+        coordinates at the target (grid scale factor and convergence),
+        from three UTM conversions.'''
+        step = 100.
+        easting, northing = self.utm(self.lon, self.lat)
+        eastlon, eastlat = self.plane.to_lonlat(step, 0.)
+        northlon, northlat = self.plane.to_lonlat(0., step)
+        e1, n1 = self.utm(eastlon, eastlat)
+        e2, n2 = self.utm(northlon, northlat)
+        return ((e1 - easting) / step, (e2 - easting) / step,
+                (n1 - northing) / step, (n2 - northing) / step)
+
+    def offset(self, lon, lat):
+        '''(east, north) offset (meters) of a position from the target.'''
+        return self.plane.to_local(lon, lat)
+
+    def utmoffset(self, lon, lat):
+        '''(easting, northing) UTM offset (meters) of a position from the
+        target.'''
+        east, north = self.plane.to_local(lon, lat)
+        de_dx, de_dy, dn_dx, dn_dy = self.utmjacobian
+        return de_dx * east + de_dy * north, dn_dx * east + dn_dy * north
+
+    def guidance(self, lon, lat):
+        ''' Guidance from a position to the target.
+
+        :return: A tuple (east offset, north offset, distance, bearing), the
+            offsets of the position from the target (meters), the distance
+            (meters) and the bearing (degrees) to walk to the target.
+        '''
+        east, north = self.plane.to_local(lon, lat)
+        distance = math.hypot(east, north)
+        if distance > self.planerange:
+            distance, azimuth = vincenty(lon, lat, self.lon, self.lat)
+        else:
+            azimuth = math.degrees(math.atan2(-east, -north)) % 360.
+        return east, north, distance, azimuth
+
+    def __repr__(self):
+        return '<Target %s %s %s>' % (self.name, self.lon, self.lat)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.kalman
+    ------------------
+
+    Constant-velocity Kalman filter smoothing the fixes of the live
+    display, e.g. the stake-out guidance.
+
+    The position is filtered in the local tangent plane of the first fix,
+    in meters. The state (position and velocity on the east, north and up
+    axes) and its covariance are a few floats by device, and the transition
+    and process noise terms are computed once by epoch interval.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+
+from .fix import Fix
+from .geodesy import LocalTangentPlane
+
+#: Horizontal standard deviation (meters) of the fixes by GGA quality,
+#: used when the fix has no error estimate (GST or UBX).
+QUALITY_SIGMA = {1: 3., 2: 1., 4: 0.02, 5: 0.3, 6: 10., 7: 1., 8: 1.}
+
+#: Vertical to horizontal standard deviation ratio of the fixes.
+VERTICAL_FACTOR = 2.
+
+
+def seconds_of_day(timestamp):
+    '''Seconds since midnight of a `datetime.time`, None if not known.'''
+    if timestamp is None:
+        return None
+    return (timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second +
+            timestamp.microsecond * 1e-6)
+
+
+def measurement_sigma(fix):
+    '''Horizontal standard deviation (meters) of a fix.'''
+    if fix.sigma:
+        return fix.sigma
+    return QUALITY_SIGMA.get(fix.quality, 3.)
+
+
+class KalmanFilter(object):
+    ''' Constant-velocity Kalman filter of a fix stream, in pure Python.
+
+    The three axes are independent, so each one is a 2-state filter
+    written out in scalars: an epoch costs a few dozen float operations.
+
+    :param processnoise: Acceleration noise spectral density (m²/s³); the
+        higher, the faster the filter follows the movements (default: 0.01,
+        walking with a pole).
+    :param interval: Epoch interval (seconds) when the fixes have no
+        timestamp (default: 1).
+    :param maxgap: The filter restarts after this number of seconds
+        without fix (default: 10).
+    '''
+
+    def __init__(self, processnoise=0.01, interval=1., maxgap=10.):
+        self.processnoise = processnoise
+        self.interval = interval
+        self.maxgap = maxgap
+        self.transitions = {}
+        self.reset()
+
+    def reset(self):
+        '''Forget the state, the next fix restarts the filter.'''
+        self.plane = None
+        self.time = None
+        # by axis: position, velocity, covariance (pp, pv, vv)
+        self.state = None
+
+    def terms(self, dt):
+        '''Transition and process noise terms of the interval `dt`.'''
+        q = self.processnoise
+        return (dt, dt * dt, q * dt ** 3 / 3, q * dt * dt / 2, q * dt)
+
+    def transition(self, dt):
+        '''Transition and process noise terms of the interval `dt`, cached
+        by interval.'''
+        terms = self.transitions.get(dt)
+        if terms is None:
+            terms = self.terms(dt)
+            if len(self.transitions) < 64:
+                self.transitions[dt] = terms
+        return terms
+
+    def interval_to(self, fix):
+        '''Interval (seconds) since the last fix filtered.'''
+        now = seconds_of_day(fix.timestamp)
+        last, self.time = self.time, now
+        if now is None or last is None:
+            return self.interval
+        dt = now - last
+        if dt < -43200:
+            dt += 86400     # midnight
+        return round(dt, 3) if dt > 0 else self.interval
+
+    def start(self, east, north, up, r, rup):
+        # unknown velocity: large variance
+        self.state = [[east, 0., r, 0., 100.], [north, 0., r, 0., 100.],
+                      [up, 0., rup, 0., 100.]]
+
+    def step(self, dt, measures, r, rup):
+        ''' Predict the state after `dt` and update it with the measured
+        (east, north, up) positions of variance `r` (horizontal) and `rup`
+        (vertical).'''
+        dt, dt2, q11, q12, q22 = self.transition(dt)
+        for axis, z, var in zip(self.state, measures, (r, r, rup)):
+            p, v, a, b, c = axis
+            # predict
+            p += v * dt
+            a += 2 * dt * b + dt2 * c + q11
+            b += dt * c + q12
+            c += q22
+            # update
+            s = a + var
+            k1 = a / s
+            k2 = b / s
+            y = z - p
+            axis[0] = p + k1 * y
+            axis[1] = v + k2 * y
+            axis[2] = a - k1 * a
+            axis[3] = b - k1 * b
+            axis[4] = c - k2 * b
+
+    def estimate(self):
+        '''Filtered (east, north, up) positions and their variances.'''
+        return ([axis[0] for axis in self.state],
+                [axis[2] for axis in self.state])
+
+    def update(self, fix):
+        ''' Filter a fix.
+
+        :param fix: A `Fix` with a position.
+        :return: A new `Fix` with the smoothed position, and its horizontal
+            standard deviation as `sigma`.
+        '''
+        if fix.lon is None or fix.lat is None:
+            return fix
+        sigma = measurement_sigma(fix)
+        r = sigma * sigma / 2       # by horizontal axis
+        rup = r * VERTICAL_FACTOR * VERTICAL_FACTOR
+        alt = fix.alt or 0.
+        if self.plane is None:
+            self.plane = LocalTangentPlane(fix.lon, fix.lat)
+            self.alt = alt
+        east, north = self.plane.to_local(fix.lon, fix.lat)
+        measures = (east, north, alt - self.alt)
+        dt = self.interval_to(fix)
+        if self.state is None or dt > self.maxgap:
+            self.start(east, north, alt - self.alt, r, rup)
+        else:
+            self.step(dt, measures, r, rup)
+        (east, north, up), variances = self.estimate()
+        lon, lat = self.plane.to_lonlat(east, north)
+        return Fix(timestamp=fix.timestamp,
+                   lon=lon, lon_dir=fix.lon_dir, lat=lat, lat_dir=fix.lat_dir,
+                   alt=self.alt + up if fix.alt is not None else None,
+                   alt_units=fix.alt_units, quality=fix.quality,
+                   numsats=fix.numsats, hdop=fix.hdop, diffage=fix.diffage,
+                   sigma=math.sqrt(variances[0] + variances[1]))
+
+    __call__ = update
+
+
+class NumpyKalmanFilter(KalmanFilter):
+    ''' Constant-velocity Kalman filter with the NumPy matrices: the 6-state
+    transition and process noise matrices are computed once by interval,
+    and an epoch is a few small matrix products.
+
+    Same parameters as `KalmanFilter`.
+    '''
+
+    def __init__(self, processnoise=0.01, interval=1., maxgap=10.):
+        import numpy
+        self.numpy = numpy
+        KalmanFilter.__init__(self, processnoise, interval, maxgap)
+
+    def transition(self, dt):
+        '''Transition and process noise matrices of the interval `dt`,
+        cached by interval.'''
+        matrices = self.transitions.get(dt)
+        if matrices is None:
+            np = self.numpy
+            dt, dt2, q11, q12, q22 = self.terms(dt)
+            # state: east, north, up positions then velocities
+            f = np.eye(6)
+            f[:3, 3:] = dt * np.eye(3)
+            q = np.zeros((6, 6))
+            q[:3, :3] = q11 * np.eye(3)
+            q[:3, 3:] = q[3:, :3] = q12 * np.eye(3)
+            q[3:, 3:] = q22 * np.eye(3)
+            matrices = (f, f.T.copy(), q)
+            if len(self.transitions) < 64:
+                self.transitions[dt] = matrices
+        return matrices
+
+    def start(self, east, north, up, r, rup):
+        np = self.numpy
+        self.state = np.array([east, north, up, 0., 0., 0.])
+        self.covariance = np.diag([r, r, rup, 100., 100., 100.])
+
+    def step(self, dt, measures, r, rup):
+        np = self.numpy
+        f, ft, q = self.transition(dt)
+        x = f.dot(self.state)
+        p = f.dot(self.covariance).dot(ft) + q
+        # the measure is the position: H = [I 0]
+        s = p[:3, :3] + np.diag((r, r, rup))
+        k = np.linalg.solve(s, p[:3, :]).T
+        self.state = x + k.dot(np.asarray(measures) - x[:3])
+        self.covariance = p - k.dot(p[:3, :])
+
+    def estimate(self):
+        diagonal = self.covariance.diagonal()
+        return self.state[:3].tolist(), diagonal[:3].tolist()
+
+
+def make_filter(backend='python', **kwargs):
+    ''' Create a fix smoothing filter.
+
+    :param backend: "python" or "numpy" (default: "python", faster by epoch
+        on this 6-state filter; see benchmarks/bench_kalman.py).
+    :param kwargs: `KalmanFilter` parameters.
+    '''
+    if backend == 'numpy':
+        return NumpyKalmanFilter(**kwargs)
+    if backend == 'python':
+        return KalmanFilter(**kwargs)
+    raise ValueError('backend must be "python" or "numpy"')
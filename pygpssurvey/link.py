@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.link
+    ----------------
+
+    Supervised `PyLink` connections, reconnected automatically, and a pool
+    to share the connections opened to the same URL.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import threading
+import time
+
+from .logger import LOGGER
+from .utils import retry, LazyModule
+
+pylink = LazyModule('pylink')
+
+
+class SupervisedLink(object):
+    '''Wraps a `PyLink` connection and reopens it when it fails, waiting
+    with an exponential backoff and jitter between attempts.
+
+    The first open is attempted for `opentimeout` seconds, then its error
+    is raised. After that, a read or write error, or no data received for
+    `stalltimeout` seconds (a dropped TCP connection only gives empty
+    reads), closes the link and reconnects it, for `reconnecttimeout`
+    seconds at a time. A failed read is retried once after reconnecting,
+    then returns no data, as the reads while the link is down, so the caller
+    keeps its state (partial sentence, point occupation) and handles its
+    commands across the reconnection. Each downtime is recorded in
+    `downtimes` as (start time, duration).
+
+    The link can be read and written by different threads (e.g. the RTCM
+    corrections forwarder): a reconnection waits for the reads and writes
+    in progress, and the next ones wait for the reconnection.
+
+    The attempts are made by `utils.retry`, whose counters are available
+    as "link.open" and "link.read" in `utils.retry_metrics`. The `aopen`,
+    `aread` coroutines are the asyncio versions of `open` and `read`.
+
+    :param link: A `PyLink` connection.
+    :param delay: Initial delay between reconnection attempts (seconds).
+    :param backoff: Factor by which the delay lengthens after each failure.
+    :param maxdelay: Maximum delay between attempts (seconds).
+    :param jitter: Random part of the delay, as a fraction of the delay.
+    :param stalltimeout: Reconnect after this number of seconds without
+        data, 0 to disable (default: 30).
+    :param opentimeout: Time budget of the first open (seconds), None to
+        retry until it succeeds (default: 10).
+    :param reconnecttimeout: Time budget of each reconnection (seconds),
+        tried again by the next read or write if it fails (default: 5).
+    '''
+
+    def __init__(self, link, delay=0.5, backoff=2., maxdelay=30., jitter=0.1,
+                 stalltimeout=30., opentimeout=10., reconnecttimeout=5.):
+        self.link = link
+        self.delay = delay
+        self.backoff = backoff
+        self.maxdelay = maxdelay
+        self.jitter = jitter
+        self.stalltimeout = stalltimeout
+        self.timeout = getattr(link, 'timeout', None)
+        self.downtimes = []
+        self.reconnects = 0
+        self.is_open = False
+        self.lastdata = None
+        self.downsince = None   # start time of the current downtime
+        self.poolurl = None     # URL of the link in its `LinkPool`
+        self.lock = threading.RLock()   # the link can be written by a thread
+        self.inflight = 0       # reads and writes in progress
+        self.idle = threading.Condition(self.lock)
+        self._firstconnect = self._retry('open', tries=None,
+                                         deadline=opentimeout)(self._open_once)
+        self._afirstconnect = self._retry('open', tries=None,
+                                          deadline=opentimeout)(self._aopen_once)
+        self._connect = self._retry('open', tries=None,
+                                    deadline=reconnecttimeout)(self._open_once)
+        self._read = self._retry('read', tries=2, delay=0,
+                                 on_retry=self.reconnect)(self._read_once)
+        self._aread = self._retry('read', tries=2, delay=0,
+                                  on_retry=self.areconnect)(self._aread_once)
+
+    def _io(self, func, *args, **kwargs):
+        '''Call a read or write of the underlying link, accounted in
+        `inflight` for the reconnections.'''
+        with self.lock:
+            self.inflight += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+                if not self.inflight:
+                    self.idle.notify_all()
+
+    def _read_once(self, size=None, timeout=None):
+        return self._io(self.link.read, size=size, timeout=timeout)
+
+    async def _aread_once(self, size=None, timeout=None):
+        return await self._executor(self._read_once, size, timeout)
+
+    async def _aopen_once(self):
+        return await self._executor(self._open_once)
+
+    @property
+    def url(self):
+        return self.link.url
+
+    @property
+    def total_downtime(self):
+        '''Sum of the recorded downtimes (seconds).'''
+        return sum(duration for start, duration in self.downtimes)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        self.link.settimeout(timeout)
+
+    @property
+    def connected(self):
+        '''True once the link has been opened.'''
+        return self.lastdata is not None
+
+    def open(self):
+        '''Open the link, retrying for `opentimeout` seconds the first time
+        (`reconnecttimeout` seconds after), then raising the error.'''
+        if not self.is_open:
+            with self.lock:
+                if not self.is_open:
+                    if self.connected:
+                        self._connect()
+                    else:
+                        self._firstconnect()
+
+    def close(self):
+        '''Close the link.'''
+        self.is_open = False
+        try:
+            self.link.close()
+        except Exception as e:
+            LOGGER.info('Close %s failed: %s' % (self.link, e))
+
+    def _retry(self, name, **kwargs):
+        '''Build the `retry` decorator of the link operation `name`.'''
+        settings = dict(delay=self.delay, backoff=self.backoff,
+                        maxdelay=self.maxdelay, jitter=self.jitter)
+        settings.update(kwargs)
+        return retry(name='link.' + name, **settings)
+
+    def _open_once(self):
+        '''Open the underlying link, closing it if it fails.'''
+        try:
+            self.link.open()
+            if self.timeout is not None:
+                self.link.settimeout(self.timeout)
+        except Exception as e:
+            LOGGER.info('Open %s failed: %s' % (self.link, e))
+            self.close()
+            raise
+        self.is_open = True
+        self.lastdata = time.time()
+
+    def reconnect(self, error=None):
+        ''' Close and reopen the link once the reads and writes in progress
+        are done, for `reconnecttimeout` seconds, recording the downtime.
+
+        :return: True if the link is restored.
+        '''
+        with self.lock:
+            if self.downsince is None:
+                self.downsince = time.time()
+                LOGGER.warning('Connection %s lost (%s), reconnecting'
+                               % (self.link, error or 'no data'))
+            while self.inflight:
+                self.idle.wait()
+            self.close()
+            try:
+                self._connect()
+            except Exception as e:
+                LOGGER.info('Connection %s not restored yet: %s'
+                            % (self.link, e))
+                return False
+            self._restored()
+            return True
+
+    def _restored(self):
+        start, self.downsince = self.downsince, None
+        self.reconnects += 1
+        self.downtimes.append((start, time.time() - start))
+        LOGGER.warning('Connection %s restored after %.1fs'
+                       % (self.link, self.downtimes[-1][1]))
+
+    def read(self, size=None, timeout=None):
+        '''Read data from the link, reconnecting it if it failed.
+        A failed read is retried once after reconnecting, no data is
+        returned while the link is down.'''
+        if not self.is_open and self.connected and not self.reconnect():
+            return b''
+        self.open()
+        try:
+            data = self._read(size=size, timeout=timeout)
+        except Exception as e:
+            self.reconnect(e)
+            return b''
+        return self._received(data)
+
+    def _received(self, data):
+        '''Check the link is not stalled, reconnect it otherwise.'''
+        now = time.time()
+        if len(data) > 0:
+            self.lastdata = now
+        elif self.stalltimeout and (now - self.lastdata > self.stalltimeout):
+            self.reconnect()
+        return data
+
+    def write(self, data):
+        '''Write data to the link, reconnecting it if it failed. A
+        `memoryview` is given as is to the socket links, copied otherwise.'''
+        if isinstance(data, memoryview) and not hasattr(self.link, 'send_to_socket'):
+            data = data.tobytes()   # the serial links only take bytes
+        if not self.is_open and self.connected and not self.reconnect():
+            raise IOError('Connection %s lost' % self.link)
+        self.open()
+        try:
+            self._io(self.link.write, data)
+        except Exception as e:
+            if not self.reconnect(e):
+                raise
+            self._io(self.link.write, data)
+
+    async def aopen(self):
+        '''Open the link without blocking the event loop (see `open`).'''
+        if not self.is_open:
+            if self.connected:
+                await self._executor(self.open)
+            else:
+                await self._afirstconnect()
+
+    async def areconnect(self, error=None):
+        '''Reconnect the link in an executor thread (see `reconnect`).'''
+        return await self._executor(self.reconnect, error)
+
+    async def aread(self, size=None, timeout=None):
+        '''Read data from the link in an executor thread, reconnecting it
+        if it failed.'''
+        if not self.is_open and self.connected and not await self.areconnect():
+            return b''
+        await self.aopen()
+        try:
+            data = await self._aread(size=size, timeout=timeout)
+        except Exception as e:
+            await self.areconnect(e)
+            return b''
+        now = time.time()
+        if len(data) > 0:
+            self.lastdata = now
+        elif self.stalltimeout and (now - self.lastdata > self.stalltimeout):
+            await self.areconnect()
+        return data
+
+    def _executor(self, func, *args):
+        from asyncio import get_event_loop
+        return get_event_loop().run_in_executor(None, func, *args)
+
+    def __str__(self):
+        return str(self.link)
+
+    def __repr__(self):
+        return '<SupervisedLink %s>' % self.link
+
+
+class LinkPool(object):
+    '''Shares one `SupervisedLink` between the users of the same URL, e.g.
+    several devices reading from one NTRIP/TCP gateway. The link is closed
+    when it is released by its last user.
+
+    :param kwargs: `SupervisedLink` parameters of the created links.
+    '''
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.links = {}
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url, timeout=None, **kwargs):
+        ''' Get the link of `url`, opening it if needed.
+
+        :param url: A `PyLink` connection URL.
+        :param timeout: Set a read timeout value.
+        :param kwargs: `SupervisedLink` parameters overriding the ones of
+            the pool, used if the link is created.
+        '''
+        with self.lock:
+            link = self.links.get(url)
+            if link is None:
+                settings = dict(self.kwargs)
+                settings.update(kwargs)
+                link = SupervisedLink(pylink.link_from_url(url), **settings)
+                if timeout is not None:
+                    link.settimeout(timeout)
+                link.poolurl = url
+                self.links[url] = link
+                self.users[url] = 0
+            self.users[url] += 1
+        link.open()
+        return link
+
+    def release(self, url):
+        '''Release the link of `url` (the URL given to `acquire`, kept in
+        the `poolurl` of the link), closing it if no longer used.'''
+        with self.lock:
+            if url not in self.users:
+                return
+            self.users[url] -= 1
+            if self.users[url] > 0:
+                return
+            link = self.links.pop(url)
+            del self.users[url]
+        link.close()
+
+    def close(self):
+        '''Close all the links.'''
+        with self.lock:
+            links = list(self.links.values())
+            self.links.clear()
+            self.users.clear()
+        for link in links:
+            link.close()
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.planner
+    -------------------
+
+    Stake-out planning: generation of regular grids of points from their
+    corners, and walking order of the points to stake out.
+
+    The points are projected in the local tangent plane of their centroid.
+    The route is built by nearest neighbour (with a bucket grid, so that
+    each step only looks at the cells around the current point), then
+    improved by 2-opt moves limited to the `k` nearest neighbours of each
+    point, with don't-look bits: large grids (10k+ points) are planned in
+    seconds.
+
+    The route is an open path (the crew does not come back to the first
+    point), starting from a given point.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import math
+from collections import deque
+
+from .geodesy import LocalTangentPlane, Target
+
+
+def grid(corners, spacing, yspacing=None):
+    ''' Generate a regular grid of points from its corners.
+
+    The grid has columns along the first edge (first to second corner) and
+    rows along the last edge (first to last corner), their numbers are
+    given by the longest side divided by the spacing (rounded), and the
+    points are interpolated between the corners, so that the corners are
+    points of the grid. The points are generated row by row, in a
+    serpentine order.
+
+    :param corners: 3 corners (lon, lat[, alt]) of a parallelogram, or the
+        4 corners of a quadrilateral, in order around it.
+    :param spacing: Distance (meters) between the columns.
+    :param yspacing: Distance (meters) between the rows (default:
+        `spacing`).
+    :return: A list of (row, column, lon, lat, alt), alt is None unless
+        all the corners have one.
+    '''
+    if len(corners) not in (3, 4):
+        raise ValueError('A grid needs 3 or 4 corners')
+    yspacing = yspacing or spacing
+    plane = LocalTangentPlane(corners[0][0], corners[0][1])
+    withalt = all(len(corner) > 2 for corner in corners)
+    points = [plane.to_local(corner[0], corner[1]) +
+              (corner[2] if withalt else None,) for corner in corners]
+    if len(points) == 3:
+        a, b, d = points
+        c = (b[0] + d[0] - a[0], b[1] + d[1] - a[1],
+             None if a[2] is None else b[2] + d[2] - a[2])
+    else:
+        a, b, c, d = points
+    length = lambda p, q: math.hypot(q[0] - p[0], q[1] - p[1])
+    columns = int(round(max(length(a, b), length(d, c)) / spacing)) + 1
+    rows = int(round(max(length(a, d), length(b, c)) / yspacing)) + 1
+    result = []
+    for row in range(rows):
+        v = row / (rows - 1) if rows > 1 else 0.
+        order = range(columns) if row % 2 == 0 else range(columns - 1, -1, -1)
+        for column in order:
+            u = column / (columns - 1) if columns > 1 else 0.
+            # bilinear interpolation between the corners
+            wa, wb, wc, wd = (1 - u) * (1 - v), u * (1 - v), u * v, (1 - u) * v
+            east = wa * a[0] + wb * b[0] + wc * c[0] + wd * d[0]
+            north = wa * a[1] + wb * b[1] + wc * c[1] + wd * d[1]
+            alt = (None if a[2] is None else
+                   wa * a[2] + wb * b[2] + wc * c[2] + wd * d[2])
+            lon, lat = plane.to_lonlat(east, north)
+            result.append((row + 1, column + 1, lon, lat, alt))
+    return result
+
+
+def grid_rows(points, delim=';', floatfmt='%.12g'):
+    ''' Format grid points as the lines of an input points file (number,
+    name "row-column", lon, lon_dir, lat, lat_dir, alt, alt_units); the
+    coordinates are signed decimal degrees, as in the points output, the
+    direction letters only follow their sign.'''
+    lines = [delim.join(('pointnum', 'pointname', 'lon', 'lon_dir', 'lat',
+                         'lat_dir', 'alt', 'alt_units')) + '\n']
+    for num, (row, column, lon, lat, alt) in enumerate(points, 1):
+        lines.append(delim.join((
+            str(num), '%d-%d' % (row, column), floatfmt % lon,
+            'E' if lon >= 0 else 'W', floatfmt % lat,
+            'N' if lat >= 0 else 'S',
+            '' if alt is None else floatfmt % alt, 'M')) + '\n')
+    return lines
+
+
+class Buckets(object):
+    ''' Points in the square cells of a grid, to find the nearest ones by
+    looking at the rings of cells around a position.
+
+    :param xs: X coordinates of the points.
+    :param ys: Y coordinates of the points.
+    :param perbucket: Mean number of points by cell.
+    '''
+
+    def __init__(self, xs, ys, perbucket=2):
+        self.xs = xs
+        self.ys = ys
+        self.minx = min(xs)
+        self.miny = min(ys)
+        width = max(xs) - self.minx
+        height = max(ys) - self.miny
+        area = max(width * height, (max(width, height) or 1.) ** 2 / len(xs))
+        self.size = math.sqrt(area * perbucket / len(xs)) or 1.
+        self.maxring = int(max(width, height) / self.size) + 1
+        self.cells = {}
+        for i in range(len(xs)):
+            self.cells.setdefault(self.cell(xs[i], ys[i]), []).append(i)
+        self.count = len(xs)
+
+    def cell(self, x, y):
+        return (int((x - self.minx) // self.size),
+                int((y - self.miny) // self.size))
+
+    def remove(self, i):
+        key = self.cell(self.xs[i], self.ys[i])
+        bucket = self.cells[key]
+        bucket.remove(i)
+        if not bucket:
+            del self.cells[key]
+        self.count -= 1
+
+    def ring(self, cx, cy, r):
+        '''Points of the cells at ring distance `r` around a cell.'''
+        cells = self.cells
+        if r == 0:
+            return cells.get((cx, cy), ())
+        points = []
+        for x in range(cx - r, cx + r + 1):
+            points.extend(cells.get((x, cy - r), ()))
+            points.extend(cells.get((x, cy + r), ()))
+        for y in range(cy - r + 1, cy + r):
+            points.extend(cells.get((cx - r, y), ()))
+            points.extend(cells.get((cx + r, y), ()))
+        return points
+
+    def nearest(self, x, y, k=1, exclude=None):
+        ''' Indices of the `k` nearest points of (x, y), nearest first.
+
+        :param exclude: Index of a point to skip.
+        '''
+        xs, ys = self.xs, self.ys
+        cx, cy = self.cell(x, y)
+        found = []
+        r = 0
+        while r <= self.maxring + max(abs(cx), abs(cy)):
+            for i in self.ring(cx, cy, r):
+                if i != exclude:
+                    dx = xs[i] - x
+                    dy = ys[i] - y
+                    found.append((dx * dx + dy * dy, i))
+            # the cells beyond the ring are at least r cells away
+            if len(found) >= k:
+                found.sort()
+                bound = r * self.size
+                if found[k - 1][0] <= bound * bound:
+                    break
+            r += 1
+        found.sort()
+        return [i for d, i in found[:k]]
+
+
+def nearest_neighbour_tour(xs, ys, start=0):
+    '''Open path visiting the points, always going to the nearest point not
+    visited yet.'''
+    buckets = Buckets(xs, ys)
+    tour = [start]
+    buckets.remove(start)
+    current = start
+    while buckets.count:
+        current = buckets.nearest(xs[current], ys[current])[0]
+        buckets.remove(current)
+        tour.append(current)
+    return tour
+
+
+def two_opt(xs, ys, tour, k=8):
+    ''' Improve an open path with 2-opt moves: reversing a part of the path
+    when it shortens it. Only the moves joining a point to one of its `k`
+    nearest neighbours are tried, and the points whose neighbourhood did not
+    change are not looked at again (don't-look bits).
+
+    The first point of the path is kept.
+
+    :return: The improved path (the list is modified).
+    '''
+    n = len(tour)
+    if n < 4:
+        return tour
+    buckets = Buckets(xs, ys)
+    neighbours = [buckets.nearest(xs[i], ys[i], k, exclude=i)
+                  for i in range(n)]
+    pos = [0] * n
+    for index, point in enumerate(tour):
+        pos[point] = index
+
+    def dist(p, q):
+        if p is None or q is None:
+            return 0.
+        return math.hypot(xs[p] - xs[q], ys[p] - ys[q])
+
+    def reverse(i, j):
+        '''Reverse tour[i + 1:j + 1].'''
+        segment = tour[i + 1:j + 1]
+        segment.reverse()
+        tour[i + 1:j + 1] = segment
+        for index in range(i + 1, j + 1):
+            pos[tour[index]] = index
+
+    queue = deque(tour)
+    queued = [True] * n
+    while queue:
+        a = queue.popleft()
+        queued[a] = False
+        improved = False
+        for direction in (1, -1):
+            i = pos[a]
+            ib = i + direction
+            b = tour[ib] if 0 <= ib < n else None
+            dab = dist(a, b)
+            for c in neighbours[a]:
+                dac = dist(a, c)
+                if dac >= dab:
+                    break
+                j = pos[c]
+                jd = j + direction
+                d = tour[jd] if 0 <= jd < n else None
+                if c == b or d == a:
+                    continue
+                delta = dac + dist(b, d) - dab - dist(c, d)
+                if delta >= -1e-9:
+                    continue
+                if direction == 1:
+                    lo, hi = min(i, j), max(i, j)
+                else:
+                    lo, hi = min(i, j) - 1, max(i, j) - 1
+                if lo < 0:
+                    # the first point is kept at the start of the path
+                    continue
+                reverse(lo, hi)
+                for point in (a, b, c, d):
+                    if point is not None and not queued[point]:
+                        queued[point] = True
+                        queue.append(point)
+                improved = True
+                break
+            if improved:
+                break
+    return tour
+
+
+def path_length(xs, ys, tour):
+    '''Length of an open path.'''
+    return sum(math.hypot(xs[p] - xs[q], ys[p] - ys[q])
+               for p, q in zip(tour, tour[1:]))
+
+
+def plan(lons, lats, start=0, k=8):
+    ''' Walking order of points.
+
+    :param lons: Longitudes of the points (degrees).
+    :param lats: Latitudes of the points (degrees).
+    :param start: Index of the first point.
+    :param k: Number of neighbours tried by point in the 2-opt moves.
+    :return: The indices of the points, in walking order.
+    '''
+    if not lons:
+        return []
+    plane = LocalTangentPlane(sum(lons) / len(lons), sum(lats) / len(lats))
+    xs, ys = [], []
+    for lon, lat in zip(lons, lats):
+        x, y = plane.to_local(lon, lat)
+        xs.append(x)
+        ys.append(y)
+    tour = nearest_neighbour_tour(xs, ys, start)
+    return two_opt(xs, ys, tour, k)
+
+
+def reorder(pointslist, start=None):
+    ''' Reorder the rows of an input points file in walking order.
+
+    The rows which are not valid points (e.g. the header) are kept before
+    the points.
+
+    :param pointslist: Rows (lists of the fields) of the file.
+    :param start: (lon, lat) from where the walk starts (default: the first
+        point).
+    :return: The reordered rows.
+    '''
+    header, rows, targets = [], [], []
+    for row in pointslist:
+        target = Target.from_row(row)
+        if target is None:
+            header.append(row)
+        else:
+            rows.append(row)
+            targets.append(target)
+    if not rows:
+        return list(pointslist)
+    lons = [target.lon for target in targets]
+    lats = [target.lat for target in targets]
+    first = 0
+    if start is not None:
+        from .geodesy import nearest
+        first = nearest(start[0], start[1], lons, lats)[0]
+    return header + [rows[i] for i in plan(lons, lats, first)]
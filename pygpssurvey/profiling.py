@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.profiling
+    ---------------------
+
+    Profiling of the acquisition: a `Profiler` running the command under
+    cProfile (pstats file) or under a sampling thread (collapsed stacks,
+    for flame graphs), and the wall-clock `Timings` of the stages of the
+    acquisition loops.
+
+    The stages are timed by spans, used as ``with timings.read:``. When the
+    timings are disabled (`NULL_TIMINGS`, the default), every stage is the
+    same no-op span, so the loops only pay an attribute lookup.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import os
+import sys
+import threading
+from time import perf_counter_ns
+from collections import Counter
+
+from .logger import LOGGER
+from .compat import OrderedDict
+
+#: Stages of the acquisition: link read, lines split and UBX frames
+#: reassembly, NMEA parsing and fix decoding, fix filtering, stake-out
+#: guidance, capture writing.
+STAGES = ('read', 'frame', 'parse', 'filter', 'project', 'write')
+
+PROFILERS = ('cprofile', 'sampling')
+
+
+class Span(object):
+    ''' Timer of a stage, accumulating the count, total and maximum
+    durations (nanoseconds) of its ``with`` blocks. A span is used by one
+    thread at a time.
+    '''
+
+    __slots__ = ('name', 'count', 'total', 'max', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = perf_counter_ns() - self.start
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class NullSpan(object):
+    '''Span doing nothing, when the timings are disabled.'''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Timings(object):
+    ''' Spans of the stages, as attributes (e.g. ``timings.read``), so the
+    stage names must not be the names of the methods.
+
+    :param stages: Names of the stages.
+    :param enabled: If False, all the stages are `NULL_SPAN`.
+    '''
+
+    def __init__(self, stages=STAGES, enabled=True):
+        self.enabled = enabled
+        self.spans = OrderedDict((name, Span(name) if enabled else NULL_SPAN)
+                                 for name in stages)
+        for name, span in self.spans.items():
+            setattr(self, name, span)
+
+    def report(self):
+        '''Lines of the timings table.'''
+        lines = ['%-8s %10s %12s %10s %10s' % ('stage', 'count', 'total ms',
+                                               'mean us', 'max us')]
+        if not self.enabled:
+            return lines
+        for span in self.spans.values():
+            lines.append('%-8s %10d %12.1f %10.1f %10.1f'
+                         % (span.name, span.count, span.total / 1e6,
+                            span.total / span.count / 1e3 if span.count
+                            else 0., span.max / 1e3))
+        return lines
+
+    def save(self, filename):
+        '''Write the timings table to a file and log it.'''
+        lines = self.report()
+        with open(filename, 'w') as output:
+            output.write('\n'.join(lines) + '\n')
+        LOGGER.info('stage timings:\n%s' % '\n'.join(lines))
+
+
+#: Disabled timings, the default of the acquisition.
+NULL_TIMINGS = Timings(enabled=False)
+
+
+class SamplingProfiler(threading.Thread):
+    ''' Samples the stack of a thread at a fixed interval, and counts the
+    collapsed stacks ("outer;...;inner").
+
+    :param interval: Seconds between two samples.
+    :param thread: Ident of the profiled thread (default: the current one).
+    '''
+
+    def __init__(self, interval=0.005, thread=None):
+        threading.Thread.__init__(self, name='sampling-profiler')
+        self.daemon = True
+        self.interval = interval
+        self.target = thread or threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = '%s (%s:%d)' % (
+                        code.co_name, os.path.basename(code.co_filename),
+                        code.co_firstlineno)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, filename):
+        '''Write the collapsed stacks, one "stack count" by line.'''
+        with open(filename, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write('%s %d\n' % (stack, count))
+
+
+class Profiler(object):
+    ''' Profile the code run between `start` and `stop` (or in a ``with``
+    block), then write the profile.
+
+    :param filename: File where the profile is written: pstats for
+        "cprofile" (read it with `pstats` or snakeviz), collapsed stacks for
+        "sampling" (read it with flamegraph.pl or speedscope).
+    :param mode: "cprofile" or "sampling".
+    :param interval: Sampling interval (seconds).
+    '''
+
+    def __init__(self, filename, mode='cprofile', interval=0.005):
+        if mode not in PROFILERS:
+            raise ValueError('profiler must be one of %s'
+                             % ', '.join(PROFILERS))
+        self.filename = filename
+        self.mode = mode
+        self.interval = interval
+        self.profiler = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler(self.interval)
+            self.profiler.start()
+        return self
+
+    def stop(self):
+        '''Stop profiling and write the profile.'''
+        if self.mode == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(self.filename)
+        else:
+            self.profiler.stop()
+            self.profiler.write(self.filename)
+        LOGGER.info('%s profile written to %s' % (self.mode, self.filename))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.ringbuffer
+    ----------------------
+
+    Ring buffer of the last decoded epochs, for the retroactive point
+    captures ("average the last 10 seconds").
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import time
+from array import array
+
+
+class EpochRing(object):
+    ''' Fixed-size ring of the last epochs: their reception time and
+    sequence number in preallocated arrays, and their `Fix`.
+
+    Appending an epoch overwrites the oldest one in place, without any
+    allocation; the epochs of a time window are found from the newest one
+    backwards, in O(window).
+
+    :param capacity: Number of epochs kept (default: 1024, 17 minutes at
+        1 Hz, 100 seconds at 10 Hz).
+    '''
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.sequences = array('q', bytes(8 * capacity))
+        self.fixes = [None] * capacity
+        self.head = 0   # index of the next epoch
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, sequence, fix, received=None):
+        ''' Add an epoch, overwriting the oldest one if the ring is full.
+
+        :param sequence: Sequence number of the epoch.
+        :param fix: Its `Fix`.
+        :param received: Its reception time (default: now).
+        '''
+        i = self.head
+        self.times[i] = time.time() if received is None else received
+        self.sequences[i] = sequence
+        self.fixes[i] = fix
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def indices(self, since=None, count=None):
+        ''' Indices of the newest epochs, oldest first: those received at
+        or after the time `since`, at most `count` of them.'''
+        times = self.times
+        capacity = self.capacity
+        limit = self.count if count is None else min(count, self.count)
+        result = []
+        i = self.head
+        for n in range(limit):
+            i = i - 1 if i else capacity - 1
+            if since is not None and times[i] < since:
+                break
+            result.append(i)
+        result.reverse()
+        return result
+
+    def window(self, seconds, now=None):
+        ''' Epochs of the last `seconds`, oldest first.
+
+        :return: A list of (sequence, reception time, `Fix`).
+        '''
+        since = (time.time() if now is None else now) - seconds
+        return [(self.sequences[i], self.times[i], self.fixes[i])
+                for i in self.indices(since=since)]
+
+    def last(self, count):
+        ''' Last `count` epochs, oldest first, as (sequence, reception time,
+        `Fix`).'''
+        return [(self.sequences[i], self.times[i], self.fixes[i])
+                for i in self.indices(count=count)]
+
+    def clear(self):
+        '''Forget the epochs (the arrays are kept).'''
+        self.fixes = [None] * self.capacity
+        self.head = 0
+        self.count = 0
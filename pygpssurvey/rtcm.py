@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.rtcm
+    ----------------
+
+    RTCM3 corrections forwarding, from a base station or NTRIP gateway to
+    the rover board, while its frames are read on the same link.
+
+    The RTCM3 frames are ``0xD3 length(10 bits) payload CRC-24Q``, they are
+    checked and forwarded as is, without decoding the payloads (except the
+    message number, and the epoch time of the GPS and Galileo observations,
+    which paces the corrections replayed from a file).
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import threading
+import time
+from collections import Counter
+
+from .logger import LOGGER
+from .utils import get_bits
+from .compat import OrderedDict
+
+PREAMBLE = 0xd3
+
+CRC24Q_POLY = 0x1864cfb
+
+#: Messages starting with a 30 bits GPS time of week (ms) after the message
+#: number and the station id: GPS observations (1001-1004), GPS and Galileo
+#: MSM (1071-1077, 1091-1097).
+EPOCH_MESSAGES = frozenset(list(range(1001, 1005)) + list(range(1071, 1078)) +
+                           list(range(1091, 1098)))
+
+WEEK_MS = 7 * 24 * 3600 * 1000
+
+
+def _crc24q_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for i in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= CRC24Q_POLY
+        table.append(crc & 0xffffff)
+    return tuple(table)
+
+CRC24Q_TABLE = _crc24q_table()
+
+
+def crc24q(data):
+    '''Compute the CRC-24Q of `data`.'''
+    crc = 0
+    table = CRC24Q_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xffffff) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+
+def rtcm3_frame(payload):
+    '''Build a RTCM3 frame from its payload.'''
+    header = bytes((PREAMBLE, (len(payload) >> 8) & 0x03, len(payload) & 0xff))
+    body = header + bytes(payload)
+    return body + crc24q(body).to_bytes(3, 'big')
+
+
+class RTCM3Framer(object):
+    '''Frames a RTCM3 stream in a preallocated buffer.
+
+    Received data is copied once into the buffer (or read directly into it
+    with `readinto`), and the runs of consecutive valid frames (or each
+    frame) are given as `memoryview` slices of the buffer.
+
+    :param size: Size of the buffer (default: 16 KB, more than 15 frames of
+        the maximum length).
+    '''
+
+    def __init__(self, size=16384):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.frames = 0
+        self.badframes = 0
+        self.messages = Counter()
+        self.epoch = None   # epoch time of the last frame, see `EPOCH_MESSAGES`
+
+    def space(self):
+        '''Free part of the buffer, to read data into.'''
+        return self.view[self.length:]
+
+    def commit(self, size):
+        '''Account for `size` bytes read into `space`.'''
+        self.length += size
+
+    def feed(self, data):
+        '''Copy received data into the buffer.'''
+        size = len(data)
+        if self.length + size > len(self.buffer):
+            LOGGER.info('RTCM3 buffer overflow, %d bytes dropped'
+                        % self.length)
+            self.length = 0
+            data = data[-len(self.buffer):]
+            size = len(data)
+        self.buffer[self.length:self.length + size] = data
+        self.length += size
+
+    def process(self, write, runs=True):
+        ''' Find the complete frames of the buffer, calling `write` with each
+        run of consecutive valid frames, then discard the processed data.
+
+        :param write: Callable called with a `memoryview` of the frames,
+            only valid during the call.
+        :param runs: If False, `write` is called with each frame, `epoch`
+            being its GPS time of week (ms), or None if it has none.
+        '''
+        buf = self.buffer
+        view = self.view
+        length = self.length
+        pos = 0
+        runstart = runend = None
+        while True:
+            start = buf.find(PREAMBLE, pos, length)
+            if start < 0:
+                pos = length
+                break
+            if length - start < 6:
+                pos = start
+                break
+            if buf[start + 1] & 0xfc:
+                # reserved bits set, not a frame start
+                pos = start + 1
+                continue
+            end = start + 6 + (((buf[start + 1] & 0x03) << 8) | buf[start + 2])
+            if end > length:
+                pos = start
+                break
+            if crc24q(view[start:end - 3]) != int.from_bytes(view[end - 3:end], 'big'):
+                self.badframes += 1
+                pos = start + 1
+                continue
+            self.frames += 1
+            message = None
+            if end - start >= 8:
+                message = get_bits(view[start + 3:start + 5], 0, 12)
+                self.messages[message] += 1
+            if not runs:
+                self.epoch = (get_bits(view[start + 3:start + 10], 24, 30)
+                              if message in EPOCH_MESSAGES and
+                              end - start >= 13 else None)
+                write(view[start:end])
+                pos = end
+                continue
+            if runend != start:
+                if runstart is not None:
+                    write(view[runstart:runend])
+                runstart = start
+            runend = end
+            pos = end
+        if runstart is not None:
+            write(view[runstart:runend])
+        # keep the unprocessed data at the beginning of the buffer
+        rest = length - pos
+        if rest and pos:
+            buf[:rest] = buf[pos:length]
+        self.length = rest
+
+
+class CorrectionForwarder(threading.Thread):
+    '''Thread reading RTCM3 corrections from `source` and writing the valid
+    frames to `target`, e.g. the rover link read by `GPSSurvey`.
+
+    The frames are written as `memoryview` slices of the framer buffer.
+
+    The corrections recorded in a file are paced: each frame is forwarded
+    at the time of its epoch relative to the first one (GPS and Galileo
+    observations), the other frames with the observations, or at
+    `framerate` if the file has no observations.
+
+    :param source: A `PyLink` link or a binary file object (read with
+        `readinto` when available).
+    :param target: A link (or file object) to write the frames to.
+    :param readsize: Maximum number of bytes read at once.
+    :param timeout: Read timeout of the source (seconds).
+    :param reportinterval: Interval of the statistics logs (seconds),
+        0 to disable.
+    :param pace: Pace the frames (default: None, if the source is a file).
+    :param framerate: Frames by second forwarded when pacing frames without
+        epoch time (default: 10).
+    '''
+
+    #: Epoch jumps (seconds) after which the pacing is synchronized again,
+    #: e.g. at the end of a recording concatenated with another one.
+    MAXJUMP = 60.
+
+    def __init__(self, source, target, readsize=1024, timeout=0.1,
+                 reportinterval=60., pace=None, framerate=10.):
+        threading.Thread.__init__(self, name='rtcm-forwarder')
+        self.daemon = True
+        self.source = source
+        self.target = target
+        self.readsize = readsize
+        self.timeout = timeout
+        self.reportinterval = reportinterval
+        self.framer = RTCM3Framer()
+        self.stopped = threading.Event()
+        self.begin = None
+        self.lastframe = None
+        self.forwarded = 0
+        self.errors = 0
+        if pace is None:
+            pace = hasattr(source, 'readinto')
+        self.pace = pace
+        self.framerate = framerate
+        self.clock = None   # (epoch ms, time) of the pacing reference
+        self.nextframe = None   # time of the next frame without epoch time
+
+    def read(self):
+        '''Read the available data of the source into the framer.'''
+        readinto = getattr(self.source, 'readinto', None)
+        if readinto is not None:
+            space = self.framer.space()
+            size = readinto(space[:self.readsize])
+            if not size:
+                # end of file, or no data on a non-blocking stream
+                time.sleep(self.timeout)
+                return
+            self.framer.commit(size)
+        else:
+            data = self.source.read(size=self.readsize, timeout=self.timeout)
+            if len(data) == 0:
+                return
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            self.framer.feed(data)
+
+    def wait(self, delay):
+        '''Wait `delay` seconds, or until the forwarder is stopped.'''
+        if delay > 0:
+            self.stopped.wait(delay)
+
+    def pacedwrite(self, frame):
+        '''Forward a frame at the time of its epoch.'''
+        epoch = self.framer.epoch
+        now = time.time()
+        if epoch is not None:
+            if self.clock is not None:
+                delay = ((epoch - self.clock[0]) % WEEK_MS) / 1000. - (now - self.clock[1])
+                if delay > self.MAXJUMP:
+                    self.clock = None
+                else:
+                    self.wait(delay)
+            if self.clock is None:
+                self.clock = (epoch, now)
+        elif self.clock is None:
+            # no observations seen yet, paced at the frame rate
+            if self.nextframe is not None:
+                self.wait(self.nextframe - now)
+            self.nextframe = max(now, self.nextframe or now) + 1. / self.framerate
+        if not self.stopped.is_set():
+            self.write(frame)
+
+    def write(self, frames):
+        '''Forward a run of frames (`memoryview`) to the target.'''
+        try:
+            self.target.write(frames)
+        except Exception as e:
+            self.errors += 1
+            LOGGER.info('RTCM3 forwarding failed: %s' % e)
+            return
+        self.forwarded += len(frames)
+        self.lastframe = time.time()
+
+    def run(self):
+        self.begin = lastreport = time.time()
+        while not self.stopped.is_set():
+            try:
+                self.read()
+            except Exception as e:
+                self.errors += 1
+                LOGGER.info('RTCM3 source read failed: %s' % e)
+                time.sleep(self.timeout)
+                continue
+            if self.pace:
+                self.framer.process(self.pacedwrite, runs=False)
+            else:
+                self.framer.process(self.write)
+            if self.reportinterval and (time.time() - lastreport >
+                                        self.reportinterval):
+                self.report()
+                lastreport = time.time()
+
+    def stop(self, timeout=None):
+        '''Stop forwarding and wait for the thread end.'''
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    @property
+    def age(self):
+        '''Time since the last frame forwarded (seconds), None if no frame
+        was forwarded.'''
+        if self.lastframe is None:
+            return None
+        return time.time() - self.lastframe
+
+    def stats(self):
+        '''Return the forwarding statistics.'''
+        elapsed = time.time() - self.begin if self.begin else 0.
+        stats = OrderedDict()
+        stats['frames'] = self.framer.frames
+        stats['badframes'] = self.framer.badframes
+        stats['bytes'] = self.forwarded
+        stats['throughput'] = self.forwarded / elapsed if elapsed else 0.
+        stats['age'] = self.age
+        stats['errors'] = self.errors
+        stats['messages'] = dict(self.framer.messages)
+        return stats
+
+    def report(self):
+        '''Log the forwarding statistics.'''
+        stats = self.stats()
+        age = stats['age']
+        LOGGER.info('RTCM3 corrections: %d frames (%d bad), %d bytes, '
+                    '%.0f B/s, age %s, messages %s'
+                    % (stats['frames'], stats['badframes'], stats['bytes'],
+                       stats['throughput'],
+                       'none' if age is None else '%.1fs' % age,
+                       ', '.join('%d: %d' % item for item in
+                                 sorted(stats['messages'].items()))))
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.server
+    ------------------
+
+    Local HTTP server publishing the live fixes of a device to several
+    clients (tablet, laptop...), with the stdlib `asyncio` only.
+
+    - ``GET /fix``: the latest fix (JSON);
+    - ``GET /stats``: the server and device statistics (JSON);
+    - ``GET /events?rate=2``: the fixes as server-sent events;
+    - ``GET /ws?rate=2``: the fixes over a WebSocket, whose text messages
+      are commands (e.g. "M");
+    - ``POST /capture``, ``POST /undo``, ``POST /command`` (body: the keys):
+      queue commands, as the keys M, D or the body.
+
+    ``rate`` is the maximum number of fixes by second sent to the client
+    (default: every fix). Each fix is serialized and framed once when it is
+    published, all the clients are sent the same bytes; a client slower
+    than the fixes only gets the latest one.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from .logger import LOGGER
+from .compat import OrderedDict
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request',
+           404: 'Not Found', 405: 'Method Not Allowed',
+           503: 'Service Unavailable'}
+
+#: Commands of the capture and undo requests.
+CAPTURE = 'M'
+UNDO = 'D'
+
+
+def websocket_accept(key):
+    '''Sec-WebSocket-Accept value of a Sec-WebSocket-Key.'''
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def websocket_frame(payload, opcode=0x1):
+    '''Build an unmasked (server) WebSocket frame.'''
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader):
+    '''Read a WebSocket frame, return (opcode, payload).'''
+    first, second = await reader.readexactly(2)
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return first & 0x0f, payload
+
+
+class Message(object):
+    '''A published JSON document, encoded and framed once for all the
+    clients.'''
+    __slots__ = ('version', 'json', 'event', 'frame')
+
+    def __init__(self, version, data):
+        self.version = version
+        self.json = json.dumps(data).encode('utf-8')
+        self.event = b'data: ' + self.json + b'\n\n'
+        self.frame = websocket_frame(self.json)
+
+
+class LiveServer(object):
+    ''' HTTP/SSE/WebSocket server of the live fixes, running its event loop
+    in a thread: `publish` is called by the reading thread.
+
+    :param host: Listening address (default: "localhost").
+    :param port: Listening port (default: 8080; 0 for any free port).
+    :param commands: The `commands.Commands` queue of the acquisition loop,
+        where the capture/undo commands are put.
+    :param stats: Callable returning the device statistics (a dict).
+    :param maxclients: Maximum number of streaming clients.
+    '''
+
+    def __init__(self, host='localhost', port=8080, commands=None, stats=None,
+                 maxclients=1000):
+        self.host = host
+        self.port = port
+        self.commands = commands
+        self.devicestats = stats
+        self.maxclients = maxclients
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+        self.latest = None
+        self.changed = None
+        self.published = 0
+        self.sent = 0
+        self.clients = 0
+        self.begin = time.time()
+
+    # -- publishing
+
+    def publish(self, fix):
+        '''Publish a `Fix` (thread safe): it is serialized once here.'''
+        data = fix.to_dict()
+        data['time'] = time.time()
+        message = Message(self.published + 1, data)
+        self.published += 1
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._publish, message)
+
+    def _publish(self, message):
+        self.latest = message
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def next_message(self, version, interval):
+        ''' Wait for a message newer than `version`, at most one by
+        `interval` seconds.'''
+        if interval:
+            await asyncio.sleep(interval)
+        while self.latest is None or self.latest.version <= version:
+            await self.changed.wait()
+        return self.latest
+
+    def stats(self):
+        '''Return the server statistics, and those of the device.'''
+        stats = OrderedDict()
+        stats['uptime'] = time.time() - self.begin
+        stats['published'] = self.published
+        stats['sent'] = self.sent
+        stats['clients'] = self.clients
+        if self.devicestats is not None:
+            stats['device'] = self.devicestats()
+        return stats
+
+    # -- HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ', 2)
+            headers = dict((name.strip().lower(), value.strip()) for name, _,
+                           value in (line.partition(':') for line in lines[1:]
+                                     if line))
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+            await self.route(method, url.path, query, headers, reader, writer)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.CancelledError, ConnectionError, ValueError):
+            # client gone, bad request, or server stopped
+            pass
+        except Exception as e:
+            LOGGER.info('HTTP client error: %s' % e)
+        finally:
+            writer.close()
+
+    async def route(self, method, path, query, headers, reader, writer):
+        if path in ('/fix', '/stats'):
+            if method != 'GET':
+                return await self.respond(writer, 405)
+            if path == '/stats':
+                body = json.dumps(self.stats()).encode('utf-8')
+            else:
+                body = self.latest.json if self.latest else b'null'
+            return await self.respond(writer, 200, body)
+        if path in ('/capture', '/undo', '/command'):
+            if method != 'POST':
+                return await self.respond(writer, 405)
+            if self.commands is None:
+                return await self.respond(writer, 503)
+            if path == '/command':
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(min(length, 1024))
+                self.command(body.decode('utf-8', 'replace'))
+            else:
+                self.command(CAPTURE if path == '/capture' else UNDO)
+            return await self.respond(writer, 204)
+        if path in ('/events', '/ws'):
+            if method != 'GET':
+                return await self.respond(writer, 405)
+            if self.clients >= self.maxclients:
+                return await self.respond(writer, 503)
+            try:
+                rate = float(query.get('rate', ['0'])[0])
+            except ValueError:
+                return await self.respond(writer, 400)
+            interval = 1. / rate if rate > 0 else 0.
+            self.clients += 1
+            try:
+                if path == '/events':
+                    await self.stream_events(writer, interval)
+                else:
+                    await self.stream_websocket(reader, writer, headers,
+                                                interval)
+            finally:
+                self.clients -= 1
+            return
+        await self.respond(writer, 404)
+
+    async def respond(self, writer, status, body=b'',
+                      contenttype='application/json'):
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Type: %s\r\n'
+                      'Content-Length: %d\r\nConnection: close\r\n'
+                      'Access-Control-Allow-Origin: *\r\n\r\n'
+                      % (status, REASONS[status], contenttype, len(body))
+                      ).encode('latin-1') + body)
+        await writer.drain()
+
+    def command(self, keys):
+        '''Queue the commands `keys`.'''
+        for key in keys:
+            if not key.isspace():
+                self.commands.put(key)
+
+    # -- streaming
+
+    async def stream_events(self, writer, interval):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n'
+                     b'Access-Control-Allow-Origin: *\r\n\r\n')
+        await writer.drain()
+        version = 0
+        while True:
+            message = await self.next_message(version, interval)
+            version = message.version
+            writer.write(message.event)
+            await writer.drain()
+            self.sent += 1
+
+    async def stream_websocket(self, reader, writer, headers, interval):
+        key = headers.get('sec-websocket-key')
+        if key is None or 'websocket' not in headers.get('upgrade', '').lower():
+            return await self.respond(writer, 400)
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: %s\r\n\r\n'
+                      % websocket_accept(key)).encode('latin-1'))
+        await writer.drain()
+        receiver = asyncio.ensure_future(self.receive_websocket(reader,
+                                                                writer))
+        sender = asyncio.ensure_future(self.send_websocket(writer, interval))
+        try:
+            await asyncio.wait((receiver, sender),
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            receiver.cancel()
+            sender.cancel()
+
+    async def send_websocket(self, writer, interval):
+        version = 0
+        while True:
+            message = await self.next_message(version, interval)
+            version = message.version
+            writer.write(message.frame)
+            await writer.drain()
+            self.sent += 1
+
+    async def receive_websocket(self, reader, writer):
+        '''Handle the client frames: commands, ping and close.'''
+        while True:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == 0x1 and self.commands is not None:
+                self.command(payload.decode('utf-8', 'replace'))
+            elif opcode == 0x9:
+                writer.write(websocket_frame(payload, 0xa))
+            elif opcode == 0x8:
+                writer.write(websocket_frame(payload[:2], 0x8))
+                return
+
+    # -- thread
+
+    async def serve(self):
+        self.changed = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle, self.host,
+                                                 self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        LOGGER.info('Live server listening on http://%s:%d'
+                    % (self.host, self.port))
+        self.ready.set()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            self.loop.close()
+            return
+        self.loop.run_forever()
+        # stopped: close the server and the streaming clients
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks(self.loop)]
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks,
+                                                    return_exceptions=True))
+        self.loop.close()
+
+    def start(self, timeout=5.):
+        '''Start the server thread, return once it is listening.'''
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name='live-server')
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def stop(self, timeout=5.):
+        '''Stop the server and disconnect the clients.'''
+        if self.thread is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+        self.thread = None
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.session
+    -------------------
+
+    Survey session store: one SQLite database holding the averaged points,
+    the epochs (fixes) each point was computed from, the device information
+    and the settings of the session.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import time
+
+from .logger import LOGGER
+from .utils import Dict, Table
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS points (
+        id INTEGER PRIMARY KEY, pointnum INTEGER, pointname TEXT,
+        lon REAL, lon_dir TEXT, lat REAL, lat_dir TEXT, alt REAL,
+        alt_units TEXT, epochs INTEGER DEFAULT 0, begin REAL, end REAL);
+    CREATE TABLE IF NOT EXISTS epochs (
+        id INTEGER PRIMARY KEY,
+        point INTEGER REFERENCES points(id) ON DELETE CASCADE,
+        time REAL NOT NULL, timestamp TEXT, lon REAL, lat REAL, alt REAL,
+        quality INTEGER, numsats INTEGER, hdop REAL, diffage REAL,
+        sigma REAL, sentence TEXT);
+    CREATE TABLE IF NOT EXISTS device (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+    CREATE INDEX IF NOT EXISTS points_pointnum ON points (pointnum);
+    CREATE INDEX IF NOT EXISTS epochs_point ON epochs (point);
+    CREATE INDEX IF NOT EXISTS epochs_time ON epochs (time);
+'''
+
+POINT_COLUMNS = ('id', 'pointnum', 'pointname', 'lon', 'lon_dir', 'lat',
+                 'lat_dir', 'alt', 'alt_units', 'epochs', 'begin', 'end')
+
+EPOCH_COLUMNS = ('id', 'point', 'time', 'timestamp', 'lon', 'lat', 'alt',
+                 'quality', 'numsats', 'hdop', 'diffage', 'sigma', 'sentence')
+
+
+class Session(object):
+    '''SQLite session database, with the stdlib `sqlite3`.
+
+    The database is in WAL mode, so that it can be read (e.g. by a GIS)
+    while the survey goes on. The epochs are buffered and inserted
+    `batchsize` at once with `executemany`, in one transaction; a point and
+    its remaining epochs are committed together by `endpoint`. The epochs
+    are indexed on their point and their reception time.
+
+    :param filename: Session database filename, created if needed and
+        appended otherwise.
+    :param batchsize: Number of epochs buffered before inserting them.
+    '''
+
+    def __init__(self, filename, batchsize=500):
+        import sqlite3
+        self.filename = filename
+        self.batchsize = batchsize
+        self.batch = []
+        self.point = None   # id of the point being measured
+        # transactions are handled explicitly
+        self.db = sqlite3.connect(filename, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def _setvalues(self, table, values):
+        with self.transaction():
+            self.db.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?)'
+                                % table, [(key, None if value is None else
+                                           str(value))
+                                          for key, value in values.items()])
+
+    def setdevice(self, **info):
+        '''Record device information, e.g. url, protocol, version.'''
+        self._setvalues('device', info)
+
+    def setsettings(self, settings):
+        '''Record the settings (a dict) of the session.'''
+        self._setvalues('settings', settings)
+
+    def _getvalues(self, table):
+        return Dict(self.db.execute('SELECT key, value FROM %s ORDER BY key'
+                                    % table).fetchall())
+
+    def device(self):
+        '''Get the device information.'''
+        return self._getvalues('device')
+
+    def settings(self):
+        '''Get the session settings.'''
+        return self._getvalues('settings')
+
+    def transaction(self):
+        '''Context manager of a transaction.'''
+        return _Transaction(self.db)
+
+    def beginpoint(self, pointnum, pointname=''):
+        ''' Start the measure of a point, the next epochs are linked to it.
+
+        :param pointnum: Number of the point.
+        :param pointname: Name of the point.
+        :return: The id of the point in the session.
+        '''
+        self.flush()
+        cursor = self.db.execute('INSERT INTO points (pointnum, pointname, '
+                                 'begin) VALUES (?, ?, ?)',
+                                 (pointnum, pointname, time.time()))
+        self.point = cursor.lastrowid
+        return self.point
+
+    def addepoch(self, fix, received=None):
+        ''' Buffer an epoch of the current point.
+
+        :param fix: A `Fix`.
+        :param received: Reception time (default: now).
+        '''
+        self.batch.append((self.point,
+                           time.time() if received is None else received,
+                           None if fix.timestamp is None else
+                           str(fix.timestamp),
+                           fix.lon, fix.lat, fix.alt, fix.quality,
+                           fix.numsats, fix.hdop, fix.diffage, fix.sigma,
+                           str(fix)))
+        if len(self.batch) >= self.batchsize:
+            self.flush()
+
+    def endpoint(self, lon, lon_dir, lat, lat_dir, alt, alt_units):
+        '''End the measure of the current point, storing its averaged
+        position with its epochs in one transaction.'''
+        if self.point is None:
+            return
+        with self.transaction():
+            self._insertepochs()
+            self.db.execute('UPDATE points SET lon = ?, lon_dir = ?, lat = ?, '
+                            'lat_dir = ?, alt = ?, alt_units = ?, end = ?, '
+                            'epochs = (SELECT count(*) FROM epochs WHERE '
+                            'point = ?) WHERE id = ?',
+                            (lon, lon_dir, lat, lat_dir, alt, alt_units,
+                             time.time(), self.point, self.point))
+        self.point = None
+
+    def _insertepochs(self):
+        batch, self.batch = self.batch, []
+        if batch:
+            self.db.executemany('INSERT INTO epochs (point, time, timestamp, '
+                                'lon, lat, alt, quality, numsats, hdop, '
+                                'diffage, sigma, sentence) VALUES '
+                                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+
+    def flush(self):
+        '''Insert the buffered epochs.'''
+        if self.batch:
+            with self.transaction():
+                self._insertepochs()
+
+    def deletepoint(self, pointid):
+        '''Delete a point and its epochs.'''
+        self.flush()
+        with self.transaction():
+            self.db.execute('DELETE FROM points WHERE id = ?', (pointid,))
+
+    def _select(self, columns, query, params=()):
+        return Table.from_records(columns,
+                                  self.db.execute(query, params).fetchall())
+
+    def points(self):
+        '''Get all the points of the session, as a `utils.Table`.'''
+        self.flush()
+        return self._select(POINT_COLUMNS, 'SELECT %s FROM points ORDER BY id'
+                            % ', '.join(POINT_COLUMNS))
+
+    def epochs(self, pointnum):
+        '''Get the epochs of the points numbered `pointnum`, as a
+        `utils.Table`.'''
+        self.flush()
+        return self._select(EPOCH_COLUMNS,
+                            'SELECT %s FROM epochs e JOIN points p ON '
+                            'e.point = p.id WHERE p.pointnum = ? ORDER BY e.id'
+                            % ', '.join('e.' + column for column in
+                                        EPOCH_COLUMNS), (pointnum,))
+
+    def epochsbetween(self, start, end):
+        '''Get the epochs received between the `start` and `end` times
+        (seconds since the epoch), as a `utils.Table`.'''
+        self.flush()
+        return self._select(EPOCH_COLUMNS,
+                            'SELECT %s FROM epochs WHERE time BETWEEN ? AND ? '
+                            'ORDER BY time' % ', '.join(EPOCH_COLUMNS),
+                            (start, end))
+
+    def close(self):
+        '''Insert the buffered epochs and close the database.'''
+        try:
+            self.flush()
+        except Exception as e:
+            LOGGER.info('Session %s flush failed: %s' % (self.filename, e))
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _Transaction(object):
+    '''BEGIN ... COMMIT, or ROLLBACK on error.'''
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN')
+        return self.db
+
+    def __exit__(self, exctype, value, traceback):
+        self.db.execute('ROLLBACK' if exctype is not None else 'COMMIT')
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.ubx
+    ---------------
+
+    u-blox UBX binary protocol reader, an alternative to the NMEA frames
+    giving the position with full precision.
+
+    The frames are ``0xB5 0x62 class id length(U2) payload ck_a ck_b``; the
+    NAV-PVT (0x01 0x07) and NAV-HPPOSLLH (0x01 0x14) payloads are decoded
+    into the same `Fix` records as the NMEA GGA frames. NAV-PVT has no
+    horizontal dilution of precision, its position DOP (greater or equal)
+    is given as `hdop`, so a ``maxhdop`` filter rule stays conservative.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import datetime
+from operator import mul
+from struct import Struct
+
+from .fix import Fix
+from .logger import LOGGER
+
+SYNC = b'\xb5\x62'
+
+NAV = 0x01
+NAV_PVT = 0x07
+NAV_HPPOSLLH = 0x14
+
+#: Header following the sync chars: class, id, payload length.
+HEADER = Struct('<BBH')
+
+#: NAV-PVT payload (92 bytes).
+NAV_PVT_STRUCT = Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH6xihH')
+
+#: NAV-HPPOSLLH payload (36 bytes).
+NAV_HPPOSLLH_STRUCT = Struct('<B2xBIiiiibbbbII')
+
+#: Longest payload accepted, longer length fields are framing errors.
+MAX_PAYLOAD = 4096
+
+
+def ubx_checksum(data):
+    '''Compute the 8-bit Fletcher checksum (ck_a, ck_b) of `data` (class,
+    id, length and payload bytes).'''
+    length = len(data)
+    ck_a = sum(data) & 0xff
+    ck_b = sum(map(mul, data, range(length, 0, -1))) & 0xff
+    return ck_a, ck_b
+
+
+def ubx_frame(msgclass, msgid, payload):
+    '''Build a UBX frame, e.g. to configure the receiver.'''
+    body = HEADER.pack(msgclass, msgid, len(payload)) + bytes(payload)
+    return SYNC + body + bytes(ubx_checksum(body))
+
+
+def pvt_quality(fixtype, flags):
+    '''Convert NAV-PVT fix type and flags into the GGA fix quality.'''
+    if not (flags & 0x01) or fixtype in (0, 5):
+        return 0
+    carrsoln = (flags >> 6) & 0x03
+    if carrsoln == 2:
+        return 4
+    if carrsoln == 1:
+        return 5
+    if flags & 0x02:
+        return 2
+    if fixtype == 1:
+        return 6
+    return 1
+
+
+class UBXReader(object):
+    '''Incremental UBX framing and decoding.
+
+    Data is appended to one buffer, frames are located by the sync chars
+    (`split`) and decoded (`decodeframes`) with precompiled `struct.Struct` objects straight from the
+    buffer through a `memoryview`, without copying them.
+
+    When NAV-HPPOSLLH frames are received, the NAV-PVT fix of the same
+    epoch is completed with its high precision coordinates before being
+    returned.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pending = None     # (iTOW, fix) waiting for its NAV-HPPOSLLH
+        self.hpposllh = None    # last NAV-HPPOSLLH values
+        self.highprecision = False
+        self.frames = 0
+        self.badframes = 0
+        self.consumed = 0   # size of the data processed by `split`
+
+    def feed(self, data):
+        ''' Append received data and return the list of decoded fixes.
+
+        :param data: Bytes received (text is encoded back to bytes).
+        '''
+        return self.decodeframes(self.split(data))
+
+    def split(self, data):
+        ''' Append received data and locate its complete frames, without
+        decoding them.
+
+        :param data: Bytes received (text is encoded back to bytes).
+        :return: The (message id, offset, length) of the NAV payloads, to
+            give to `decodeframes`.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        buf = self.buffer
+        buf += data
+        navframes = []
+        pos = 0
+        size = len(buf)
+        with memoryview(buf) as view:
+            while True:
+                pos = buf.find(SYNC, pos)
+                if pos < 0:
+                    # keep a last sync char which can start the next frame
+                    pos = size - 1 if size and buf[-1] == 0xb5 else size
+                    break
+                if size - pos < 8:
+                    break
+                msgclass, msgid, length = HEADER.unpack_from(buf, pos + 2)
+                if length > MAX_PAYLOAD:
+                    self.badframes += 1
+                    pos += 2
+                    continue
+                end = pos + 6 + length
+                if size < end + 2:
+                    break
+                ck_a, ck_b = ubx_checksum(view[pos + 2:end])
+                if ck_a != buf[end] or ck_b != buf[end + 1]:
+                    LOGGER.info('Bad UBX checksum (class 0x%02x id 0x%02x)'
+                                % (msgclass, msgid))
+                    self.badframes += 1
+                    pos += 2
+                    continue
+                self.frames += 1
+                if msgclass == NAV:
+                    navframes.append((msgid, pos + 6, length))
+                pos = end + 2
+        self.consumed = pos
+        return navframes
+
+    def decodeframes(self, navframes):
+        ''' Decode the NAV payloads located by the last `split`, then
+        discard the data processed.
+
+        :return: The list of decoded fixes.
+        '''
+        fixes = []
+        buf = self.buffer
+        for msgid, offset, length in navframes:
+            self.decode(msgid, buf, offset, length, fixes)
+        del buf[:self.consumed]
+        self.consumed = 0
+        return fixes
+
+    def decode(self, msgid, buf, offset, length, fixes):
+        '''Decode a NAV payload at `offset` of `buf`, appending the fixes
+        completed to `fixes`.'''
+        if msgid == NAV_PVT and length == NAV_PVT_STRUCT.size:
+            if self.pending is not None:
+                fixes.append(self.pending[1])
+                self.pending = None
+            itow, fix = self.decode_pvt(buf, offset)
+            if not self.highprecision:
+                fixes.append(fix)
+            elif self.hpposllh is not None and self.hpposllh[2] == itow:
+                self.refine(fix, self.hpposllh)
+                fixes.append(fix)
+            else:
+                self.pending = (itow, fix)
+        elif msgid == NAV_HPPOSLLH and length == NAV_HPPOSLLH_STRUCT.size:
+            self.highprecision = True
+            self.hpposllh = NAV_HPPOSLLH_STRUCT.unpack_from(buf, offset)
+            if self.pending is not None and self.pending[0] == self.hpposllh[2]:
+                self.refine(self.pending[1], self.hpposllh)
+                fixes.append(self.pending[1])
+                self.pending = None
+
+    def decode_pvt(self, buf, offset):
+        '''Decode a NAV-PVT payload into (iTOW, `Fix`).'''
+        (itow, year, month, day, hour, minute, sec, valid, tacc, nano,
+         fixtype, flags, flags2, numsv, lon, lat, height, hmsl, hacc, vacc,
+         veln, vele, veld, gspeed, headmot, sacc, headacc, pdop, headveh,
+         magdec, magacc) = NAV_PVT_STRUCT.unpack_from(buf, offset)
+        try:
+            timestamp = datetime.time(hour, minute, sec,
+                                      max(nano, 0) // 1000)
+        except ValueError:
+            timestamp = None
+        lon = lon * 1e-7
+        lat = lat * 1e-7
+        return itow, Fix(timestamp=timestamp,
+                         lon=lon, lon_dir='E' if lon >= 0 else 'W',
+                         lat=lat, lat_dir='N' if lat >= 0 else 'S',
+                         alt=hmsl * 1e-3, alt_units='M',
+                         quality=pvt_quality(fixtype, flags),
+                         numsats=numsv, hdop=pdop * 0.01, sigma=hacc * 1e-3)
+
+    def refine(self, fix, hpposllh):
+        '''Set the high precision coordinates of a NAV-HPPOSLLH to `fix`.'''
+        (version, flags, itow, lon, lat, height, hmsl, lonhp, lathp,
+         heighthp, hmslhp, hacc, vacc) = hpposllh
+        if flags & 0x01:
+            # invalidLlh
+            return
+        fix.lon = lon * 1e-7 + lonhp * 1e-9
+        fix.lat = lat * 1e-7 + lathp * 1e-9
+        fix.alt = hmsl * 1e-3 + hmslhp * 1e-4
+        fix.sigma = hacc * 1e-4
@@ -8,12 +8,16 @@
 
 '''
 from __future__ import unicode_literals
-import sys
 import time
 import csv
-import binascii
+import functools
+import importlib
+from array import array
+from struct import Struct
+from itertools import compress, islice
+from collections.abc import Mapping
 
-from .compat import to_char, str, bytes, StringIO, is_py3, OrderedDict
+from .compat import to_char, str, bytes, StringIO, OrderedDict
 
 
 def is_text(data):
@@ -26,6 +30,31 @@ def is_bytes(data):
     return isinstance(data, bytes)
 
 
+class LazyModule(object):
+    '''A module imported on first attribute access, to keep the heavy or
+    platform-specific dependencies out of the import time::
+
+        pynmea2 = LazyModule('pynmea2')
+
+    :param name: Absolute name of the module.
+    '''
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return '<lazy module %r (%s)>' % (self.__name__, state)
+
+
 class cached_property(object):
     """A decorator that converts a function into a lazy property.  The
     function wrapped is called the first time to retrieve the result
@@ -68,93 +97,198 @@ class cached_property(object):
         return value
 
 
+#: Retry counters by name, see `retry_metrics`.
+RETRY_METRICS = OrderedDict()
+
+
+def retry_metrics():
+    '''Return the calls, retries and failures counters of the named
+    `retry` decorators.'''
+    return OrderedDict((name, dict(counters))
+                       for name, counters in RETRY_METRICS.items())
+
+
 class retry(object):
-    '''Retries a function or method until it returns True value.
+    '''Retries a function, method or coroutine function until it returns
+    without raising one of `exceptions`.
     delay sets the initial delay in seconds, and backoff sets the factor by
-    which the delay should lengthen after each failure.
-    Tries must be at least 0, and delay greater than 0.'''
+    which the delay should lengthen after each failure, up to maxdelay.
+    jitter adds a random part to each delay, as a fraction of the delay.
+    Tries must be at least 1 (None to retry until the deadline), and delay
+    greater or equal to 0.
+
+    :param exceptions: Exception classes which are retried, the other ones
+        are raised immediately (default: all).
+    :param deadline: Total time budget in seconds, no retry is started
+        after it (default: None, no deadline).
+    :param check: Predicate called with the returned value, the call is
+        retried if it returns False (default: None, any value is returned).
+    :param on_retry: Callable called with the exception (or None) before
+        each retry, e.g. to reconnect a link. In a coroutine function it may
+        return an awaitable.
+    :param name: Name of the counters in `RETRY_METRICS` (default: the
+        function qualified name).
+    '''
 
-    def __init__(self, tries=3, delay=1):
+    def __init__(self, tries=3, delay=1, backoff=1, maxdelay=None, jitter=0,
+                 exceptions=(Exception,), deadline=None, check=None,
+                 on_retry=None, name=None):
+        if tries is not None and tries < 1:
+            raise ValueError('tries must be at least 1')
+        if delay < 0:
+            raise ValueError('delay must be greater or equal to 0')
         self.tries = tries
         self.delay = delay
+        self.backoff = backoff
+        self.maxdelay = maxdelay
+        self.jitter = jitter
+        self.exceptions = tuple(exceptions)
+        self.deadline = deadline
+        self.check = check
+        self.on_retry = on_retry
+        self.name = name
+
+    def delays(self):
+        '''Generate the delays between the attempts.'''
+        import random
+        delay = self.delay
+        while True:
+            if self.jitter:
+                yield max(0, delay * (1 + random.uniform(-self.jitter,
+                                                         self.jitter)))
+            else:
+                yield delay
+            delay = delay * self.backoff
+            if self.maxdelay is not None:
+                delay = min(delay, self.maxdelay)
+
+    def _attempts(self, counters):
+        '''Generate (attempt number, delay before next attempt) pairs, the
+        delay is None if the attempt is the last one.'''
+        begin = time.time()
+        delays = self.delays()
+        attempt = 0
+        while True:
+            attempt += 1
+            counters['calls'] += 1
+            delay = next(delays)
+            last = self.tries is not None and attempt >= self.tries
+            if (not last) and (self.deadline is not None):
+                last = time.time() - begin + delay > self.deadline
+            if last:
+                yield attempt, None
+                return
+            yield attempt, delay
+
+    def _failed(self, counters, delay, error):
+        '''Account for a failed attempt, raise `error` if it was the last.'''
+        if delay is None:
+            counters['failures'] += 1
+            if error is not None:
+                raise error
+            return False
+        counters['retries'] += 1
+        return True
 
     def __call__(self, f):
-        def wrapped_f(*args, **kwargs):
-            for i in range(self.tries):
-                try:
-                    ret = f(*args, **kwargs)
-                    if ret:
+        import inspect
+        name = self.name or getattr(f, '__qualname__', f.__name__)
+        counters = RETRY_METRICS.setdefault(
+            name, OrderedDict(calls=0, retries=0, failures=0))
+
+        if inspect.iscoroutinefunction(f):
+            @functools.wraps(f)
+            async def wrapped_f(*args, **kwargs):
+                for attempt, delay in self._attempts(counters):
+                    try:
+                        ret = await f(*args, **kwargs)
+                        if self.check is None or self.check(ret):
+                            return ret
+                        error = None
+                    except self.exceptions as e:
+                        error = e
+                    if not self._failed(counters, delay, error):
                         return ret
-                    elif i == self.tries - 1:
+                    if self.on_retry is not None:
+                        res = self.on_retry(error)
+                        if inspect.isawaitable(res):
+                            await res
+                    if delay > 0:
+                        from asyncio import sleep
+                        await sleep(delay)
+        else:
+            @functools.wraps(f)
+            def wrapped_f(*args, **kwargs):
+                for attempt, delay in self._attempts(counters):
+                    try:
+                        ret = f(*args, **kwargs)
+                        if self.check is None or self.check(ret):
+                            return ret
+                        error = None
+                    except self.exceptions as e:
+                        error = e
+                    if not self._failed(counters, delay, error):
                         return ret
-                except Exception as e:
-                    if i == self.tries - 1:
-                        # last chance
-                        raise e
-                if self.delay > 0:
-                    time.sleep(self.delay)
-        wrapped_f.__doc__ = f.__doc__
-        wrapped_f.__name__ = f.__name__
-        wrapped_f.__module__ = f.__module__
+                    if self.on_retry is not None:
+                        self.on_retry(error)
+                    if delay > 0:
+                        time.sleep(delay)
+        wrapped_f.metrics = counters
         return wrapped_f
 
 
+#: Binary string representation of each byte value.
+BYTE_TO_BINARY = tuple(format(value, '08b') for value in range(256))
+
+
 def bytes_to_hex(byte):
-    '''Convert a bytearray to it's hex string representation.'''
-    if sys.version_info[0] >= 3:
-        hexstr = str(binascii.hexlify(byte), "utf-8")
-    else:
-        hexstr = str(binascii.hexlify(byte))
-    data = []
-    for i in range(0, len(hexstr), 2):
-        data.append("%s" % hexstr[i:i + 2].upper())
-    return ' '.join(data)
+    '''Convert a bytearray to it's hex string representation.
+    E.g.
+    >>> bytes_to_hex(b"\\xb5\\x62")
+    'B5 62'
+    '''
+    return memoryview(byte).hex(' ').upper()
 
 
 def hex_to_bytes(hexstr):
     '''Convert a string hex byte values into a byte string.'''
-    return binascii.unhexlify(hexstr.replace(' ', '').encode('utf-8'))
+    return bytes.fromhex(hexstr)
 
 
 def byte_to_binary(byte):
     '''Convert byte to binary string representation.
     E.g.
-    >>> hex_to_binary_string("\x4A")
-    '0000000001001010'
+    >>> byte_to_binary(0x4A)
+    '01001010'
     '''
-    return ''.join(str((byte & (1 << i)) and 1) for i in reversed(range(8)))
+    return BYTE_TO_BINARY[byte]
 
 
 def bytes_to_binary(values):
     '''Convert bytes to binary string representation.
     E.g.
-    >>> hex_to_binary_string(b"\x4A\xFF")
+    >>> bytes_to_binary(b"\\x4A\\xFF")
     '0100101011111111'
     '''
-    if is_py3:
-        # TODO: Python 3 convert \x00 to integer 0 ?
-        if values == 0:
-            data = '00000000'
-        else:
-            data = ''.join([byte_to_binary(b) for b in values])
-    else:
-        data = ''.join(byte_to_binary(ord(b)) for b in values)
-    return data
+    if isinstance(values, int):
+        return BYTE_TO_BINARY[values]
+    if len(values) == 0:
+        return ''
+    return format(int.from_bytes(values, 'big'), '0%db' % (8 * len(values)))
 
 
 def hex_to_binary(hexstr):
     '''Convert hexadecimal string to binary string representation.
     E.g.
-    >>> hex_to_binary_string("FF")
+    >>> hex_to_binary("FF")
     '11111111'
     '''
-    if is_py3:
-        return ''.join(byte_to_binary(b) for b in hex_to_bytes(hexstr))
-    return ''.join(byte_to_binary(ord(b)) for b in hex_to_bytes(hexstr))
+    return bytes_to_binary(hex_to_bytes(hexstr))
 
 
 def binary_to_int(buf, start=0, stop=None):
-    '''Convert binary string representation to integer.
+    '''Convert binary string representation to integer, `start` and `stop`
+    being counted from the least significant bit.
     E.g.
     >>> binary_to_int('1111110')
     126
@@ -162,8 +296,68 @@ def binary_to_int(buf, start=0, stop=None):
     2
     >>> binary_to_int('1111110', 0, 3)
     6
+    >>> binary_to_int('1111110', 0, 10)
+    126
     '''
-    return int(buf[::-1][start:(stop or len(buf))][::-1], 2)
+    length = len(buf)
+    return int(buf[max(length - (stop or length), 0):length - start], 2)
+
+
+def get_bits(buf, start, length):
+    '''Extract an unsigned bit field from a bytes-like `buf`, the bits being
+    numbered from the most significant bit of the first byte (as in RTCM
+    frames). Only the bytes covering the field are read.
+    E.g.
+    >>> get_bits(b"\\xd3\\x00\\x13", 14, 10)
+    19
+    '''
+    first = start >> 3
+    last = (start + length + 7) >> 3
+    value = int.from_bytes(memoryview(buf)[first:last], 'big')
+    return (value >> ((last << 3) - start - length)) & ((1 << length) - 1)
+
+
+def get_signed_bits(buf, start, length):
+    '''Extract a two's complement bit field, see `get_bits`.'''
+    value = get_bits(buf, start, length)
+    if value >> (length - 1):
+        value -= 1 << length
+    return value
+
+
+class StructFields(object):
+    '''Named fields of a binary frame, extracted with a precompiled
+    `struct.Struct` directly from the frame buffer (no copy).
+
+    >>> header = StructFields('<BBH', ('msgclass', 'msgid', 'length'))
+    >>> header.unpack(b"\\x01\\x07\\x5c\\x00")
+    Dict([('msgclass', 1), ('msgid', 7), ('length', 92)])
+
+    :param fmt: `struct` format of the fields.
+    :param names: Field names, one per value of `fmt` ("reserved" fields
+        are dropped by `unpack`).
+    '''
+
+    def __init__(self, fmt, names):
+        self.struct = Struct(fmt)
+        self.names = tuple(names)
+        self.size = self.struct.size
+        if len(self.struct.unpack(bytes(self.size))) != len(self.names):
+            raise ValueError('one name is needed by field of "%s"' % fmt)
+
+    def unpack_from(self, buf, offset=0):
+        '''Return the tuple of the field values at `offset` of `buf`.'''
+        return self.struct.unpack_from(buf, offset)
+
+    def unpack(self, buf, offset=0):
+        '''Return a `Dict` of the field values at `offset` of `buf`.'''
+        return Dict((name, value) for name, value
+                    in zip(self.names, self.struct.unpack_from(buf, offset))
+                    if name != 'reserved')
+
+    def iter_unpack(self, buf):
+        '''Iterate over the tuples of repeated fields filling `buf`.'''
+        return self.struct.iter_unpack(buf)
 
 
 def csv_to_dict(file_input, delimiter=','):
@@ -177,26 +371,144 @@ def csv_to_dict(file_input, delimiter=','):
     return ListDict(table)
 
 
-def dict_to_csv(items, delimiter, header):
+def dict_to_csv(items, delimiter, header, floatfmt=None):
     '''Serialize list of dictionaries to csv.'''
     content = ""
     if len(items) > 0:
-        delimiter = to_char(delimiter)
         output = StringIO()
-        csvwriter = csv.DictWriter(output, fieldnames=items[0].keys(),
-                                   delimiter=delimiter)
-        if header:
-            csvwriter.writerow(dict((key, key) for key in items[0].keys()))
-            # writeheader is not supported in python2.6
-            # csvwriter.writeheader()
-        for item in items:
-            csvwriter.writerow(dict(item))
-
+        write_csv(output, items, delimiter, header, floatfmt)
         content = output.getvalue()
         output.close()
     return content
 
 
+def write_csv(fileobj, items, delimiter=',', header=True, floatfmt=None,
+              chunksize=1024):
+    '''Serialize list of dictionaries (or a `Table`) to csv, written to
+    `fileobj` by chunks of `chunksize` rows.'''
+    if isinstance(items, Table):
+        writer = CSVWriter(fileobj, items.keys(), delimiter, header,
+                           floatfmt, chunksize)
+        writer.writecolumns(list(items.columns.values()))
+    else:
+        items = iter(items)
+        try:
+            first = next(items)
+        except StopIteration:
+            return
+        writer = CSVWriter(fileobj, first.keys(), delimiter, header,
+                           floatfmt, chunksize)
+        writer.writerow(first)
+        writer.writerows(items)
+    writer.flush()
+
+
+class CSVWriter(object):
+    '''Streaming csv writer: rows are formatted into a buffer which is
+    written to `fileobj` every `chunksize` rows, so the first rows are
+    written while the next ones are produced.
+
+    :param fileobj: File object where csv is written.
+    :param keys: Column names.
+    :param delimiter: CSV char delimiter (default: ",").
+    :param header: Write the column names as first row (default: True).
+    :param floatfmt: Format of the float values, e.g. "%.9f" (default:
+        None, `str` is used).
+    :param chunksize: Number of rows buffered before writing.
+    :param lineterminator: End of row (default: "\\r\\n").
+    '''
+
+    def __init__(self, fileobj, keys, delimiter=',', header=True,
+                 floatfmt=None, chunksize=1024, lineterminator='\r\n'):
+        self.fileobj = fileobj
+        self.keys = list(keys)
+        self.delimiter = to_char(delimiter)
+        self.floatfmt = floatfmt
+        self.chunksize = chunksize
+        self.lineterminator = lineterminator
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer, delimiter=self.delimiter,
+                                 lineterminator=lineterminator)
+        self.pending = 0
+        if header:
+            self.writer.writerow(self.keys)
+            self.pending += 1
+
+    def format(self, value):
+        '''Format one value.'''
+        if self.floatfmt is not None and isinstance(value, float):
+            return self.floatfmt % value
+        return value
+
+    def writerow(self, row):
+        '''Write a row given as a dict, or as a sequence of values in the
+        order of `keys`.'''
+        if isinstance(row, Mapping):
+            row = [row.get(key, '') for key in self.keys]
+        if self.floatfmt is not None:
+            row = [self.format(value) for value in row]
+        self.writer.writerow(row)
+        self.pending += 1
+        if self.pending >= self.chunksize:
+            self.flush(False)
+
+    def writerows(self, rows):
+        '''Write rows given as dicts or sequences, by chunks.'''
+        rows = iter(rows)
+        keys = self.keys
+        floatfmt = self.floatfmt
+        while True:
+            chunk = list(islice(rows, self.chunksize - self.pending))
+            if not chunk:
+                break
+            chunk = [[row.get(key, '') for key in keys]
+                     if isinstance(row, Mapping) else row for row in chunk]
+            if floatfmt is not None:
+                chunk = [[floatfmt % value if type(value) is float else value
+                          for value in row] for row in chunk]
+            self.writer.writerows(chunk)
+            self.pending += len(chunk)
+            if self.pending >= self.chunksize:
+                self.flush(False)
+
+    def writecolumns(self, columns):
+        '''Write rows given as columns (sequences of the same length).
+        When all the columns are float arrays, the rows are formatted with
+        one line template, without going through the csv module.'''
+        rows = zip(*columns)
+        if all(is_float_column(column) for column in columns):
+            floatfmt = self.floatfmt or '%r'
+            template = (self.delimiter.join([floatfmt] * len(columns)) +
+                        self.lineterminator)
+            while True:
+                chunk = ''.join([template % row
+                                 for row in islice(rows, self.chunksize)])
+                if not chunk:
+                    break
+                self.buffer.write(chunk)
+                self.flush(False)
+        else:
+            self.writerows(rows)
+
+    def flush(self, fileobj=True):
+        '''Write the buffered rows to `fileobj`, and flush it.'''
+        if self.buffer.tell():
+            self.fileobj.write(self.buffer.getvalue())
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        self.pending = 0
+        if fileobj and hasattr(self.fileobj, 'flush'):
+            self.fileobj.flush()
+
+
+def is_float_column(column):
+    '''Check if column is an array (or NumPy array) of floats.'''
+    if isinstance(column, array):
+        return column.typecode in 'fd'
+    dtype = getattr(column, 'dtype', None)
+    return dtype is not None and dtype.kind == 'f'
+
+
 class Dict(OrderedDict):
     '''A dict with somes additional methods.'''
 
@@ -214,17 +526,21 @@ class Dict(OrderedDict):
                 data[key] = self[key]
         return data
 
-    def to_csv(self, delimiter=',', header=True):
+    def to_csv(self, delimiter=',', header=True, floatfmt=None):
         '''Serialize list of dictionaries to csv.'''
-        return dict_to_csv([self], delimiter, header)
+        return dict_to_csv([self], delimiter, header, floatfmt)
 
 
 class ListDict(list):
     '''List of dicts with somes additional methods.'''
 
-    def to_csv(self, delimiter=',', header=True):
-        '''Serialize list of dictionaries to csv.'''
-        return dict_to_csv(list(self), delimiter, header)
+    def to_csv(self, delimiter=',', header=True, floatfmt=None,
+               fileobj=None):
+        '''Serialize list of dictionaries to csv, streamed to `fileobj`
+        if given, returned as a string otherwise.'''
+        if fileobj is not None:
+            return write_csv(fileobj, self, delimiter, header, floatfmt)
+        return dict_to_csv(self, delimiter, header, floatfmt)
 
     def filter(self, keys):
         '''Create a list of dictionaries with only the following `keys`.
@@ -243,3 +559,246 @@ class ListDict(list):
         '''Returns list sorted by `keyword`.'''
         key_ = keyword
         return ListDict(sorted(self, key=lambda k: k[key_], reverse=reverse))
+
+    def to_table(self, keys=None, types=None):
+        '''Convert to a columnar `Table`.'''
+        return Table.from_rows(self, keys, types)
+
+
+def csv_to_table(file_input, delimiter=',', types=None):
+    ''' Deserialize csv to a columnar `Table`.
+
+    The values are text, except in the columns given a type by `types`,
+    stored in arrays if all their values convert.
+
+    :param types: Dict of column name to array typecode, e.g.
+        ``{'lon': 'd', 'epochs': 'q'}``.
+    '''
+    delimiter = to_char(delimiter)
+    types = types or {}
+    reader = csv.reader(file_input, delimiter=delimiter,
+                        skipinitialspace=True)
+    try:
+        keys = next(reader)
+    except StopIteration:
+        return Table()
+    values = [[] for key in keys]
+    for row in reader:
+        for column, value in zip(values, row):
+            column.append(value)
+    columns = OrderedDict()
+    for key, column in zip(keys, values):
+        typecode = types.get(key)
+        if typecode is not None:
+            convert = float if typecode in 'fd' else int
+            try:
+                column = [convert(value) for value in column]
+            except ValueError:
+                typecode = None
+        columns[key] = to_column(column, typecode)
+    return Table(columns)
+
+
+def column_typecode(values):
+    '''Array typecode of a list of values: "q" if they are all integers,
+    "d" if they are all numbers with at least one float, else None.'''
+    typecode = None
+    for value in values:
+        kind = type(value)
+        if kind is float:
+            typecode = 'd'
+        elif kind is int:
+            typecode = typecode or 'q'
+        else:
+            return None
+    return typecode
+
+
+def to_column(values, typecode=None):
+    ''' Store a list of values in a column: an array of `typecode` (default:
+    `column_typecode` of the values) if all the values fit in it, else a
+    list. Text values are never converted, e.g. zero padded point numbers
+    are kept.'''
+    if typecode is None:
+        typecode = column_typecode(values)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            pass
+    return list(values)
+
+
+class Row(Mapping):
+    '''Lazy read-only view of one row of a `Table`, with the dict API.'''
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.table.columns[key][self.index]
+
+    def __iter__(self):
+        return iter(self.table.columns)
+
+    def __len__(self):
+        return len(self.table.columns)
+
+    def filter(self, keys):
+        '''Create a `Dict` with only the following `keys`.'''
+        return Dict((key, self[key]) for key in keys if key in self)
+
+    def to_dict(self):
+        '''Copy the row into a `Dict`.'''
+        return Dict(self.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class Table(object):
+    '''Columnar table with the `ListDict` methods.
+
+    Each column is stored once, as an `array.array`, a NumPy array or a
+    list. Column projections (`filter`) share the columns without copying
+    them, rows are filtered with a boolean mask (`where`) and sorted by one
+    index permutation (`sorted_by`), and the rows are lazy `Row` views.
+
+    :param columns: Ordered dict of column name to values, all of the same
+        length.
+    '''
+
+    def __init__(self, columns=None):
+        self.columns = OrderedDict(columns or ())
+        lengths = set(len(column) for column in self.columns.values())
+        if len(lengths) > 1:
+            raise ValueError('columns must have the same length')
+        self.length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_rows(cls, rows, keys=None, types=None):
+        ''' Build a table from a list of dictionaries.
+
+        :param rows: List of dictionaries.
+        :param keys: Column names (default: the keys of the first row).
+        :param types: Dict of column name to array typecode (default: see
+            `column_typecode`).
+        '''
+        rows = list(rows)
+        if keys is None:
+            keys = list(rows[0].keys()) if rows else []
+        return cls.from_records(keys, ([row[key] for key in keys]
+                                       for row in rows), types)
+
+    @classmethod
+    def from_records(cls, keys, records, types=None):
+        ''' Build a table from a list of tuples, e.g. the rows of a database
+        query.
+
+        :param keys: Column names, in the order of the values.
+        :param records: List of sequences of values.
+        :param types: Dict of column name to array typecode (default: see
+            `column_typecode`).
+        '''
+        types = types or {}
+        values = list(zip(*records)) or [()] * len(keys)
+        return cls(OrderedDict((key, to_column(list(column), types.get(key)))
+                               for key, column in zip(keys, values)))
+
+    def keys(self):
+        return list(self.columns.keys())
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield Row(self, index)
+
+    def __getitem__(self, item):
+        '''Return a `Row` by index, or a column by name (see `column`).'''
+        if is_text(item):
+            return self.column(item)
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError('table index out of range')
+        return Row(self, item)
+
+    def column(self, key):
+        '''Return the column `key` without copying it: a `memoryview` of
+        array columns, the NumPy array or the list otherwise.'''
+        column = self.columns[key]
+        if isinstance(column, array):
+            return memoryview(column)
+        return column
+
+    def filter(self, keys):
+        '''Create a table with only the following `keys`, sharing the
+        columns with this one.'''
+        return Table(OrderedDict((key, self.columns[key]) for key in keys
+                                 if key in self.columns))
+
+    def where(self, mask):
+        '''Create a table with the rows whose `mask` value is true.
+
+        :param mask: Sequence of booleans (or NumPy boolean array), one per
+            row, e.g. ``[alt > 500 for alt in table['alt']]``.
+        '''
+        if len(mask) != self.length:
+            raise ValueError('mask must have one value per row')
+        columns = OrderedDict()
+        for key, column in self.columns.items():
+            if isinstance(column, array):
+                columns[key] = array(column.typecode, compress(column, mask))
+            elif isinstance(column, list):
+                columns[key] = list(compress(column, mask))
+            else:
+                columns[key] = column[mask]
+        return Table(columns)
+
+    def take(self, indices):
+        '''Create a table with the rows of the given `indices`.'''
+        columns = OrderedDict()
+        for key, column in self.columns.items():
+            if isinstance(column, array):
+                columns[key] = array(column.typecode,
+                                     [column[i] for i in indices])
+            elif isinstance(column, list):
+                columns[key] = [column[i] for i in indices]
+            else:
+                columns[key] = column[list(indices)]
+        return Table(columns)
+
+    def sorted_by(self, keyword, reverse=False):
+        '''Returns table sorted by `keyword`.'''
+        column = self.columns[keyword]
+        indices = sorted(range(self.length), key=column.__getitem__,
+                         reverse=reverse)
+        return self.take(indices)
+
+    def to_numpy(self):
+        '''Create a table whose array columns are NumPy arrays, sharing
+        their memory.'''
+        import numpy
+        return Table(OrderedDict(
+            (key, numpy.frombuffer(column, dtype=column.typecode)
+             if isinstance(column, array) else column)
+            for key, column in self.columns.items()))
+
+    def to_listdict(self):
+        '''Copy the rows into a `ListDict` of `Dict`.'''
+        return ListDict(row.to_dict() for row in self)
+
+    def to_csv(self, delimiter=',', header=True, floatfmt=None,
+               fileobj=None):
+        '''Serialize table to csv, streamed to `fileobj` if given, returned
+        as a string otherwise.'''
+        if fileobj is not None:
+            return write_csv(fileobj, self, delimiter, header, floatfmt)
+        return dict_to_csv(self, delimiter, header, floatfmt)
+
+    def __repr__(self):
+        return '<Table %d rows %s>' % (self.length, self.keys())
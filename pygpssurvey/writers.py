@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+'''
+    pygpssurvey.writers
+    -------------------
+
+    Points output writers: CSV, GeoJSON (newline-delimited features) and
+    GeoPackage (SQLite, with a R-tree spatial index).
+
+    All writers take the points as dicts, or as sequences of values in the
+    order of their `keys`, which must contain "lon", "lat" and "alt".
+    They buffer `batchsize` points before writing them; `flush` writes the
+    buffered points (and commits them for GeoPackage), `close` ends the
+    output. `undo` removes the last point, e.g. a point captured by
+    mistake.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import json
+from struct import Struct, unpack_from
+from itertools import islice
+from collections.abc import Mapping
+
+from .utils import CSVWriter, is_text
+from .compat import OrderedDict
+
+#: Columns of the points output.
+POINT_KEYS = ('pointnum', 'pointname', 'lon', 'lon_dir', 'lat', 'lat_dir',
+              'alt', 'alt_units')
+
+#: Default format of the coordinates written, enough for sub-millimetre
+#: positions without the float representation noise.
+FLOAT_FORMAT = '%.12g'
+
+FORMATS = ('csv', 'geojson', 'gpkg')
+
+
+class PointWriter(object):
+    '''Base class of the points writers.
+
+    :param keys: Names of the point values.
+    :param batchsize: Number of points buffered before writing.
+    '''
+
+    def __init__(self, keys=POINT_KEYS, batchsize=1000):
+        self.keys = tuple(keys)
+        self.batchsize = batchsize
+        self.batch = []
+        self.count = 0
+        self.ilon = self.keys.index('lon')
+        self.ilat = self.keys.index('lat')
+        self.ialt = self.keys.index('alt')
+
+    def write(self, point):
+        '''Write one point, given as a dict or a sequence of values.'''
+        if isinstance(point, Mapping):
+            point = tuple(point.get(key) for key in self.keys)
+        self.batch.append(point)
+        if len(self.batch) >= self.batchsize:
+            self.writebatch()
+
+    def writemany(self, points):
+        '''Write several points.'''
+        points = iter(points)
+        keys = self.keys
+        while True:
+            chunk = list(islice(points, self.batchsize - len(self.batch)))
+            if not chunk:
+                break
+            self.batch.extend(tuple(point.get(key) for key in keys)
+                              if isinstance(point, Mapping) else point
+                              for point in chunk)
+            if len(self.batch) >= self.batchsize:
+                self.writebatch()
+
+    def writebatch(self):
+        '''Write the buffered points.'''
+        batch, self.batch = self.batch, []
+        if batch:
+            self.count += len(batch)
+            self.writepoints(batch)
+
+    def writepoints(self, points):
+        raise NotImplementedError()
+
+    def undo(self):
+        ''' Remove the last point written.
+
+        :return: False if it cannot be removed (e.g. written in a bulk
+            batch to a stream).
+        '''
+        if self.batch:
+            self.batch.pop()
+            return True
+        if self.count and self.removelast():
+            self.count -= 1
+            return True
+        return False
+
+    def canundo(self):
+        '''True if the points written one by one and flushed (the captured
+        points) can be removed with `undo`.'''
+        return False
+
+    def removelast(self):
+        return False
+
+    def flush(self):
+        '''Write the buffered points.'''
+        self.writebatch()
+
+    def close(self):
+        '''Write the buffered points and end the output.'''
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StreamOffsets(object):
+    ''' Offsets of the points written one by one to a seekable file object
+    (the captured points), so that the last ones can be removed by
+    truncating the file; the offsets are forgotten when several points are
+    written at once.
+
+    :param output: The file object.
+    '''
+
+    def __init__(self, output):
+        self.output = output
+        try:
+            self.seekable = output.seekable()
+        except (AttributeError, ValueError):
+            self.seekable = False
+        self.offsets = []
+
+    def mark(self, count):
+        '''Record the offset of the next `count` points written.'''
+        if not self.seekable:
+            return
+        if count == 1:
+            if hasattr(self.output, 'flush'):
+                self.output.flush()
+            self.offsets.append(self.output.tell())
+        else:
+            del self.offsets[:]
+
+    def truncate(self):
+        '''Remove the last point written one by one.'''
+        if not self.offsets:
+            return False
+        if hasattr(self.output, 'flush'):
+            self.output.flush()
+        self.output.seek(self.offsets.pop())
+        self.output.truncate()
+        return True
+
+
+class CSVPointWriter(PointWriter):
+    '''Writes points in a CSV file object, with a header.
+
+    :param output: File object where the points are written.
+    :param delimiter: CSV char delimiter (default: ";").
+    :param floatfmt: Format of the coordinates (default: "%.12g").
+    '''
+
+    def __init__(self, output, keys=POINT_KEYS, delimiter=';',
+                 floatfmt=FLOAT_FORMAT, batchsize=1000):
+        PointWriter.__init__(self, keys, batchsize)
+        self.output = output
+        self.csvwriter = CSVWriter(output, self.keys, delimiter=delimiter,
+                                   floatfmt=floatfmt, chunksize=batchsize,
+                                   lineterminator='\n')
+        self.csvwriter.flush()
+        self.offsets = StreamOffsets(output)
+
+    def writepoints(self, points):
+        if len(points) == 1:
+            self.csvwriter.flush()
+        self.offsets.mark(len(points))
+        self.csvwriter.writerows(points)
+
+    def canundo(self):
+        return self.offsets.seekable
+
+    def removelast(self):
+        self.csvwriter.flush()
+        return self.offsets.truncate()
+
+    def flush(self):
+        PointWriter.flush(self)
+        self.csvwriter.flush()
+
+
+class GeoJSONPointWriter(PointWriter):
+    '''Writes points as newline-delimited GeoJSON features (one Point
+    feature by line, with the other values as properties), so that the file
+    can be streamed and appended.
+
+    :param output: File object where the features are written.
+    :param floatfmt: Format of the coordinates (default: "%.12g").
+    '''
+
+    def __init__(self, output, keys=POINT_KEYS, floatfmt=FLOAT_FORMAT,
+                 batchsize=1000):
+        PointWriter.__init__(self, keys, batchsize)
+        self.output = output
+        self.properties = [(i, key) for i, key in enumerate(self.keys)
+                           if key not in ('lon', 'lat', 'alt')]
+        self.template = ('{"type":"Feature","geometry":{"type":"Point",'
+                         '"coordinates":[%s,%s,%s]},"properties":%%s}\n'
+                         % (floatfmt, floatfmt, floatfmt))
+        self.offsets = StreamOffsets(output)
+
+    def feature(self, point):
+        '''Format one point as a GeoJSON feature line.'''
+        alt = point[self.ialt]
+        properties = json.dumps(OrderedDict((key, point[i]) for i, key
+                                            in self.properties))
+        return self.template % (point[self.ilon], point[self.ilat],
+                                alt if alt is not None else 0., properties)
+
+    def writepoints(self, points):
+        self.offsets.mark(len(points))
+        self.output.write(''.join([self.feature(point) for point in points]))
+
+    def canundo(self):
+        return self.offsets.seekable
+
+    def removelast(self):
+        return self.offsets.truncate()
+
+    def flush(self):
+        PointWriter.flush(self)
+        if hasattr(self.output, 'flush'):
+            self.output.flush()
+
+
+#: GeoPackage geometry header (magic, version, flags: little endian without
+#: envelope, srs id) and ISO WKB PointZ.
+GPKG_POINTZ = Struct('<2sBBiBIddd')
+
+
+def gpkg_pointz(lon, lat, alt, srs_id=4326):
+    '''Encode a GeoPackage PointZ geometry blob.'''
+    return GPKG_POINTZ.pack(b'GP', 0, 0x01, srs_id, 1, 1001, lon, lat, alt)
+
+
+#: Size of the envelope of the GeoPackage geometry header, by envelope code.
+GPKG_ENVELOPE_SIZES = (0, 32, 48, 48, 64)
+
+
+def gpkg_envelope(blob):
+    ''' Decode the (minx, maxx, miny, maxy) of a GeoPackage geometry blob,
+    from its header envelope or from its WKB point; None if the geometry
+    is NULL or empty, or is not a point without envelope.'''
+    if blob is None or len(blob) < 8 or blob[:2] != b'GP':
+        return None
+    flags = blob[3]
+    if flags & 0x10:
+        return None     # empty geometry
+    order = '<' if flags & 0x01 else '>'
+    code = (flags >> 1) & 0x07
+    if code:
+        if code >= len(GPKG_ENVELOPE_SIZES):
+            return None
+        return unpack_from(order + '4d', blob, 8)
+    wkb = 8
+    if len(blob) < wkb + 21:
+        return None
+    wkborder = '<' if blob[wkb] == 1 else '>'
+    if unpack_from(wkborder + 'I', blob, wkb + 1)[0] % 1000 != 1:
+        return None     # not a point
+    x, y = unpack_from(wkborder + '2d', blob, wkb + 5)
+    if x != x:
+        return None     # empty point (NaN coordinates)
+    return x, x, y, y
+
+
+def _envelope_function(index):
+    def function(blob):
+        envelope = gpkg_envelope(blob)
+        return None if envelope is None else envelope[index]
+    return function
+
+
+#: Spatial SQL functions used by the R-tree triggers of the GeoPackage
+#: specification, defined on the connections of `GeoPackageWriter`.
+GPKG_FUNCTIONS = (('ST_IsEmpty', lambda blob: int(gpkg_envelope(blob) is None)),
+                  ('ST_MinX', _envelope_function(0)),
+                  ('ST_MaxX', _envelope_function(1)),
+                  ('ST_MinY', _envelope_function(2)),
+                  ('ST_MaxY', _envelope_function(3)))
+
+#: R-tree maintenance triggers of the GeoPackage ``gpkg_rtree_index``
+#: extension, formatted with the table (t), geometry column (c) and primary
+#: key (i).
+GPKG_RTREE_TRIGGERS = '''
+CREATE TRIGGER "rtree_{t}_{c}_insert" AFTER INSERT ON "{t}"
+  WHEN (new."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}",
+    ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update1" AFTER UPDATE OF "{c}" ON "{t}"
+  WHEN OLD."{i}" = NEW."{i}" AND
+       (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}",
+    ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update2" AFTER UPDATE OF "{c}" ON "{t}"
+  WHEN OLD."{i}" = NEW."{i}" AND
+       (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update3" AFTER UPDATE ON "{t}"
+  WHEN OLD."{i}" != NEW."{i}" AND
+       (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}",
+    ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update4" AFTER UPDATE ON "{t}"
+  WHEN OLD."{i}" != NEW."{i}" AND
+       (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id IN (OLD."{i}", NEW."{i}");
+END;
+CREATE TRIGGER "rtree_{t}_{c}_delete" AFTER DELETE ON "{t}"
+  WHEN old."{c}" NOT NULL
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+END;
+'''
+
+
+class GeoPackageWriter(PointWriter):
+    '''Writes points in a GeoPackage (SQLite database) feature table, with
+    the stdlib `sqlite3`.
+
+    The points of a batch are inserted with one `executemany`, inside a
+    transaction committed by `flush` (so a bulk export is one transaction).
+    The R-tree spatial index (GeoPackage ``gpkg_rtree_index`` extension),
+    used to query the points by extent without reading the table, is
+    maintained by the triggers of the specification, so that it stays valid
+    when the table is edited by other GeoPackage clients; their spatial
+    functions (`GPKG_FUNCTIONS`) are defined on the connection. The batches
+    of several points are indexed with one statement instead, the insert
+    trigger being dropped and created again in the same transaction.
+
+    :param filename: GeoPackage filename, the table is created or replaced.
+    :param table: Name of the feature table (default: "points").
+    '''
+
+    def __init__(self, filename, keys=POINT_KEYS, table='points',
+                 batchsize=10000):
+        import sqlite3
+        PointWriter.__init__(self, keys, batchsize)
+        self.filename = filename
+        self.table = table
+        self.rtree = 'rtree_%s_geom' % table
+        self.triggers = [trigger.format(t=table, c='geom', i='fid') + 'END;'
+                         for trigger in GPKG_RTREE_TRIGGERS.split('END;')[:-1]]
+        self.extent = None
+        # transactions are handled explicitly; the points can be written by
+        # the capture thread
+        self.db = sqlite3.connect(filename, isolation_level=None,
+                                  check_same_thread=False)
+        for name, function in GPKG_FUNCTIONS:
+            self.db.create_function(name, 1, function, deterministic=True)
+        self.create()
+        columns = ', '.join('"%s"' % key for key in self.keys)
+        self.insert = ('INSERT INTO "%s" (geom, %s) VALUES (?, %s)'
+                       % (table, columns, ', '.join('?' * len(self.keys))))
+        self.db.execute('BEGIN')
+
+    def create(self):
+        '''Create the GeoPackage metadata tables and the feature table.'''
+        db = self.db
+        db.execute('PRAGMA application_id = 1196444487')   # "GPKG"
+        db.execute('PRAGMA user_version = 10200')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+                srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+                organization TEXT NOT NULL,
+                organization_coordsys_id INTEGER NOT NULL,
+                definition TEXT NOT NULL, description TEXT);
+            CREATE TABLE IF NOT EXISTS gpkg_contents (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+                description TEXT DEFAULT '',
+                last_change DATETIME NOT NULL DEFAULT
+                    (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+                srs_id INTEGER);
+            CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+                table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+                geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL,
+                z TINYINT NOT NULL, m TINYINT NOT NULL,
+                CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name));
+            CREATE TABLE IF NOT EXISTS gpkg_extensions (
+                table_name TEXT, column_name TEXT,
+                extension_name TEXT NOT NULL, definition TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                CONSTRAINT ge_tce UNIQUE (table_name, column_name,
+                                          extension_name));
+        ''')
+        db.execute('BEGIN')
+        db.executemany(
+            'INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+            [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+             ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+             ('WGS 84 geodetic', 4326, 'EPSG', 4326,
+              'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,'
+              '298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG",'
+              '"6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+              'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+              'AUTHORITY["EPSG","4326"]]', 'longitude/latitude WGS 84')])
+        table = self.table
+        db.execute('DROP TABLE IF EXISTS "%s"' % self.rtree)
+        db.execute('DROP TABLE IF EXISTS "%s"' % table)
+        columns = ''.join(', "%s" %s' % (key, 'REAL' if key in
+                                          ('lon', 'lat', 'alt') else 'TEXT')
+                          for key in self.keys)
+        db.execute('CREATE TABLE "%s" (fid INTEGER PRIMARY KEY '
+                   'AUTOINCREMENT, geom POINT%s)' % (table, columns))
+        db.execute('CREATE VIRTUAL TABLE "%s" USING rtree(id, minx, maxx, '
+                   'miny, maxy)' % self.rtree)
+        for trigger in self.triggers:
+            db.execute(trigger)
+        db.execute('INSERT OR REPLACE INTO gpkg_contents (table_name, '
+                   'data_type, identifier, srs_id) VALUES (?, ?, ?, ?)',
+                   (table, 'features', table, 4326))
+        db.execute('INSERT OR REPLACE INTO gpkg_geometry_columns VALUES '
+                   '(?, ?, ?, ?, ?, ?)', (table, 'geom', 'POINT', 4326, 1, 0))
+        db.execute('INSERT OR REPLACE INTO gpkg_extensions VALUES '
+                   '(?, ?, ?, ?, ?)',
+                   (table, 'geom', 'gpkg_rtree_index',
+                    'http://www.geopackage.org/spec120/#extension_rtree',
+                    'write-only'))
+        db.execute('COMMIT')
+
+    def writepoints(self, points):
+        ilon, ilat, ialt = self.ilon, self.ilat, self.ialt
+        db = self.db
+        rows = [(gpkg_pointz(point[ilon], point[ilat], point[ialt] or 0.),)
+                + tuple(point) for point in points]
+        if len(rows) == 1:
+            db.execute(self.insert, rows[0])
+        else:
+            # bulk load: indexed at once, without the insert trigger
+            last = db.execute('SELECT max(fid) FROM "%s"'
+                              % self.table).fetchone()[0] or 0
+            db.execute('DROP TRIGGER "rtree_%s_geom_insert"' % self.table)
+            db.executemany(self.insert, rows)
+            db.execute('INSERT INTO "%s" SELECT fid, lon, lon, lat, lat '
+                       'FROM "%s" WHERE fid > ?' % (self.rtree, self.table),
+                       (last,))
+            db.execute(self.triggers[0])
+        lons = [point[ilon] for point in points]
+        lats = [point[ilat] for point in points]
+        extent = (min(lons), min(lats), max(lons), max(lats))
+        if self.extent is not None:
+            extent = (min(extent[0], self.extent[0]),
+                      min(extent[1], self.extent[1]),
+                      max(extent[2], self.extent[2]),
+                      max(extent[3], self.extent[3]))
+        self.extent = extent
+
+    def flush(self):
+        '''Insert the buffered points and commit them.'''
+        PointWriter.flush(self)
+        db = self.db
+        if self.extent is not None:
+            db.execute('UPDATE gpkg_contents SET min_x = ?, min_y = ?, '
+                       'max_x = ?, max_y = ?, last_change = strftime('
+                       '\'%Y-%m-%dT%H:%M:%fZ\',\'now\') WHERE '
+                       'table_name = ?', self.extent + (self.table,))
+        db.execute('COMMIT')
+        db.execute('BEGIN')
+
+    def canundo(self):
+        return True
+
+    def removelast(self):
+        self.flush()
+        db = self.db
+        fid = db.execute('SELECT max(fid) FROM "%s"' % self.table).fetchone()[0]
+        if fid is None:
+            return False
+        db.execute('DELETE FROM "%s" WHERE fid = ?' % self.table, (fid,))
+        db.execute('COMMIT')
+        db.execute('BEGIN')
+        return True
+
+    def close(self):
+        self.flush()
+        self.db.execute('COMMIT')
+        self.db.close()
+
+    def query(self, minlon, minlat, maxlon, maxlat):
+        '''Return the points inside an extent, found with the R-tree.'''
+        self.flush()
+        columns = ', '.join('t."%s"' % key for key in self.keys)
+        # the R-tree coordinates are rounded outwards to 32-bit floats, the
+        # candidates it gives are checked on the exact coordinates
+        return self.db.execute(
+            'SELECT %s FROM "%s" t JOIN "%s" r ON t.fid = r.id WHERE '
+            'r.maxx >= ? AND r.minx <= ? AND r.maxy >= ? AND r.miny <= ? '
+            'AND t.lon BETWEEN ? AND ? AND t.lat BETWEEN ? AND ?'
+            % (columns, self.table, self.rtree),
+            (minlon, maxlon, minlat, maxlat,
+             minlon, maxlon, minlat, maxlat)).fetchall()
+
+
+def make_writer(output, format='csv', delimiter=';', floatfmt=FLOAT_FORMAT,
+                keys=POINT_KEYS):
+    ''' Create the points writer of `format`.
+
+    :param output: File object (or filename) of the output; a GeoPackage
+        is opened by sqlite3 from its filename, a file object given (e.g.
+        opened by argparse) is closed and its name used.
+    :param format: "csv", "geojson" or "gpkg" (default: "csv").
+    '''
+    if format == 'gpkg':
+        if not is_text(output):
+            name = getattr(output, 'name', None)
+            if not is_text(name):
+                raise ValueError('GeoPackage output must be a file or a '
+                                 'filename')
+            output.close()
+            output = name
+        return GeoPackageWriter(output, keys)
+    if is_text(output):
+        output = open(output, 'w')
+    if format == 'geojson':
+        return GeoJSONPointWriter(output, keys, floatfmt)
+    if format == 'csv':
+        return CSVPointWriter(output, keys, delimiter, floatfmt)
+    raise ValueError('format must be one of %s' % ', '.join(FORMATS))
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+'''
+    Tests of PyGPSSurvey, run with pytest (or tox).
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+'''
+    Replay fixtures of the tests: deterministic replay of recorded NMEA
+    through the public `GPSSurvey` API, to check the parsing and averaging path against golden outputs
+    before and after optimizing it.
+
+    The frames are served by a `ReplayLink` (a fake `PyLink` connection
+    giving the data by chunks), and the point captures are requested
+    before the first frame, so every replay captures exactly the recorded
+    epochs of each point. The points written are compared to the golden
+    ones to a tolerance.
+
+    `synthetic_survey` generates large datasets (GGA and GST frames), with
+    their expected points computed from the written fields, independently
+    of the parsing code.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from __future__ import division, unicode_literals
+import io
+import random
+
+from pygpssurvey.commands import Commands
+from pygpssurvey.fix import nmea_sentence
+
+#: Default tolerances of the points comparison: degrees (about 0.1 mm)
+#: and meters.
+DEGREE_TOLERANCE = 1e-9
+ALT_TOLERANCE = 1e-3
+
+#: Timing gate of the replays: maximum time by epoch (microseconds), about
+#: five times the time measured on a laptop.
+EPOCH_BUDGET = 500.
+
+
+class ReplayLink(object):
+    ''' Fake `PyLink` connection replaying recorded data.
+
+    :param data: The data (str or bytes) to replay.
+    :param chunk: Size of the chunks returned by `read`, to exercise the
+        frames split across reads.
+    :param idle: Number of first reads returning no data (while the
+        commands queued before the replay are processed).
+
+    A read after the end of the data raises `KeyboardInterrupt`, which ends
+    the acquisition loops as Ctrl-C does, e.g. when captures are still
+    waiting for fixes.
+    '''
+    url = 'replay'
+
+    def __init__(self, data, chunk=512, idle=0):
+        self.data = data
+        self.chunk = chunk
+        self.idle = idle
+        self.pos = 0
+        self.written = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    @property
+    def done(self):
+        return self.pos >= len(self.data)
+
+    def read(self, size=None, timeout=None):
+        if self.idle > 0:
+            self.idle -= 1
+            return self.data[:0]
+        if self.done:
+            raise KeyboardInterrupt('end of the replayed data')
+        data = self.data[self.pos:self.pos + (size or self.chunk)]
+        self.pos += len(data)
+        return data
+
+    def write(self, data):
+        self.written.append(data)
+
+
+def read_rawoutput(rawoutput):
+    ''' Read a raw output file: the point number lines, each followed by the
+    frames of the point.
+
+    :param rawoutput: File object or filename.
+    :return: A list of (pointnum, [frame lines]).
+    '''
+    if not hasattr(rawoutput, 'read'):
+        with open(rawoutput) as rawfile:
+            return read_rawoutput(rawfile)
+    points = []
+    for line in rawoutput:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('$'):
+            if points:
+                points[-1][1].append(line)
+        else:
+            points.append((line, []))
+    return points
+
+
+def read_points(output, delim=';'):
+    ''' Read a points output CSV file.
+
+    :return: A list of (pointnum, lon, lat, alt), alt is None if empty.
+    '''
+    if not hasattr(output, 'read'):
+        with open(output) as outfile:
+            return read_points(outfile, delim)
+    lines = [line.rstrip('\r\n').split(delim) for line in output
+             if line.strip()]
+    if not lines:
+        return []
+    keys = [key.strip() for key in lines[0]]
+    ipointnum, ilon, ilat, ialt = (keys.index(key) for key in
+                                   ('pointnum', 'lon', 'lat', 'alt'))
+    return [(row[ipointnum], float(row[ilon]), float(row[ilat]),
+             float(row[ialt]) if row[ialt] else None) for row in lines[1:]]
+
+
+def replay(device_factory, points, chunk=512, **kwargs):
+    ''' Replay the frames of recorded points through
+    `GPSSurvey.getpointsposition`, capturing each point from its frames.
+
+    All the points must have the same number of fixes.
+
+    :param device_factory: Callable creating a `GPSSurvey` from a link
+        (e.g. the `GPSSurvey` class).
+    :param points: A list of (pointnum, [frame lines]), see
+        `read_rawoutput`.
+    :param chunk: Size of the chunks read from the link.
+    :param kwargs: Other arguments of `getpointsposition`.
+    :return: (points output text, raw output text, device).
+    '''
+    frames = [frame for pointnum, lines in points for frame in lines]
+    measuresnb = sum(1 for frame in points[0][1] if frame[3:6] == 'GGA')
+    link = ReplayLink(''.join(frame + '\r\n' for frame in frames), chunk,
+                      idle=len(points) + 2)
+    device = device_factory(link)
+    commands = Commands([])
+    for i in range(len(points)):
+        commands.put('M')
+    commands.put('Q')
+    output = io.StringIO()
+    rawoutput = io.StringIO()
+    kwargs.setdefault('quittimeout', None)  # Q is queued before the frames
+    device.getpointsposition(output, rawoutput, measuresnb=measuresnb,
+                             commands=commands, **kwargs)
+    # the frames after the last fix (e.g. its GST) may not be read
+    if 'GGA,' in link.data[link.pos:]:
+        raise ValueError('%d bytes not replayed'
+                         % (len(link.data) - link.pos))
+    return output.getvalue(), rawoutput.getvalue(), device
+
+
+def compare_points(points, golden, tolerance=DEGREE_TOLERANCE,
+                   alttolerance=ALT_TOLERANCE):
+    ''' Compare points to golden ones.
+
+    :param points: A list of (pointnum, lon, lat, alt), see `read_points`.
+    :param golden: The expected points.
+    :param tolerance: Tolerance of the coordinates (degrees).
+    :param alttolerance: Tolerance of the altitudes (meters).
+    :return: The list of the differences found, empty if they match.
+    '''
+    errors = []
+    if len(points) != len(golden):
+        errors.append('%d points instead of %d' % (len(points), len(golden)))
+    for point, expected in zip(points, golden):
+        if point[0] != expected[0]:
+            errors.append('point %s instead of %s' % (point[0], expected[0]))
+        for name, value, reference, limit in (
+                ('lon', point[1], expected[1], tolerance),
+                ('lat', point[2], expected[2], tolerance),
+                ('alt', point[3], expected[3], alttolerance)):
+            if reference is None:
+                continue
+            if value is None or abs(value - reference) > limit:
+                errors.append('point %s %s %r instead of %r'
+                              % (expected[0], name, value, reference))
+    return errors
+
+
+def _minutes(value, degreedigits):
+    '''Format degrees as NMEA degrees and minutes, and return the degrees
+    of the formatted value.'''
+    degrees = int(value)
+    minutes = '%08.5f' % ((value - degrees) * 60)
+    if minutes.startswith('60'):
+        degrees += 1
+        minutes = '00.00000'
+    return ('%0*d%s' % (degreedigits, degrees, minutes),
+            degrees + float(minutes) / 60)
+
+
+def synthetic_survey(points=1000, measuresnb=10, seed=0, lon=5.5538,
+                     lat=45.4788, alt=553.8, spacing=2., noise=0.01):
+    ''' Generate the frames of a survey: points along a line, each with
+    `measuresnb` noisy epochs (GGA and GST frames, RTK fixed).
+
+    :param seed: Seed of the noise, so the dataset is reproducible.
+    :param spacing: Distance between the points (meters).
+    :param noise: Standard deviation of the position noise (meters).
+    :return: (points, golden): the list of (pointnum, [frame lines]) and
+        the expected (pointnum, lon, lat, alt), computed from the fields
+        written.
+    '''
+    rand = random.Random(seed)
+    dlat = 1 / 111132.
+    dlon = dlat / 0.7015   # about cos(45.48)
+    survey = []
+    golden = []
+    second = 0
+    for num in range(1, points + 1):
+        lines = []
+        sums = [0., 0., 0.]
+        for i in range(measuresnb):
+            plon = lon + (num * spacing + rand.gauss(0, noise)) * dlon
+            plat = lat + rand.gauss(0, noise) * dlat
+            palt = alt + rand.gauss(0, 2 * noise)
+            lonfield, lonvalue = _minutes(plon, 3)
+            latfield, latvalue = _minutes(plat, 2)
+            altfield = '%.3f' % palt
+            time = '%02d%02d%02d.00' % ((second // 3600) % 24,
+                                        (second // 60) % 60, second % 60)
+            second += 1
+            lines.append(nmea_sentence(
+                'GPGGA,%s,%s,N,%s,E,4,12,0.80,%s,M,47.4,M,1.0,0000'
+                % (time, latfield, lonfield, altfield)))
+            lines.append(nmea_sentence(
+                'GPGST,%s,0.010,0.012,0.008,45.0,%.3f,%.3f,%.3f'
+                % (time, noise, noise, 2 * noise)))
+            sums[0] += lonvalue
+            sums[1] += latvalue
+            sums[2] += float(altfield)
+        survey.append((str(num), lines))
+        golden.append((str(num), sums[0] / measuresnb, sums[1] / measuresnb,
+                       sums[2] / measuresnb))
+    return survey, golden
+
+
+def write_rawoutput(points, rawoutput):
+    '''Write points frames in the raw output format.'''
+    for pointnum, lines in points:
+        rawoutput.write('%s\n' % pointnum)
+        rawoutput.write(''.join('%s\n' % line for line in lines))
+
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+'''
+    Automatic captures: stop-and-go and continuous triggers, confirmation
+    of the captures, and their capture by the pipeline.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import itertools
+import types
+
+import pytest
+
+from pygpssurvey.autocapture import (AutoCapture, RunningStats, STATIONARY,
+                                     DISTANCE, INTERVAL)
+from pygpssurvey import capture
+from pygpssurvey.capture import CapturePipeline, AUTO_POINT_KEYS
+from pygpssurvey.filters import FixFilter
+from pygpssurvey.fix import Fix
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey.writers import CSVPointWriter
+
+ORIGIN = LocalTangentPlane(5.5538, 45.4788)
+
+
+def fix(east, north=0.):
+    lon, lat = ORIGIN.to_lonlat(east, north)
+    return Fix(lon=lon, lon_dir='E', lat=lat, lat_dir='N', alt=553.8,
+               alt_units='M', quality=4)
+
+
+def walk(auto, positions, start=0., confirm=True):
+    '''Update with 1 Hz fixes at `positions` (east meters), confirming the
+    captures; return the (time, trigger) of the captures.'''
+    captures = []
+    for i, east in enumerate(positions):
+        trigger = auto.update(fix(east), start + i)
+        if trigger is not None:
+            captures.append((start + i, trigger))
+            if confirm:
+                auto.confirm()
+    return captures
+
+
+def test_running_stats():
+    stats = RunningStats()
+    for value in (2., 4., 4., 4., 5., 5., 7., 9.):
+        stats.add(value)
+    assert stats.mean == 5.
+    assert stats.variance == pytest.approx(32 / 7.)
+    stats.reset()
+    assert stats.count == 0 and stats.std == 0.
+
+
+def test_stationary():
+    auto = AutoCapture(stationary=3.)
+    # walking at 1 m/s, then stopped
+    captures = walk(auto, [0., 1., 2., 3.] + [3.] * 8)
+    assert len(captures) == 1
+    when, (trigger, seconds) = captures[0]
+    assert trigger == STATIONARY and seconds >= 3.
+    assert not auto.moving()
+    # once by stop: captured again after moving to another stop
+    captures = walk(auto, [4., 5., 6., 7.] + [7.] * 8, start=12.)
+    assert len(captures) == 1
+
+
+def test_stationary_not_confirmed():
+    auto = AutoCapture(stationary=3.)
+    captures = walk(auto, [0., 1., 2.] + [2.] * 6, confirm=False)
+    # the trigger is given again until the capture is confirmed
+    assert len(captures) > 1
+    assert all(trigger[0] == STATIONARY for when, trigger in captures)
+
+
+def test_distance_and_interval():
+    auto = AutoCapture(distance=4.5)
+    captures = walk(auto, [float(i) for i in range(12)])
+    assert [when for when, trigger in captures] == [5., 10.]
+    assert all(trigger == (DISTANCE, 0.) for when, trigger in captures)
+    auto = AutoCapture(interval=4.)
+    captures = walk(auto, [float(i) for i in range(10)])
+    assert [when for when, trigger in captures] == [4., 8.]
+    assert captures[0][1] == (INTERVAL, 0.)
+
+
+def test_gap():
+    auto = AutoCapture(distance=4.5, maxgap=2.)
+    walk(auto, [0., 1., 2.])
+    # the motion is unknown after a gap, the distance is still measured
+    # from the last capture
+    assert auto.update(fix(3.), 10.) is None
+    assert auto.speed == 0.
+    assert auto.update(fix(5.), 11.) == (DISTANCE, 0.)
+
+
+def test_from_string():
+    auto = AutoCapture.from_string('distance=10; interval=30;maxspeed=0.2')
+    assert (auto.distance, auto.interval, auto.maxspeed) == (10., 30., 0.2)
+    assert auto.stationary is None
+    for spec in ('', 'maxspeed=0.2', 'speed=3', 'distance'):
+        with pytest.raises(ValueError):
+            AutoCapture.from_string(spec)
+
+
+def test_pipeline_trigger(monkeypatch):
+    # fixes received at 1 Hz
+    clock = itertools.count(1000.)
+    monkeypatch.setattr(capture, 'time',
+                        types.SimpleNamespace(time=lambda: next(clock)))
+    output = io.StringIO()
+    auto = AutoCapture(distance=1.5)
+    captures = CapturePipeline(CSVPointWriter(output, AUTO_POINT_KEYS),
+                               io.StringIO(), FixFilter(), 3,
+                               autocapture=auto)
+    pointnum = 1
+    for sequence, east in enumerate([0., 1., 2., 3., 4.], 1):
+        trigger = captures.feed(sequence, fix(east))
+        if trigger is not None and captures.trigger(pointnum, '', trigger):
+            pointnum += 1
+    # a key capture in progress delays the automatic ones
+    captures.request(pointnum)
+    trigger = captures.feed(6, fix(6.))
+    assert trigger == (DISTANCE, 0.)
+    assert captures.trigger(pointnum + 1, '', trigger) is None
+    assert auto.candidate is not None
+    captures.close()
+    assert [(completed.pointnum, completed.trigger)
+            for completed in captures.completed] == [(1, DISTANCE),
+                                                   (2, DISTANCE)]
+    lines = output.getvalue().splitlines()
+    assert lines[0].split(';')[-6:] == ['epochs', 'duration', 'sdeast',
+                                        'sdnorth', 'sdalt', 'trigger']
+    assert lines[1].split(';')[-1] == 'distance'
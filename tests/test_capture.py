@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+    Point captures overlapped with the acquisition: queued captures, gaps
+    between them, the worker writing the points, and the quit command
+    waiting for the captures in progress.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+import io
+import time
+
+import pytest
+
+from pygpssurvey.capture import CapturePipeline, Capture
+from pygpssurvey.commands import Commands
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.filters import FixFilter
+from pygpssurvey.fix import Fix
+from pygpssurvey.writers import CSVPointWriter
+from .replay import ReplayLink, read_points, synthetic_survey
+
+
+def fix(second, lon=5.5538, quality=4):
+    return Fix(timestamp=datetime.time(12, 0, second), lon=lon, lon_dir='E',
+               lat=45.4788, lat_dir='N', alt=553.8, alt_units='M',
+               quality=quality, numsats=12)
+
+
+def pipeline(measuresnb=3, **kwargs):
+    output = io.StringIO()
+    captures = CapturePipeline(CSVPointWriter(output), io.StringIO(),
+                               FixFilter(qualities=frozenset((4,))),
+                               measuresnb, **kwargs)
+    return captures, output
+
+
+def test_capture_mean():
+    capture = Capture(1, 'P1', 2)
+    capture.add(10, fix(0, lon=5.), True, 100.)
+    capture.add(11, fix(1, quality=1), False, 101.)
+    assert not capture.done
+    capture.add(12, fix(2, lon=6.), True, 102.)
+    assert capture.done
+    assert capture.mean() == (5.5, 'E', 45.4788, 'N', 553.8, 'M')
+    assert (capture.first, capture.last, capture.seen) == (10, 12, 3)
+    stats = capture.stats()
+    assert stats[:2] == (2, 2.) and stats[-1] == 'key'
+
+
+def test_queued_captures():
+    captures, output = pipeline()
+    captures.request(1)
+    captures.request(2)
+    assert captures.busy()
+    sequence = 0
+    for second in range(8):
+        sequence += 1
+        # a rejected fix is seen, not averaged
+        captures.feed(sequence, fix(second, quality=1 if second == 1 else 4))
+    captures.close()
+    assert not captures.busy()
+    first, second = captures.completed
+    assert (first.first, first.last, first.seen) == (1, 4, 4)
+    # the next capture starts on the next epoch
+    assert (second.first, second.gap) == (5, 0)
+    assert [point[0] for point in read_points(io.StringIO(
+        output.getvalue()))] == ['1', '2']
+
+
+def test_close_drops_incomplete():
+    captures, output = pipeline()
+    captures.request(1)
+    captures.feed(1, fix(0))
+    captures.close()
+    assert captures.completed == []
+    assert read_points(io.StringIO(output.getvalue())) == []
+
+
+def test_waiting():
+    captures, output = pipeline()
+    assert not captures.waiting(1.)
+    captures.request(1)
+    assert captures.waiting(0.05)
+    assert captures.quitting is not None
+    time.sleep(0.06)
+    # the time limit counts from the first call
+    assert not captures.waiting(0.05)
+    assert captures.waiting(None)
+    captures.close()
+
+
+def quit_replay(keys, points=2, measuresnb=5):
+    ''' Replay a survey with the `keys` queued before its frames.
+
+    :return: (points written, True if all the frames were read).
+    '''
+    survey, golden = synthetic_survey(points, measuresnb)
+    data = ''.join(line + '\r\n' for num, lines in survey for line in lines)
+    link = ReplayLink(data, chunk=64, idle=len(keys))
+    commands = Commands([])
+    for key in keys:
+        commands.put(key)
+    output = io.StringIO()
+    GPSSurvey(link).getpointsposition(output, io.StringIO(),
+                                      measuresnb=measuresnb,
+                                      commands=commands, quittimeout=None)
+    return read_points(io.StringIO(output.getvalue())), link.done
+
+
+def test_quit_completes_captures():
+    points, done = quit_replay('MQ')
+    assert [point[0] for point in points] == ['1']
+    # the acquisition ends with the capture, before the end of the frames
+    assert not done
+
+
+def test_quit_not_cancelled():
+    # a command after Q does not cancel the quit
+    points, done = quit_replay('MQL')
+    assert [point[0] for point in points] == ['1']
+    assert not done
+
+
+def test_quit_again():
+    # Q again quits at once, dropping the capture in progress
+    points, done = quit_replay('MQLQ')
+    assert points == []
+    assert not done
+
+
+class Pipe(io.StringIO):
+    '''Output which cannot be seeked, as a pipe or a terminal.'''
+
+    def seekable(self):
+        return False
+
+
+def test_retroactive():
+    captures, output = pipeline(window=2.5)
+    now = time.time()
+    for second in range(5):
+        captures.ring.append(second + 1, fix(second, lon=5. + second),
+                             now - 4 + second)
+    # captured at once from the epochs of the last 2.5 seconds
+    capture = captures.request(1)
+    assert not captures.busy()
+    assert (capture.first, capture.last) == (3, 5)
+    assert capture.mean()[0] == pytest.approx(8.)
+    # no fix accepted in the window: captured from the next epochs
+    captures.ring.clear()
+    captures.ring.append(6, fix(5, quality=1), now)
+    capture = captures.request(2)
+    assert captures.busy() and capture.first is None
+    captures.close()
+
+
+def test_undo():
+    raw = io.StringIO()
+    output = io.StringIO()
+    captures = CapturePipeline(CSVPointWriter(output), raw,
+                               FixFilter(qualities=frozenset((4,))), 1)
+    captures.request(1)
+    captures.feed(1, fix(0))
+    captures.request(2)
+    captures.feed(2, fix(1))
+    captures.request(3)
+    # a pending capture is cancelled
+    assert captures.undo().pointnum == 3
+    # the last point written is removed with its raw fixes
+    assert captures.undo().pointnum == 2
+    captures.close()
+    assert [point[0] for point in read_points(
+        io.StringIO(output.getvalue()))] == ['1']
+    assert raw.getvalue().splitlines()[0] == '1'
+    assert len(raw.getvalue().splitlines()) == 2
+    assert [capture.pointnum for capture in captures.completed] == [1]
+
+
+def test_undo_not_removable():
+    output = Pipe()
+    captures = CapturePipeline(CSVPointWriter(output), io.StringIO(),
+                               FixFilter(), 1)
+    captures.request(1)
+    captures.feed(1, fix(0))
+    # the point written to a pipe is kept, its number is not reused
+    assert captures.undo() is None
+    captures.close()
+    assert [capture.pointnum for capture in captures.completed] == [1]
+    assert captures.submitted[-1].pointnum == 1
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''
+    Interactive commands: the script, pipe, file and socket sources, and the
+    queue read by the acquisition loop.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+from pygpssurvey.commands import (Commands, ScriptSource, StreamSource,
+                                  SocketSource, source_from_string)
+
+
+def keys(commands, count, timeout=2.):
+    '''Get `count` commands, waiting up to `timeout` seconds.'''
+    deadline = time.time() + timeout
+    received = []
+    while len(received) < count and time.time() < deadline:
+        key = commands.get(0.05)
+        if key is not None:
+            received.append(key)
+    return received
+
+
+def test_script():
+    with Commands(['script:M 0.1 N\tM Q']) as commands:
+        start = time.time()
+        assert keys(commands, 4) == ['M', 'N', 'M', 'Q']
+        assert time.time() - start >= 0.1
+    assert commands.get() is None
+    assert isinstance(source_from_string('script:M'), ScriptSource)
+
+
+def test_pipe():
+    read, write = os.pipe()
+    with Commands([StreamSource(os.fdopen(read, 'rb', 0))]) as commands:
+        os.write(write, b'M\nD \r\nq')
+        assert keys(commands, 3) == ['M', 'D', 'q']
+        source = commands.sources[0]
+        # the source ends with the stream
+        os.close(write)
+        source.join(1.)
+        assert not source.is_alive()
+
+
+def test_file(tmp_path):
+    path = tmp_path / 'keys'
+    path.write_text('M N\nQ\n')
+    with Commands(['file:' + str(path)]) as commands:
+        assert keys(commands, 3) == ['M', 'N', 'Q']
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix sockets')
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / 'commands.sock')
+    commands = Commands([source_from_string('unix:' + path)])
+    assert isinstance(commands.sources[0], SocketSource)
+    with commands:
+        for key in (b'M', b'N'):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(key + b'\n')
+            client.close()
+        assert keys(commands, 2) == ['M', 'N']
+    # the socket file is removed when stopped
+    commands.sources[0].join(1.)
+    assert not os.path.exists(path)
+
+
+def test_tcp_socket():
+    source = SocketSource(('127.0.0.1', 0))
+    port = source.server.getsockname()[1]
+    with Commands([source]) as commands:
+        client = socket.create_connection(('127.0.0.1', port))
+        client.sendall(b'P')
+        assert keys(commands, 1) == ['P']
+        client.close()
+
+
+def test_queue():
+    commands = Commands([])
+    commands.put('M')
+    assert commands.get() == 'M'
+    assert commands.get() is None
+    start = time.time()
+    assert commands.get(0.05) is None
+    assert time.time() - start >= 0.04
+    # a source added to started commands is started
+    with commands:
+        commands.add('script:L')
+        assert keys(commands, 1) == ['L']
+    with pytest.raises(ValueError):
+        source_from_string('serial:/dev/ttyS0')
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='select of a pipe')
+def test_stop_while_reading():
+    read, write = os.pipe()
+    source = StreamSource(os.fdopen(read, 'rb', 0))
+    with Commands([source]):
+        pass
+    # stopped without data, by its wake up socket
+    assert not source.is_alive()
+    os.close(write)
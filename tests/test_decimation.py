@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+    Decimation of the fixes: one every n, interval averages, on change, and
+    the decimated outputs of the captured points.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+import io
+
+import pytest
+
+from pygpssurvey.capture import CapturePipeline
+from pygpssurvey.decimation import (Decimator, EveryNth, IntervalAverage,
+                                    OnChange, decimator_from_string)
+from pygpssurvey.filters import FixFilter
+from pygpssurvey.fix import Fix
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey.writers import CSVPointWriter
+
+ORIGIN = LocalTangentPlane(5.5538, 45.4788)
+
+
+def fix(tenths, east=0., alt=553.8, quality=4):
+    lon, lat = ORIGIN.to_lonlat(east, 0.)
+    return Fix(timestamp=datetime.time(12, 0, tenths // 10,
+                                       tenths % 10 * 100000),
+               lon=lon, lon_dir='E', lat=lat, lat_dir='N', alt=alt,
+               alt_units='M', quality=quality)
+
+
+def test_every_nth():
+    fixes = [fix(i) for i in range(7)]
+    kept = EveryNth(3).decimate(fixes, range(7))
+    assert [received for f, received in kept] == [0, 3, 6]
+    assert Decimator().decimate(fixes, range(7)) == list(zip(fixes,
+                                                             range(7)))
+    with pytest.raises(ValueError):
+        EveryNth(0)
+
+
+def test_interval_average():
+    # 10 Hz fixes averaged by second
+    fixes = [fix(i, east=float(i % 10)) for i in range(25)]
+    kept = IntervalAverage(1.).decimate(fixes, [100. + i / 10.
+                                                for i in range(25)])
+    assert len(kept) == 3
+    average, received = kept[0]
+    assert ORIGIN.to_local(average.lon, average.lat)[0] == pytest.approx(4.5)
+    assert average.timestamp == datetime.time(12, 0, 0, 900000)
+    assert average.sentence is None and received == pytest.approx(100.9)
+    # the last interval is output by flush
+    last, received = kept[2]
+    assert ORIGIN.to_local(last.lon, last.lat)[0] == pytest.approx(2.)
+
+
+def test_interval_altitude():
+    fixes = [fix(0, alt=550.), fix(1, alt=None), fix(2, alt=552.),
+             fix(3, alt=None)]
+    average, received = IntervalAverage(1.).decimate(fixes, range(4))[0]
+    # averaged on the fixes which have an altitude
+    assert average.alt == pytest.approx(551.)
+    average, received = IntervalAverage(1.).decimate(
+        [fix(0, alt=None)], [0])[0]
+    assert average.alt is None
+    # the fixes without position are not averaged
+    empty = Fix(timestamp=datetime.time(12, 0, 0, 500000), quality=0)
+    average, received = IntervalAverage(1.).decimate(
+        [fix(0, alt=550.), empty], range(2))[0]
+    assert average.alt == 550. and average.quality == 0
+
+
+def test_interval_reception_time():
+    fixes = [Fix(lon=5.5, lat=45.5, quality=1) for i in range(4)]
+    kept = IntervalAverage(2.).decimate(fixes, [10., 11., 12., 13.5])
+    assert [received for f, received in kept] == [11., 13.5]
+
+
+def test_on_change():
+    fixes = [fix(0, east=0.), fix(1, east=0.05), fix(2, east=0.2),
+             fix(3, east=0.25), fix(4, east=0.25, quality=5)]
+    kept = OnChange(0.1).decimate(fixes, range(5))
+    assert [received for f, received in kept] == [0, 2, 4]
+
+
+def test_from_string():
+    assert str(decimator_from_string('all')) == 'all'
+    assert str(decimator_from_string('every:5')) == 'every:5'
+    assert str(decimator_from_string('interval:0.5')) == 'interval:0.5'
+    assert str(decimator_from_string('change:0.1')) == 'change:0.1'
+    for spec in ('every:x', 'interval:0', 'median:3'):
+        with pytest.raises(ValueError):
+            decimator_from_string(spec)
+
+
+def test_capture_outputs():
+    raw = io.StringIO()
+    output = io.StringIO()
+    captures = CapturePipeline(CSVPointWriter(output), raw, FixFilter(), 6,
+                               rawdecimator=EveryNth(3))
+    captures.request(1)
+    for i in range(6):
+        captures.feed(i + 1, fix(i, east=float(i)))
+    captures.close()
+    # the raw output is decimated, the point is averaged on all the fixes
+    assert len(raw.getvalue().splitlines()) == 1 + 2
+    point = captures.completed[0].mean()
+    assert ORIGIN.to_local(point[0], point[2])[0] == pytest.approx(2.5)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''
+    Fix quality filters, and the decoding of the GGA fixes with the error
+    estimate of their GST.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+
+import pytest
+
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.fix import Fix, nmea_sentence
+from pygpssurvey.filters import (FixFilter, BadFilterException,
+                                 parse_qualities, parse_minsats,
+                                 DIFFERENTIAL_FIXES)
+from .replay import ReplayLink
+
+
+def gga(time, quality=4, numsats=12, hdop='0.80', diffage='1.0'):
+    return nmea_sentence('GPGGA,%s,4528.7280000,N,00533.2280000,E,%d,%d,%s,'
+                         '553.800,M,47.4,M,%s,0000'
+                         % (time, quality, numsats, hdop, diffage))
+
+
+def gst(time, sigma=('0.030', '0.040')):
+    return nmea_sentence('GPGST,%s,0.010,%s,%s,45.0,%s,%s,0.060'
+                         % ((time,) + sigma * 2))
+
+
+def test_parse_rules():
+    assert parse_qualities('4, 5') == frozenset((4, 5))
+    assert parse_qualities('2-4,6') == frozenset((2, 3, 4, 6))
+    assert parse_minsats('8,5:12') == (8, {5: 12})
+    assert parse_minsats('5:12') == (None, {5: 12})
+
+
+def test_rules():
+    fixfilter = FixFilter.from_string('quality=4,5;minsats=8,5:12;'
+                                      'maxhdop=2;maxdiffage=10;'
+                                      'maxgstsigma=0.05')
+    assert fixfilter.accept(Fix(quality=4, numsats=8, hdop=1., diffage=1.,
+                                sigma=0.01))
+    rejected = [Fix(quality=1, numsats=20, hdop=1., diffage=1., sigma=0.01),
+                Fix(quality=5, numsats=10, hdop=1., diffage=1., sigma=0.01),
+                Fix(quality=4, numsats=8, hdop=3., diffage=1., sigma=0.01),
+                Fix(quality=4, numsats=8, hdop=1., diffage=11., sigma=0.01),
+                Fix(quality=4, numsats=8, hdop=1., diffage=1., sigma=None)]
+    assert not any(fixfilter.accept(fix) for fix in rejected)
+    assert fixfilter.stats() == {
+        'accepted': 1, 'rejected_quality': 1, 'rejected_minsats': 1,
+        'rejected_maxhdop': 1, 'rejected_maxdiffage': 1,
+        'rejected_maxgstsigma': 1}
+
+
+def test_bad_rules():
+    for spec in ('quality', 'maxhdop=x', 'minspeed=3'):
+        with pytest.raises(BadFilterException):
+            FixFilter.from_string(spec)
+
+
+def test_from_config():
+    config = io.StringIO('[fixfilter]\nquality = 4\nminsats = 10\n')
+    fixfilter = FixFilter.from_config(config)
+    assert fixfilter.qualities == frozenset((4,))
+    assert fixfilter.minsats == 10
+    with pytest.raises(BadFilterException):
+        FixFilter.from_config(io.StringIO('[other]\n'))
+
+
+def test_from_pointfixfilter():
+    assert FixFilter.from_pointfixfilter(True).qualities == DIFFERENTIAL_FIXES
+    assert FixFilter.from_pointfixfilter(False).accept(Fix(quality=1))
+    fixfilter = FixFilter(maxhdop=1.)
+    assert FixFilter.from_pointfixfilter(fixfilter) is fixfilter
+
+
+def decode(frames, device=None):
+    '''Decode NMEA frames, then a read without frame, into fixes.'''
+    if device is None:
+        device = GPSSurvey(ReplayLink(''))
+    device.feedframes(''.join(frame + '\r\n' for frame in frames))
+    fixes = []
+    for frame in list(device.frames) + [None]:
+        fix = device.decodefix(frame)
+        if fix is not None:
+            fixes.append(fix)
+    device.frames.clear()
+    return fixes
+
+
+def test_gst_before_gga():
+    fixes = decode([gst('120000.00'), gga('120000.00'),
+                    gst('120000.00'), gga('120001.00')])
+    assert len(fixes) == 2
+    assert fixes[0].sigma == pytest.approx(0.05)
+    # a GST of another epoch is not used
+    assert fixes[1].sigma is None
+
+
+def test_gst_after_gga():
+    fixes = decode([gga('120000.00'), gst('120000.00'),
+                    gga('120001.00'), gst('120001.00', ('0.003', '0.004')),
+                    gga('120002.00'), gga('120003.00')])
+    assert [fix.timestamp.second for fix in fixes] == [0, 1, 2, 3]
+    # the first GST after its GGA is only seen once the fix is released
+    assert fixes[0].sigma is None
+    assert fixes[1].sigma == pytest.approx(0.005)
+    # a GGA without GST is released by the next frame, or the next read
+    assert fixes[2].sigma is None and fixes[3].sigma is None
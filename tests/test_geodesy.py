@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+    Geodesic distances and bearings, local tangent plane and stake-out
+    guidance of the targets.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import pytest
+
+from pygpssurvey.geodesy import (haversine, bearing, vincenty, nearest,
+                                 LocalTangentPlane, Target)
+
+
+def dms(degrees, minutes, seconds):
+    sign = -1 if degrees < 0 else 1
+    return sign * (abs(degrees) + minutes / 60. + seconds / 3600.)
+
+
+# Flinders Peak to Buninyong, the example of Vincenty (1975)
+FLINDERS = (dms(144, 25, 29.52440), dms(-37, 57, 3.72030))
+BUNINYONG = (dms(143, 55, 35.38390), dms(-37, 39, 10.15610))
+
+
+def test_vincenty():
+    distance, azimuth = vincenty(*(FLINDERS + BUNINYONG))
+    assert distance == pytest.approx(54972.271, abs=1e-3)
+    assert azimuth == pytest.approx(dms(306, 52, 5.37), abs=1e-5)
+    assert vincenty(5.5, 45.5, 5.5, 45.5) == (0., 0.)
+
+
+def test_spherical():
+    # one degree of the equator
+    assert haversine(0., 0., 1., 0.) == pytest.approx(111195.08, abs=0.01)
+    assert haversine(*(FLINDERS + BUNINYONG)) == pytest.approx(54972.,
+                                                              rel=0.005)
+    assert bearing(0., 0., 1., 0.) == pytest.approx(90.)
+    assert bearing(0., 0., 0., -1.) == pytest.approx(180.)
+    assert bearing(0., 0., -1., 0.) == pytest.approx(270.)
+
+
+def test_sequences():
+    lons, lats = [5.5, 5.6, 5.7], [45.5, 45.5, 45.6]
+    distances = haversine(5.6, 45.6, lons, lats)
+    assert len(distances) == 3
+    assert float(distances[2]) == pytest.approx(haversine(5.6, 45.6, 5.7,
+                                                          45.6))
+    assert nearest(5.69, 45.59, lons, lats)[0] == 2
+    assert nearest(5.69, 45.59, [], []) == (None, None)
+
+
+def test_local_tangent_plane():
+    plane = LocalTangentPlane(*FLINDERS)
+    east, north = plane.to_local(FLINDERS[0] + 0.001, FLINDERS[1] + 0.001)
+    assert plane.to_lonlat(east, north) == pytest.approx(
+        (FLINDERS[0] + 0.001, FLINDERS[1] + 0.001))
+    # within 100 m of the origin, to the millimetre of the ellipsoid
+    lon, lat = plane.to_lonlat(60., -70.)
+    assert plane.distance(lon, lat) == pytest.approx(
+        vincenty(FLINDERS[0], FLINDERS[1], lon, lat)[0], abs=1e-3)
+
+
+def test_guidance():
+    target = Target(5.5538, 45.4788, '1')
+    lon, lat = target.plane.to_lonlat(3., 4.)
+    east, north, distance, azimuth = target.guidance(lon, lat)
+    assert (east, north) == pytest.approx((3., 4.))
+    assert distance == pytest.approx(5.)
+    # walk to the south-west
+    assert azimuth == pytest.approx(180. + 36.8699, abs=1e-4)
+    # far from the target, on the ellipsoid
+    east, north, distance, azimuth = target.guidance(5.5538, 45.5788)
+    assert distance == pytest.approx(vincenty(5.5538, 45.5788, 5.5538,
+                                              45.4788)[0])
+    assert azimuth == pytest.approx(180.)
+
+
+def test_utm_offset():
+    pytest.importorskip('utm')
+    target = Target(5.5538, 45.4788)
+    lon, lat = target.plane.to_lonlat(10., 20.)
+    easting, northing = target.utm(lon, lat)
+    reference = target.utm(target.lon, target.lat)
+    assert target.utmoffset(lon, lat) == pytest.approx(
+        (easting - reference[0], northing - reference[1]), abs=1e-3)
+
+
+def test_from_row():
+    target = Target.from_row(['7 ', 'P7', '5.5538', 'E', '45.4788', 'N'])
+    assert (target.name, target.lon, target.lat) == ('7', 5.5538, 45.4788)
+    assert Target.from_row(['7', 'P7', 'x', 'E', '45.4788']) is None
+    assert Target.from_row(['7', 'P7']) is None
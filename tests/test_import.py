@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+'''
+    Import-time budget of the command-line script.
+
+    Measures ``python -X importtime -c "import pygpssurvey.__main__"`` in a
+    subprocess, and checks that the board dependencies (pynmea2, utm,
+    pylink, serial, msvcrt) and the optional ones are not imported to build
+    the parser.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+#: Import time budget of the command-line script (milliseconds).
+IMPORT_BUDGET = 50.
+
+#: Best of this number of measures.
+RUNS = 5
+
+LAZY_MODULES = ('pynmea2', 'utm', 'pylink', 'serial', 'msvcrt', 'numpy',
+                'asyncio', 'sqlite3', 'pygpssurvey.device')
+
+
+def importtime(module):
+    '''Return the cumulative import time (us) of `module` and the list of
+    the modules imported with it.'''
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True,
+        check=True).stderr
+    cumulative = None
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            value = int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2].strip()
+        modules.append(name)
+        if name == module:
+            cumulative = value
+    return cumulative, modules
+
+
+def test_lazy_dependencies():
+    cumulative, modules = importtime('pygpssurvey.__main__')
+    loaded = [name for name in modules
+              if name.split('.')[0] in LAZY_MODULES or name in LAZY_MODULES]
+    assert loaded == []
+
+
+def test_import_budget():
+    best = min(importtime('pygpssurvey.__main__')[0]
+               for i in range(RUNS)) / 1e3
+    assert best <= IMPORT_BUDGET, (
+        'pygpssurvey.__main__ import time: %.1f ms (budget %.1f ms)'
+        % (best, IMPORT_BUDGET))
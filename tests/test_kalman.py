@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+    Kalman smoothing of the fixes: convergence on a still rover, tracking
+    of a walking one, restarts, and the agreement of the Python and NumPy
+    filters.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+import random
+
+import pytest
+
+from pygpssurvey.fix import Fix
+from pygpssurvey.geodesy import LocalTangentPlane
+from pygpssurvey.kalman import (KalmanFilter, make_filter, seconds_of_day,
+                                measurement_sigma)
+
+ORIGIN = LocalTangentPlane(5.5538, 45.4788)
+
+
+def fixes(count, speed=0., noise=0.5, seed=1, start=0):
+    '''Fixes of 1 Hz walking east at `speed` m/s, with a gaussian noise.'''
+    rng = random.Random(seed)
+    for i in range(start, start + count):
+        lon, lat = ORIGIN.to_lonlat(speed * i + rng.gauss(0., noise),
+                                    rng.gauss(0., noise))
+        yield Fix(timestamp=datetime.time(12, i // 60, i % 60), lon=lon,
+                  lon_dir='E', lat=lat, lat_dir='N', alt=553.8, alt_units='M',
+                  quality=1, sigma=noise)
+
+
+def test_still_rover():
+    kalman = KalmanFilter(processnoise=0.001)
+    raw, errors = [], []
+    for fix in fixes(60):
+        smoothed = kalman(fix)
+        raw.append(ORIGIN.distance(fix.lon, fix.lat))
+        errors.append(ORIGIN.distance(smoothed.lon, smoothed.lat))
+    # the smoothed positions are closer to the rover than the fixes
+    assert sum(errors[-30:]) < 0.8 * sum(raw[-30:])
+    assert smoothed.sigma < 0.6 * fix.sigma
+    assert smoothed.alt == pytest.approx(553.8)
+    assert smoothed.quality == 1 and smoothed.lon_dir == 'E'
+
+
+def test_walking_rover():
+    kalman = KalmanFilter(processnoise=0.1)
+    for fix in fixes(60, speed=1., noise=0.1):
+        smoothed = kalman(fix)
+    east, north = ORIGIN.to_local(smoothed.lon, smoothed.lat)
+    # no lag once the velocity is estimated
+    assert east == pytest.approx(59., abs=0.3)
+    assert kalman.state[0][1] == pytest.approx(1., abs=0.1)
+
+
+def test_restart():
+    kalman = KalmanFilter(maxgap=10.)
+    for fix in fixes(5):
+        kalman(fix)
+    # after a gap, the filter starts again on the fix
+    fix = next(fixes(1, start=100))
+    fix.lon, fix.lat = ORIGIN.to_lonlat(50., 0.)
+    smoothed = kalman(fix)
+    assert (smoothed.lon, smoothed.lat) == pytest.approx((fix.lon, fix.lat))
+    assert kalman.state[0][1] == 0.
+    # the fixes without position are given back
+    empty = Fix(timestamp=datetime.time(12, 1, 41))
+    assert kalman(empty) is empty
+
+
+def test_intervals():
+    kalman = KalmanFilter(interval=0.2)
+    assert kalman.interval_to(Fix(timestamp=datetime.time(23, 59, 59, 500000))) \
+        == 0.2
+    assert kalman.interval_to(Fix(timestamp=datetime.time(0, 0, 0, 500000))) \
+        == 1.
+    assert kalman.interval_to(Fix()) == 0.2
+    assert seconds_of_day(datetime.time(1, 2, 3, 500000)) == 3723.5
+    assert measurement_sigma(Fix(quality=4)) == 0.02
+    assert measurement_sigma(Fix(quality=4, sigma=0.05)) == 0.05
+
+
+def test_numpy_filter():
+    pytest.importorskip('numpy')
+    python = make_filter('python', processnoise=0.1)
+    numpy = make_filter('numpy', processnoise=0.1)
+    for fix in fixes(30, speed=0.5):
+        a, b = python(fix), numpy(fix)
+        assert (a.lon, a.lat, a.alt) == pytest.approx((b.lon, b.lat, b.alt),
+                                                      abs=1e-12)
+        assert a.sigma == pytest.approx(b.sigma)
+    with pytest.raises(ValueError):
+        make_filter('c')
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''
+    Supervised links: reconnection, bounded open and reconnection times,
+    reads and writes from several threads, and the pool of links.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import threading
+import time
+
+import pytest
+
+from pygpssurvey import link as linkmodule
+from pygpssurvey.link import SupervisedLink, LinkPool
+
+
+class FakeLink(object):
+    '''`PyLink` connection failing on demand.'''
+
+    def __init__(self, url='tcp:127.0.0.1:4000', data=b'$GPGGA'):
+        self.url = url
+        self.data = data
+        self.opens = 0
+        self.closes = 0
+        self.failopen = False
+        self.failread = False
+        self.written = []
+        self.writing = None     # event a write waits for
+
+    def open(self):
+        if self.failopen:
+            raise IOError('refused')
+        self.opens += 1
+
+    def close(self):
+        self.closes += 1
+
+    def settimeout(self, timeout):
+        pass
+
+    def read(self, size=None, timeout=None):
+        if self.failread:
+            raise IOError('reset')
+        return self.data
+
+    def write(self, data):
+        if self.writing is not None:
+            self.writing.wait()
+        self.written.append(data)
+
+
+def supervised(link, **kwargs):
+    kwargs.setdefault('delay', 0.01)
+    kwargs.setdefault('jitter', 0)
+    return SupervisedLink(link, **kwargs)
+
+
+def test_reconnect_after_read_error():
+    fake = FakeLink()
+    link = supervised(fake)
+    assert link.read() == b'$GPGGA'
+    fake.failread = True
+    assert link.read() == b''
+    fake.failread = False
+    assert link.read() == b'$GPGGA'
+    assert link.reconnects >= 1
+    assert len(link.downtimes) == link.reconnects
+
+
+def test_first_open_deadline():
+    fake = FakeLink()
+    fake.failopen = True
+    link = supervised(fake, opentimeout=0.1)
+    start = time.time()
+    with pytest.raises(IOError):
+        link.read()
+    assert time.time() - start < 1.
+
+
+def test_reconnect_deadline():
+    fake = FakeLink()
+    link = supervised(fake, reconnecttimeout=0.1)
+    link.read()
+    fake.failread = fake.failopen = True
+    start = time.time()
+    # the reads give no data while the link is down, in bounded times
+    assert link.read() == b''
+    assert link.read() == b''
+    assert time.time() - start < 2.
+    assert not link.is_open and link.downsince is not None
+    fake.failread = fake.failopen = False
+    assert link.read() == b'$GPGGA'
+    assert link.reconnects == 1
+    # the writes fail while the link is down
+    fake.failopen = True
+    link.close()
+    with pytest.raises(IOError):
+        link.write(b'frame')
+
+
+def test_reconnect_waits_for_writes():
+    fake = FakeLink()
+    link = supervised(fake)
+    link.open()
+    fake.writing = threading.Event()
+    writer = threading.Thread(target=link.write, args=(memoryview(b'rtcm'),))
+    writer.start()
+    while not link.inflight:
+        time.sleep(0.001)
+    reconnect = threading.Thread(target=link.reconnect)
+    reconnect.start()
+    time.sleep(0.05)
+    # the link is not closed under the write in progress
+    assert fake.closes == 0
+    fake.writing.set()
+    writer.join()
+    reconnect.join()
+    assert fake.written == [b'rtcm'] and isinstance(fake.written[0], bytes)
+    assert fake.closes == 1 and link.is_open
+
+
+def test_aread_reconnect():
+    import asyncio
+    fake = FakeLink()
+    link = supervised(fake, reconnecttimeout=0.1)
+
+    async def reads():
+        data = [await link.aread()]
+        fake.failread = fake.failopen = True
+        data.append(await link.aread())
+        fake.failread = fake.failopen = False
+        data.append(await link.aread())
+        return data
+
+    assert asyncio.run(reads()) == [b'$GPGGA', b'', b'$GPGGA']
+    assert link.reconnects == 1
+
+
+def test_pool(monkeypatch):
+    links = []
+
+    class FakePyLink(object):
+        @staticmethod
+        def link_from_url(url):
+            # pylink normalizes the URLs
+            links.append(FakeLink(url.replace('localhost', '127.0.0.1')))
+            return links[-1]
+
+    monkeypatch.setattr(linkmodule, 'pylink', FakePyLink)
+    pool = LinkPool(delay=0.01)
+    first = pool.acquire('tcp:localhost:4000')
+    second = pool.acquire('tcp:localhost:4000')
+    assert first is second and len(links) == 1
+    assert first.url == 'tcp:127.0.0.1:4000'
+    pool.release(first.poolurl)
+    assert links[0].closes == 0
+    pool.release(second.poolurl)
+    assert links[0].closes == 1
+    assert pool.links == {}
+
+
+def test_device_releases_pooled_link(monkeypatch):
+    from pygpssurvey.device import GPSSurvey
+    links = []
+
+    class FakePyLink(object):
+        @staticmethod
+        def link_from_url(url):
+            links.append(FakeLink(url + ':8N1'))
+            return links[-1]
+
+    monkeypatch.setattr(linkmodule, 'pylink', FakePyLink)
+    pool = LinkPool(delay=0.01)
+    device = GPSSurvey.from_url('serial:/dev/ttyUSB0:4800', pool=pool)
+    device.close()
+    assert links[0].closes == 1
+    assert pool.links == {}
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''
+    Stake-out planning: grids generated from their corners, their input
+    points file, and the walking order of the points.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import math
+import random
+
+import pytest
+
+from pygpssurvey.geodesy import LocalTangentPlane, Target
+from pygpssurvey.planner import (grid, grid_rows, Buckets, plan, reorder,
+                                 nearest_neighbour_tour, two_opt,
+                                 path_length)
+
+
+def corners(lon, lat, width, height):
+    '''Corners of a rectangle of `width` x `height` meters, north-east of
+    (lon, lat).'''
+    plane = LocalTangentPlane(lon, lat)
+    return [(lon, lat, 100.), plane.to_lonlat(width, 0.) + (110.,),
+            plane.to_lonlat(0., height) + (90.,)]
+
+
+def test_grid():
+    points = grid(corners(5.5538, 45.4788, 20., 10.), 5.)
+    assert len(points) == 5 * 3
+    # serpentine order, row by row
+    assert [point[:2] for point in points[:7]] == [
+        (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (2, 5), (2, 4)]
+    # the corners are points of the grid
+    first, last = points[0], points[-1]
+    assert first[2:] == pytest.approx((5.5538, 45.4788, 100.))
+    plane = LocalTangentPlane(5.5538, 45.4788)
+    assert plane.to_local(last[2], last[3]) == pytest.approx((20., 10.),
+                                                             abs=1e-6)
+    assert last[4] == pytest.approx(100.)
+    with pytest.raises(ValueError):
+        grid(corners(5.5538, 45.4788, 20., 10.)[:2], 5.)
+
+
+def test_grid_quadrilateral():
+    plane = LocalTangentPlane(5.5538, 45.4788)
+    quad = [plane.to_lonlat(x, y) for x, y in ((0., 0.), (10., 0.),
+                                                (12., 10.), (0., 10.))]
+    points = grid(quad, 5.)
+    assert len(points) == 3 * 3
+    # no altitude unless all the corners have one
+    assert all(point[4] is None for point in points)
+
+
+@pytest.mark.parametrize('lon,lat', [(5.5538, 45.4788), (-1.5, -45.4788),
+                                     (-70.6, 33.4), (151.2, -33.9)])
+def test_grid_rows_to_targets(lon, lat):
+    points = grid(corners(lon, lat, 10., 10.), 5.)
+    lines = grid_rows(points, ';', '%.12g')
+    assert lines[0].startswith('pointnum;pointname;lon;lon_dir')
+    targets = [Target.from_row(line.rstrip('\n').split(';'))
+               for line in lines[1:]]
+    assert [target.name for target in targets] == [
+        str(num) for num in range(1, len(points) + 1)]
+    for point, target in zip(points, targets):
+        assert (target.lon, target.lat) == pytest.approx(point[2:4],
+                                                         abs=1e-9)
+    row = lines[1].rstrip('\n').split(';')
+    assert row[3] == ('E' if lon >= 0 else 'W')
+    assert row[5] == ('N' if lat >= 0 else 'S')
+
+
+def test_buckets_nearest():
+    rand = random.Random(3)
+    xs = [rand.uniform(0., 100.) for i in range(300)]
+    ys = [rand.uniform(0., 50.) for i in range(300)]
+    buckets = Buckets(xs, ys)
+    for x, y in ((50., 25.), (-20., 80.), (99., 1.)):
+        expected = sorted(range(300), key=lambda i: math.hypot(xs[i] - x,
+                                                               ys[i] - y))
+        assert buckets.nearest(x, y, 5) == expected[:5]
+    assert 0 not in buckets.nearest(xs[0], ys[0], 3, exclude=0)
+
+
+def test_plan():
+    rand = random.Random(5)
+    xs = [rand.uniform(0., 200.) for i in range(500)]
+    ys = [rand.uniform(0., 200.) for i in range(500)]
+    tour = nearest_neighbour_tour(xs, ys, start=7)
+    length = path_length(xs, ys, tour)
+    improved = two_opt(xs, ys, list(tour))
+    assert improved[0] == 7
+    assert sorted(improved) == list(range(500))
+    assert path_length(xs, ys, improved) < length
+    assert plan([], []) == []
+
+
+def test_reorder():
+    plane = LocalTangentPlane(-1.5, -45.5)
+    positions = [0., 30., 10., 20.]
+    rows = [['pointnum', 'pointname', 'lon', 'lon_dir', 'lat', 'lat_dir']]
+    for num, east in enumerate(positions, 1):
+        lon, lat = plane.to_lonlat(east, 0.)
+        rows.append([str(num), '', repr(lon), 'W', repr(lat), 'S'])
+    ordered = reorder(rows)
+    assert ordered[0] == rows[0]
+    assert [row[0] for row in ordered[1:]] == ['1', '3', '4', '2']
+    start = plane.to_lonlat(31., 0.)
+    assert [row[0] for row in reorder(rows, start)[1:]] == ['2', '4', '3',
+                                                             '1']
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''
+    Profiling: stage timings of the acquisition, their report, and the
+    cProfile and sampling profilers.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import pstats
+import time
+
+import pytest
+
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.profiling import (Timings, Span, Profiler, NULL_SPAN,
+                                   NULL_TIMINGS, STAGES)
+from .replay import replay, synthetic_survey
+
+
+def test_span():
+    span = Span('read')
+    for delay in (0., 0.01):
+        with span:
+            time.sleep(delay)
+    assert span.count == 2
+    assert span.max >= 10e6 and span.total >= span.max
+
+
+def test_timings():
+    timings = Timings()
+    assert list(timings.spans) == list(STAGES)
+    with timings.parse:
+        pass
+    lines = timings.report()
+    assert lines[0].split() == ['stage', 'count', 'total', 'ms', 'mean', 'us',
+                                'max', 'us']
+    assert lines[3].split()[:2] == ['parse', '1']
+    # disabled: every stage is the no-op span
+    assert all(span is NULL_SPAN for span in NULL_TIMINGS.spans.values())
+    assert NULL_TIMINGS.read is NULL_SPAN
+    assert len(NULL_TIMINGS.report()) == 1
+
+
+def test_save(tmp_path):
+    filename = str(tmp_path / 'profile.stages')
+    Timings().save(filename)
+    with open(filename) as stages:
+        assert len(stages.read().splitlines()) == 1 + len(STAGES)
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(1000))
+
+
+def test_cprofile(tmp_path):
+    filename = str(tmp_path / 'profile.pstats')
+    with Profiler(filename, 'cprofile'):
+        busy(0.01)
+    functions = [function[2] for function in pstats.Stats(filename).stats]
+    assert 'busy' in functions
+
+
+def test_sampling(tmp_path):
+    filename = str(tmp_path / 'profile.stacks')
+    with Profiler(filename, 'sampling', interval=0.001):
+        busy(0.1)
+    with open(filename) as stacks:
+        lines = stacks.read().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert any('busy (test_profiling.py' in line for line in lines)
+    with pytest.raises(ValueError):
+        Profiler(filename, 'perf')
+
+
+def test_device_stages():
+    timings = Timings()
+
+    def device(link):
+        device = GPSSurvey(link)
+        device.timings = timings
+        return device
+
+    survey, golden = synthetic_survey(3, 5)
+    replay(device, survey)
+    # the frames are read, split and parsed, the fixes of the captures are
+    # filtered and written
+    assert timings.read.count > 0 and timings.frame.count > 0
+    assert timings.parse.count >= 15
+    assert timings.filter.count == 15
+    assert timings.write.count == 3
+    assert timings.project.count == 0
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+'''
+    Regression and timing gates of the parsing and averaging path: the
+    recorded frames (rawoutput.txt) and generated surveys are replayed
+    through `GPSSurvey` with several read chunk sizes, and their points
+    compared to the golden ones.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import os
+import time
+
+import pytest
+
+from pygpssurvey.device import GPSSurvey
+from pygpssurvey.decimation import decimator_from_string
+from .replay import (replay, read_rawoutput, read_points, compare_points,
+                     synthetic_survey, EPOCH_BUDGET)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+#: Read chunk sizes of the replays: a byte at a time, frames split across
+#: reads, several frames and several points by read.
+CHUNKS = (1, 37, 512, 4096)
+
+#: Size of the survey replayed for the timing gate.
+TIMED_POINTS = 500
+TIMED_MEASURESNB = 10
+
+
+def check_points(output, golden):
+    errors = compare_points(read_points(io.StringIO(output)), golden)
+    assert errors == []
+
+
+@pytest.mark.parametrize('chunk', CHUNKS)
+def test_recorded(chunk):
+    recorded = read_rawoutput(os.path.join(ROOT, 'rawoutput.txt'))
+    golden = read_points(os.path.join(ROOT, 'output.txt'))
+    output, raw, device = replay(GPSSurvey, recorded, chunk)
+    check_points(output, golden)
+
+
+@pytest.mark.parametrize('chunk', CHUNKS)
+def test_synthetic(chunk):
+    survey, golden = synthetic_survey(points=50, measuresnb=10)
+    output, raw, device = replay(GPSSurvey, survey, chunk)
+    check_points(output, golden)
+    # the raw output is replayed again to the same points
+    output, raw, device = replay(GPSSurvey, read_rawoutput(io.StringIO(raw)),
+                                 chunk)
+    check_points(output, golden)
+
+
+def test_averaged_rawoutput():
+    # the averages of equal intervals are written as GGA sentences, their
+    # mean is the point
+    survey, golden = synthetic_survey(points=20, measuresnb=10)
+    output, raw, device = replay(
+        GPSSurvey, survey, rawdecimator=decimator_from_string('interval:5'))
+    points = read_rawoutput(io.StringIO(raw))
+    assert [len(lines) for pointnum, lines in points] == [2] * len(golden)
+    output, raw, device = replay(GPSSurvey, points)
+    check_points(output, golden)
+
+
+def test_epoch_budget():
+    survey, golden = synthetic_survey(TIMED_POINTS, TIMED_MEASURESNB)
+    start = time.perf_counter()
+    output, raw, device = replay(GPSSurvey, survey, 512)
+    elapsed = time.perf_counter() - start
+    check_points(output, golden)
+    perepoch = elapsed / (TIMED_POINTS * TIMED_MEASURESNB) * 1e6
+    assert perepoch <= EPOCH_BUDGET, (
+        'replay: %.1f us/epoch (budget %.1f us)' % (perepoch, EPOCH_BUDGET))
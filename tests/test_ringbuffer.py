@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+'''
+    Ring of the last epochs: overwriting of the oldest epochs, time windows
+    and last epochs across the wrap-around.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+from pygpssurvey.ringbuffer import EpochRing
+
+
+def test_append_and_wrap():
+    ring = EpochRing(4)
+    assert len(ring) == 0 and ring.last(2) == []
+    for sequence in range(1, 7):
+        ring.append(sequence, 'fix%d' % sequence, 100. + sequence)
+    assert len(ring) == 4
+    # the oldest epochs are overwritten
+    assert [epoch[0] for epoch in ring.last(10)] == [3, 4, 5, 6]
+    assert ring.last(2) == [(5, 105., 'fix5'), (6, 106., 'fix6')]
+
+
+def test_window():
+    ring = EpochRing(8)
+    for sequence in range(1, 12):
+        ring.append(sequence, None, 100. + sequence)
+    # received at or after now - seconds, oldest first
+    assert [epoch[0] for epoch in ring.window(2.5, now=111.)] == [9, 10, 11]
+    assert ring.window(0.5, now=120.) == []
+    # limited to the epochs kept
+    assert len(ring.window(100., now=111.)) == 8
+
+
+def test_clear():
+    ring = EpochRing(3)
+    ring.append(1, 'fix', 1.)
+    ring.clear()
+    assert len(ring) == 0 and ring.window(10., now=1.) == []
+    ring.append(2, 'fix', 2.)
+    assert ring.last(3) == [(2, 2., 'fix')]
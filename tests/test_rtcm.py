@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+'''
+    RTCM3 framing and forwarding: CRC-24Q, runs of frames, epoch time of
+    the observations and pacing of the recorded corrections.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import time
+
+from pygpssurvey.rtcm import (crc24q, rtcm3_frame, RTCM3Framer,
+                              CorrectionForwarder)
+
+
+def message(number, epoch=None, size=20):
+    '''Payload of a message: number, station id 0, GPS time of week.'''
+    bits = number << 12
+    if epoch is not None:
+        bits = (bits << 30) | epoch
+        return rtcm3_frame((bits << (8 * size - 54)).to_bytes(size, 'big'))
+    return rtcm3_frame((bits << (8 * size - 24)).to_bytes(size, 'big'))
+
+
+def test_crc24q():
+    assert crc24q(b'123456789') == 0xcde703
+    assert crc24q(b'') == 0
+    frame = rtcm3_frame(b'\x3e\xd0\x00\x03')
+    assert frame[:3] == b'\xd3\x00\x04' and len(frame) == 10
+    assert crc24q(frame) == 0
+
+
+def test_framer_runs():
+    frames = [message(1005), message(1077, 1000), message(1230)]
+    bad = bytearray(message(1033))
+    bad[-1] ^= 0xff
+    data = b'\x00\xd3' + frames[0] + bytes(bad) + frames[1] + frames[2]
+    framer = RTCM3Framer()
+    written = []
+    for i in range(0, len(data), 9):
+        framer.feed(data[i:i + 9])
+        framer.process(lambda view: written.append(view.tobytes()))
+    # the consecutive valid frames are written together
+    assert b''.join(written) == b''.join(frames)
+    assert written[0] == frames[0]
+    assert framer.frames == 3 and framer.badframes == 1
+    assert framer.messages == {1005: 1, 1077: 1, 1230: 1}
+    assert framer.length == 0
+
+
+def test_framer_epochs():
+    framer = RTCM3Framer()
+    framer.feed(message(1005) + message(1004, 123456) + message(1097, 7))
+    epochs = []
+    framer.process(lambda view: epochs.append(framer.epoch), runs=False)
+    assert epochs == [None, 123456, 7]
+
+
+def test_framer_readinto():
+    framer = RTCM3Framer(size=64)
+    frame = message(1005)
+    space = framer.space()
+    space[:len(frame)] = frame
+    framer.commit(len(frame))
+    written = []
+    framer.process(lambda view: written.append(bytes(view)))
+    assert written == [frame]
+    # an overflow drops the buffered data
+    framer.feed(b'\xd3\x00\x3f' + bytes(50))
+    framer.feed(frame)
+    framer.process(lambda view: written.append(bytes(view)))
+    assert written == [frame, frame]
+
+
+class Target(object):
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append((time.time(), bytes(data)))
+
+
+def forward(data, count, **kwargs):
+    '''Forward `data` until `count` writes are done.'''
+    target = Target()
+    forwarder = CorrectionForwarder(io.BytesIO(data), target, timeout=0.01,
+                                    reportinterval=0, **kwargs)
+    forwarder.start()
+    deadline = time.time() + 5
+    while len(target.frames) < count and time.time() < deadline:
+        time.sleep(0.01)
+    forwarder.stop(1)
+    return target.frames, forwarder
+
+
+def test_forwarder_pacing():
+    # observations 200 ms apart, with a station message in between
+    data = (message(1077, 1000) + message(1005) + message(1077, 1200) +
+            message(1077, 1400))
+    frames, forwarder = forward(data, 4)
+    assert [frame for sent, frame in frames] == [message(1077, 1000),
+                                                 message(1005),
+                                                 message(1077, 1200),
+                                                 message(1077, 1400)]
+    assert 0.3 < frames[-1][0] - frames[0][0] < 1.
+    assert forwarder.forwarded == len(data)
+    stats = forwarder.stats()
+    assert stats['frames'] == 4 and stats['messages'] == {1005: 1, 1077: 3}
+
+
+def test_forwarder_unpaced():
+    data = message(1077, 1000) + message(1077, 60000)
+    frames, forwarder = forward(data, 1, pace=False)
+    assert b''.join(frame for sent, frame in frames) == data
+    assert frames[-1][0] - frames[0][0] < 0.5
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+'''
+    Live server: the JSON endpoints, the commands requests, the server-sent
+    events and the WebSocket stream of the fixes.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+import http.client
+import json
+import socket
+import struct
+import time
+
+import pytest
+
+from pygpssurvey.commands import Commands
+from pygpssurvey.fix import Fix
+from pygpssurvey.server import LiveServer, websocket_accept, websocket_frame
+
+
+def fix(second):
+    return Fix(timestamp=datetime.time(12, 0, second), lon=5.5538,
+               lon_dir='E', lat=45.4788, lat_dir='N', alt=553.8,
+               alt_units='M', quality=4, numsats=12)
+
+
+@pytest.fixture
+def server():
+    commands = Commands([])
+    server = LiveServer('127.0.0.1', 0, commands,
+                        stats=lambda: {'epochs': 3}).start()
+    yield server
+    server.stop()
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.port,
+                                            timeout=2)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, data
+
+
+def wait_for(condition, timeout=2.):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_websocket_accept():
+    # example of RFC 6455
+    assert (websocket_accept('dGhlIHNhbXBsZSBub25jZQ==') ==
+            's3pPLMBiTxaQ9kYGzzhZRbK+xOo=')
+    assert websocket_frame(b'M') == b'\x81\x01M'
+    assert websocket_frame(bytes(200))[:4] == b'\x81\x7e\x00\xc8'
+
+
+def test_endpoints(server):
+    assert request(server, 'GET', '/fix') == (200, b'null')
+    server.publish(fix(1))
+    server.publish(fix(2))
+    assert wait_for(lambda: server.latest is not None and
+                    server.latest.version == 2)
+    status, body = request(server, 'GET', '/fix')
+    data = json.loads(body)
+    assert status == 200
+    assert data['timestamp'] == '12:00:02' and data['quality'] == 4
+    status, body = request(server, 'GET', '/stats')
+    stats = json.loads(body)
+    assert stats['published'] == 2 and stats['device'] == {'epochs': 3}
+    assert request(server, 'POST', '/fix')[0] == 405
+    assert request(server, 'GET', '/other')[0] == 404
+    assert request(server, 'GET', '/events?rate=x')[0] == 400
+
+
+def test_commands(server):
+    assert request(server, 'POST', '/capture')[0] == 204
+    assert request(server, 'POST', '/undo')[0] == 204
+    assert request(server, 'POST', '/command', b'N L\n')[0] == 204
+    assert request(server, 'GET', '/capture')[0] == 405
+    assert [server.commands.get(1) for i in range(4)] == ['M', 'D', 'N', 'L']
+    assert server.commands.get() is None
+
+
+def test_events(server):
+    client = socket.create_connection(('127.0.0.1', server.port), timeout=2)
+    client.sendall(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    stream = client.makefile('rb')
+    assert stream.readline() == b'HTTP/1.1 200 OK\r\n'
+    while stream.readline() != b'\r\n':
+        pass
+    assert wait_for(lambda: server.clients == 1)
+    server.publish(fix(1))
+    line = stream.readline()
+    assert line.startswith(b'data: ')
+    assert json.loads(line[6:])['timestamp'] == '12:00:01'
+    assert stream.readline() == b'\n'
+    client.close()
+
+
+def test_websocket(server):
+    client = socket.create_connection(('127.0.0.1', server.port), timeout=2)
+    client.sendall(b'GET /ws HTTP/1.1\r\nHost: localhost\r\n'
+                   b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                   b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                   b'Sec-WebSocket-Version: 13\r\n\r\n')
+    stream = client.makefile('rb')
+    assert stream.readline() == b'HTTP/1.1 101 Switching Protocols\r\n'
+    headers = []
+    while True:
+        line = stream.readline()
+        if line == b'\r\n':
+            break
+        headers.append(line)
+    assert (b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n'
+            in headers)
+    assert wait_for(lambda: server.clients == 1)
+    server.publish(fix(3))
+    first, length = stream.read(2)
+    assert first == 0x81
+    if length == 126:
+        length, = struct.unpack('!H', stream.read(2))
+    assert json.loads(stream.read(length))['timestamp'] == '12:00:03'
+    # a masked text frame from the client is a command
+    mask = b'\x01\x02\x03\x04'
+    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(b'M'))
+    client.sendall(struct.pack('!BB', 0x81, 0x80 | 1) + mask + payload)
+    assert server.commands.get(1) == 'M'
+    # closed by the client
+    client.sendall(struct.pack('!BB', 0x88, 0x80) + mask)
+    assert stream.read(2) == b'\x88\x00'
+    client.close()
+    assert wait_for(lambda: server.clients == 0)
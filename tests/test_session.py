@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+    Session store: points with their epochs, batched inserts, device
+    information and settings, and the queries by point and by time.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+import sqlite3
+
+import pytest
+
+from pygpssurvey.fix import Fix
+from pygpssurvey.session import Session
+
+
+def fix(second, lon=5.5538):
+    return Fix(timestamp=datetime.time(12, 0, second), lon=lon, lon_dir='E',
+               lat=45.4788, lat_dir='N', alt=553.8, alt_units='M', quality=4,
+               numsats=12, hdop=0.8, sigma=0.01)
+
+
+def measure(session, pointnum, seconds, start=1000.):
+    session.beginpoint(pointnum, 'P%d' % pointnum)
+    for second in seconds:
+        session.addepoch(fix(second), start + second)
+    session.endpoint(5.5538, 'E', 45.4788, 'N', 553.8, 'M')
+
+
+def test_points_and_epochs(tmp_path):
+    filename = str(tmp_path / 'session.sqlite')
+    with Session(filename, batchsize=2) as session:
+        measure(session, 1, range(5))
+        measure(session, 2, range(10, 13))
+        points = session.points()
+        assert list(points['pointnum']) == [1, 2]
+        assert list(points['epochs']) == [5, 3]
+        assert points[0]['pointname'] == 'P1' and points[0]['alt'] == 553.8
+        epochs = session.epochs(2)
+        assert list(epochs['time']) == [1010., 1011., 1012.]
+        assert epochs[0]['timestamp'] == '12:00:10'
+        assert epochs[0]['sentence'].startswith('$GPGGA,120010.00,')
+        assert len(session.epochsbetween(1003., 1010.5)) == 3
+        # a point and its epochs are deleted together
+        session.deletepoint(points[0]['id'])
+        assert len(session.points()) == 1
+        assert len(session.epochsbetween(0, 2000)) == 3
+    # the session is appended when opened again
+    with Session(filename) as session:
+        measure(session, 3, [20])
+        assert list(session.points()['pointnum']) == [2, 3]
+
+
+def test_batches(tmp_path):
+    filename = str(tmp_path / 'session.sqlite')
+    session = Session(filename, batchsize=3)
+    session.beginpoint(1)
+    for second in range(4):
+        session.addepoch(fix(second))
+    # the epochs are inserted by batches, the rest is buffered
+    reader = sqlite3.connect(filename)
+    assert reader.execute('SELECT count(*) FROM epochs').fetchone()[0] == 3
+    assert len(session.batch) == 1
+    session.close()
+    # the buffered epochs are inserted on close
+    assert reader.execute('SELECT count(*) FROM epochs').fetchone()[0] == 4
+    reader.close()
+
+
+def test_device_and_settings(tmp_path):
+    with Session(str(tmp_path / 'session.sqlite')) as session:
+        session.setdevice(url='serial:/dev/ttyUSB0:4800', protocol='nmea')
+        session.setsettings({'measuresnb': 10, 'fixfilter': None})
+        assert session.device() == {'protocol': 'nmea',
+                                    'url': 'serial:/dev/ttyUSB0:4800'}
+        assert session.settings() == {'fixfilter': None, 'measuresnb': '10'}
+        session.setsettings({'measuresnb': 20})
+        assert session.settings()['measuresnb'] == '20'
+
+
+def test_transaction_rollback(tmp_path):
+    with Session(str(tmp_path / 'session.sqlite')) as session:
+        with pytest.raises(ValueError):
+            with session.transaction() as db:
+                db.execute('INSERT INTO points (pointnum) VALUES (1)')
+                raise ValueError()
+        assert len(session.points()) == 0
+        # no point is measured, the end of point is ignored
+        session.endpoint(5.5, 'E', 45.5, 'N', 0., 'M')
+        assert len(session.points()) == 0
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+    UBX reader: framing, checksums, NAV-PVT scaling and the high precision
+    coordinates of NAV-HPPOSLLH.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import datetime
+
+import pytest
+
+from pygpssurvey.filters import FixFilter
+from pygpssurvey.ubx import (UBXReader, ubx_frame, ubx_checksum, pvt_quality,
+                             NAV, NAV_PVT, NAV_HPPOSLLH, NAV_PVT_STRUCT,
+                             NAV_HPPOSLLH_STRUCT)
+
+ITOW = 45296000     # 12:34:56
+
+
+def pvt(lon=5.5538, lat=-45.4788, hmsl=553.8, flags=0x83, pdop=80,
+        hacc=14, itow=ITOW):
+    return ubx_frame(NAV, NAV_PVT, NAV_PVT_STRUCT.pack(
+        itow, 2018, 4, 30, 12, 34, 56, 0x07, 20, 500000000, 3, flags, 0, 12,
+        int(round(lon * 1e7)), int(round(lat * 1e7)), 0, int(hmsl * 1e3),
+        hacc, 20, 0, 0, 0, 0, 0, 0, 0, pdop, 0, 0, 0))
+
+
+def hpposllh(lon=5.5538, lat=-45.4788, hmsl=553.8, lonhp=3, lathp=-2,
+             hmslhp=4, flags=0, itow=ITOW):
+    return ubx_frame(NAV, NAV_HPPOSLLH, NAV_HPPOSLLH_STRUCT.pack(
+        0, flags, itow, int(round(lon * 1e7)), int(round(lat * 1e7)), 0,
+        int(hmsl * 1e3), lonhp, lathp, 0, hmslhp, 140, 200))
+
+
+def test_checksum():
+    # UBX-MON-VER poll, checksum from the u-blox protocol specification
+    assert ubx_frame(0x0a, 0x04, b'') == b'\xb5\x62\x0a\x04\x00\x00\x0e\x34'
+    assert ubx_checksum(b'\x06\x01\x03\x00\xf0\x01\x00') == (0xfb, 0x11)
+
+
+def test_pvt_scaling():
+    fixes = UBXReader().feed(pvt())
+    assert len(fixes) == 1
+    fix = fixes[0]
+    assert fix.lon == pytest.approx(5.5538, abs=1e-9)
+    assert fix.lat == pytest.approx(-45.4788, abs=1e-9)
+    assert (fix.lon_dir, fix.lat_dir) == ('E', 'S')
+    assert fix.alt == pytest.approx(553.8)
+    assert fix.timestamp == datetime.time(12, 34, 56, 500000)
+    assert fix.quality == 4 and fix.numsats == 12
+    assert fix.hdop == pytest.approx(0.8)
+    assert fix.sigma == pytest.approx(0.014)
+    # written to the raw output as a GGA sentence
+    assert str(fix).startswith('$GPGGA,123456.50,4528.7280000,S,'
+                               '00533.2280000,E,4,12,0.80,553.8000,M,')
+
+
+def test_pvt_quality():
+    assert pvt_quality(3, 0x00) == 0          # gnssFixOK not set
+    assert pvt_quality(3, 0x01) == 1
+    assert pvt_quality(3, 0x03) == 2          # differential
+    assert pvt_quality(3, 0x43) == 5          # RTK float
+    assert pvt_quality(3, 0x83) == 4          # RTK fixed
+    assert pvt_quality(1, 0x01) == 6          # dead reckoning
+
+
+def test_hdop_filter():
+    # the fixes decoded from NAV-PVT pass or fail the maxhdop rule on
+    # their position DOP
+    fixfilter = FixFilter.from_string('maxhdop=2')
+    assert fixfilter.accept(UBXReader().feed(pvt(pdop=150))[0])
+    assert not fixfilter.accept(UBXReader().feed(pvt(pdop=250))[0])
+
+
+def test_high_precision():
+    reader = UBXReader()
+    fixes = reader.feed(hpposllh() + pvt())
+    assert len(fixes) == 1
+    fix = fixes[0]
+    assert fix.lon == pytest.approx(5.5538 + 3e-9, abs=1e-12)
+    assert fix.lat == pytest.approx(-45.4788 - 2e-9, abs=1e-12)
+    assert fix.alt == pytest.approx(553.8004)
+    assert fix.sigma == pytest.approx(0.014)
+    # the next NAV-PVT waits for its NAV-HPPOSLLH
+    assert reader.feed(pvt(itow=ITOW + 1000)) == []
+    fixes = reader.feed(hpposllh(lonhp=-5, itow=ITOW + 1000))
+    assert fixes[0].lon == pytest.approx(5.5538 - 5e-9, abs=1e-12)
+    # invalid high precision coordinates are not used
+    reader.feed(hpposllh(lonhp=-5, flags=0x01, itow=ITOW + 2000))
+    fixes = reader.feed(pvt(itow=ITOW + 2000))
+    assert fixes[0].lon == pytest.approx(5.5538, abs=1e-12)
+
+
+def test_split_frames_and_errors():
+    data = pvt() + b'\x00\xb5' + pvt(lon=6.) + pvt(lat=46.)
+    # a corrupted frame is dropped, the next ones are decoded
+    corrupted = bytearray(data)
+    corrupted[20] ^= 0xff
+    reader = UBXReader()
+    fixes = []
+    for i in range(0, len(corrupted), 7):
+        fixes.extend(reader.feed(bytes(corrupted[i:i + 7])))
+    assert [round(fix.lon, 4) for fix in fixes] == [6., 5.5538]
+    assert reader.badframes == 1 and reader.frames == 2
+    assert len(reader.buffer) == 0
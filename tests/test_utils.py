@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+'''
+    Helpers of `pygpssurvey.utils`.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import asyncio
+import time
+from array import array
+
+import pytest
+
+from pygpssurvey import utils
+from pygpssurvey.utils import (retry, retry_metrics, Table, csv_to_table,
+                               Dict, ListDict, dict_to_csv, write_csv,
+                               CSVWriter, bytes_to_hex, hex_to_bytes,
+                               byte_to_binary, bytes_to_binary, hex_to_binary,
+                               binary_to_int, get_bits, get_signed_bits,
+                               StructFields)
+
+
+def failing(failures, error=IOError):
+    '''Callable raising `error` the first `failures` calls.'''
+    calls = []
+
+    def f():
+        calls.append(time.time())
+        if len(calls) <= failures:
+            raise error('failure %d' % len(calls))
+        return len(calls)
+    f.calls = calls
+    return f
+
+
+def test_retry_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(utils.time, 'sleep', sleeps.append)
+    retried = []
+    wrapped = retry(tries=5, delay=1, backoff=2, maxdelay=3,
+                    on_retry=retried.append, name='test.backoff')(failing(3))
+    assert wrapped() == 4
+    assert len(retried) == 3 and all(isinstance(e, IOError) for e in retried)
+    assert sleeps == [1, 2, 3]
+    assert retry_metrics()['test.backoff'] == {
+        'calls': 4, 'retries': 3, 'failures': 0}
+
+
+def test_retry_gives_up():
+    wrapped = retry(tries=2, delay=0, name='test.giveup')(failing(5))
+    with pytest.raises(IOError):
+        wrapped()
+    assert retry_metrics()['test.giveup']['failures'] == 1
+    # the other exceptions are not retried
+    f = failing(1, ValueError)
+    with pytest.raises(ValueError):
+        retry(tries=3, delay=0, exceptions=(IOError,))(f)()
+    assert len(f.calls) == 1
+
+
+def test_retry_deadline():
+    f = failing(1000)
+    start = time.time()
+    with pytest.raises(IOError):
+        retry(tries=None, delay=0.01, deadline=0.1)(f)()
+    assert time.time() - start < 0.5
+    assert len(f.calls) > 2
+
+
+def test_retry_check():
+    values = iter([0, 0, 3])
+    wrapped = retry(tries=5, delay=0, check=bool)(lambda: next(values))
+    assert wrapped() == 3
+    with pytest.raises(ValueError):
+        retry(tries=0)
+
+
+def test_retry_coroutine():
+    f = failing(2)
+    reconnects = []
+
+    async def on_retry(error):
+        reconnects.append(error)
+
+    @retry(tries=3, delay=0.01, on_retry=on_retry)
+    async def read():
+        return f()
+
+    assert asyncio.run(read()) == 3
+    assert len(reconnects) == 2
+
+
+def test_table_columns():
+    rows = [{'pointnum': '007', 'lon': 5.5, 'epochs': 10},
+            {'pointnum': '008', 'lon': 5.25, 'epochs': 12}]
+    table = Table.from_rows(rows)
+    assert table.keys() == ['pointnum', 'lon', 'epochs']
+    assert isinstance(table.columns['lon'], array)
+    assert table.columns['lon'].typecode == 'd'
+    assert table.columns['epochs'].typecode == 'q'
+    # text is never converted, the zero padded numbers are kept
+    assert table.columns['pointnum'] == ['007', '008']
+    assert table[1]['pointnum'] == '008' and table[-1]['lon'] == 5.25
+    assert list(table['lon']) == [5.5, 5.25]
+    assert table.to_listdict() == rows
+    with pytest.raises(IndexError):
+        table[2]
+    with pytest.raises(ValueError):
+        Table({'a': [1], 'b': [1, 2]})
+
+
+def test_table_rows():
+    table = Table.from_records(('pointnum', 'alt'),
+                               [('1', 3.), ('2', 1.), ('3', 2.)])
+    assert [row['pointnum'] for row in table.sorted_by('alt')] == ['2', '3',
+                                                                   '1']
+    high = table.where([alt > 1.5 for alt in table['alt']])
+    assert [row['pointnum'] for row in high] == ['1', '3']
+    projection = table.filter(['alt'])
+    assert projection.keys() == ['alt']
+    assert projection.columns['alt'] is table.columns['alt']
+    assert len(Table.from_records(('a', 'b'), [])) == 0
+
+
+def test_csv_to_table():
+    table = csv_to_table(io.StringIO('pointnum;lon;epochs\n007;5.5;10\n'
+                                     '008;x;12\n'),
+                         delimiter=';', types={'lon': 'd', 'epochs': 'q'})
+    assert table.columns['pointnum'] == ['007', '008']
+    # a column whose values do not all convert stays text
+    assert table.columns['lon'] == ['5.5', 'x']
+    assert list(table.columns['epochs']) == [10, 12]
+    assert table.to_csv(';') == ('pointnum;lon;epochs\r\n007;5.5;10\r\n'
+                                 '008;x;12\r\n')
+
+
+def test_table_to_numpy():
+    numpy = pytest.importorskip('numpy')
+    table = Table.from_records(('lon', 'name'), [(1., 'a'), (2., 'b')])
+    arrays = table.to_numpy()
+    assert arrays.columns['lon'].dtype == numpy.float64
+    table.columns['lon'][0] = 3.
+    # the memory is shared
+    assert arrays.columns['lon'][0] == 3.
+    assert arrays.columns['name'] == ['a', 'b']
+
+
+class CountingFile(io.StringIO):
+    '''StringIO counting its writes.'''
+    writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return io.StringIO.write(self, data)
+
+
+def test_dict_to_csv():
+    items = ListDict([Dict([('name', 'a'), ('lon', 1.5)]),
+                      Dict([('name', 'b'), ('lon', 1 / 3.)])])
+    assert dict_to_csv(items, ';', True, '%.3f') == ('name;lon\r\n'
+                                                     'a;1.500\r\n'
+                                                     'b;0.333\r\n')
+    assert items.to_csv(header=False) == ('a,1.5\r\nb,%r\r\n' % (1 / 3.))
+    assert dict_to_csv([], ';', True) == ''
+
+
+def test_write_csv_chunks():
+    rows = [{'x': float(i), 'y': i} for i in range(10)]
+    output = CountingFile()
+    write_csv(output, rows, header=True, chunksize=4)
+    lines = output.getvalue().split('\r\n')
+    assert lines[0] == 'x,y' and lines[10] == '9.0,9' and lines[11] == ''
+    # the rows are written by chunks as they are formatted
+    assert output.writes == 3
+    # the float columns are formatted with one line template
+    table = Table.from_rows([{'x': 0.5, 'y': 2.}])
+    assert table.to_csv(floatfmt='%.2f') == 'x,y\r\n0.50,2.00\r\n'
+
+
+def test_csv_writer_rows():
+    output = io.StringIO()
+    writer = CSVWriter(output, ('a', 'b'), delimiter=';', floatfmt='%.1f',
+                       lineterminator='\n')
+    writer.writerow({'a': 1.25})
+    writer.writerows([(2, 'x'), {'b': 3.}])
+    assert output.getvalue() == ''
+    writer.flush()
+    assert output.getvalue() == 'a;b\n1.2;\n2;x\n;3.0\n'
+
+
+def test_hex_and_binary():
+    assert bytes_to_hex(b'\xb5\x62\x01') == 'B5 62 01'
+    assert bytes_to_hex(bytearray()) == ''
+    assert hex_to_bytes('B5 62 01') == b'\xb5\x62\x01'
+    assert byte_to_binary(0x4a) == '01001010'
+    assert bytes_to_binary(b'\x4a\xff') == '0100101011111111'
+    assert bytes_to_binary(b'') == ''
+    assert hex_to_binary('0F') == '00001111'
+
+
+def test_binary_to_int():
+    assert binary_to_int('1111110') == 126
+    assert binary_to_int('1111110', 0, 2) == 2
+    assert binary_to_int('1111110', 1, 3) == 3
+    # a stop beyond the string is clamped to its length
+    assert binary_to_int('1111110', 0, 10) == 126
+    assert binary_to_int('1111110', 4, 10) == 7
+
+
+def test_bits():
+    # RTCM3 header: preamble, 6 reserved bits, 10 bits length
+    assert get_bits(b'\xd3\x00\x13', 14, 10) == 19
+    assert get_bits(b'\xd3\x00\x13', 0, 8) == 0xd3
+    assert get_signed_bits(b'\xff\xf0', 0, 12) == -1
+    assert get_signed_bits(b'\x7f\xf0', 0, 12) == 2047
+    fields = StructFields('<BBH', ('msgclass', 'msgid', 'length'))
+    assert fields.unpack(b'\x01\x07\x5c\x00') == {'msgclass': 1, 'msgid': 7,
+                                                  'length': 92}
+    with pytest.raises(ValueError):
+        StructFields('<BB', ('msgclass',))
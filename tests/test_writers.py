@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+'''
+    Points writers: CSV and GeoJSON streams, the GeoPackage feature table
+    with its R-tree index, and the undo of the captured points.
+
+    :copyright: Copyright 2018 Lionel Darras and contributors, see AUTHORS.
+    :license: GNU GPL v3.
+
+'''
+import io
+import json
+import sqlite3
+
+import pytest
+
+from pygpssurvey.writers import (CSVPointWriter, GeoJSONPointWriter,
+                                 GeoPackageWriter, make_writer, gpkg_pointz,
+                                 gpkg_envelope, GPKG_FUNCTIONS)
+
+
+def point(num, lon=5.5538, lat=45.4788, alt=553.8):
+    return {'pointnum': str(num), 'pointname': 'P%d' % num, 'lon': lon,
+            'lon_dir': 'E', 'lat': lat, 'lat_dir': 'N', 'alt': alt,
+            'alt_units': 'M'}
+
+
+class Pipe(io.StringIO):
+    '''Output which cannot be seeked, as a pipe or a terminal.'''
+
+    def seekable(self):
+        return False
+
+
+def test_csv():
+    output = io.StringIO()
+    writer = CSVPointWriter(output, floatfmt='%.3f')
+    writer.writemany([point(1), point(2)])
+    writer.flush()
+    assert output.getvalue() == (
+        'pointnum;pointname;lon;lon_dir;lat;lat_dir;alt;alt_units\n'
+        '1;P1;5.554;E;45.479;N;553.800;M\n'
+        '2;P2;5.554;E;45.479;N;553.800;M\n')
+
+
+def test_csv_undo():
+    output = io.StringIO()
+    writer = CSVPointWriter(output)
+    assert writer.canundo()
+    writer.writemany([point(1), point(2)])
+    writer.flush()
+    # the points of a bulk batch cannot be removed
+    assert not writer.undo()
+    for num in (3, 4):
+        writer.write(point(num))
+        writer.flush()
+    assert writer.undo() and writer.undo()
+    assert not writer.undo()
+    writer.write(point(5))
+    writer.flush()
+    lines = output.getvalue().splitlines()
+    assert [line.split(';')[0] for line in lines[1:]] == ['1', '2', '5']
+    assert writer.count == 3
+
+
+def test_undo_buffered():
+    writer = CSVPointWriter(Pipe())
+    assert not writer.canundo()
+    writer.write(point(1))
+    # a point not written yet is always removed
+    assert writer.undo()
+    writer.write(point(2))
+    writer.flush()
+    assert not writer.undo()
+
+
+def test_geojson():
+    output = io.StringIO()
+    writer = GeoJSONPointWriter(output, floatfmt='%.4f')
+    assert writer.canundo()
+    writer.write(point(1, alt=None))
+    writer.flush()
+    writer.write(point(2))
+    writer.flush()
+    assert writer.undo()
+    features = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(features) == 1
+    assert features[0]['geometry'] == {'type': 'Point',
+                                       'coordinates': [5.5538, 45.4788, 0]}
+    assert features[0]['properties'] == {'pointnum': '1', 'pointname': 'P1',
+                                         'lon_dir': 'E', 'lat_dir': 'N',
+                                         'alt_units': 'M'}
+    assert not GeoJSONPointWriter(Pipe()).canundo()
+
+
+def test_gpkg_envelope():
+    blob = gpkg_pointz(5.5, -45.25, 553.8)
+    assert blob[:2] == b'GP'
+    assert gpkg_envelope(blob) == (5.5, 5.5, -45.25, -45.25)
+
+
+def rtree_count(filename):
+    db = sqlite3.connect(filename)
+    try:
+        return (db.execute('SELECT count(*) FROM points').fetchone()[0],
+                db.execute('SELECT count(*) FROM rtree_points_geom')
+                .fetchone()[0])
+    finally:
+        db.close()
+
+
+def test_gpkg(tmp_path):
+    filename = str(tmp_path / 'points.gpkg')
+    writer = GeoPackageWriter(filename)
+    assert writer.canundo()
+    # a bulk batch, then captured points written one by one
+    writer.writemany([point(i, lon=5. + i * 0.01) for i in range(100)])
+    writer.flush()
+    writer.write(point(100, lon=6.))
+    writer.flush()
+    assert rtree_count(filename) == (101, 101)
+    assert len(writer.query(5.495, 45., 5.515, 46.)) == 2
+    assert writer.query(5.995, 45., 6.005, 46.)[0][0] == '100'
+    assert writer.undo()
+    assert rtree_count(filename) == (100, 100)
+    writer.writemany([point(i, lon=7.) for i in range(101, 103)])
+    writer.close()
+    assert rtree_count(filename) == (102, 102)
+
+    db = sqlite3.connect(filename)
+    assert db.execute('PRAGMA application_id').fetchone()[0] == 1196444487
+    triggers = [row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+    assert 'rtree_points_geom_insert' in triggers
+    assert len(triggers) == 6
+    assert db.execute('SELECT min_x, max_x FROM gpkg_contents').fetchone() \
+        == (5., 7.)
+    # the triggers index the points inserted by other clients
+    for name, function in GPKG_FUNCTIONS:
+        db.create_function(name, 1, function)
+    db.execute('INSERT INTO points (geom, lon, lat) VALUES (?, 8., 45.)',
+               (gpkg_pointz(8., 45., 0.),))
+    db.commit()
+    db.close()
+    assert rtree_count(filename) == (103, 103)
+
+
+def test_make_writer(tmp_path):
+    filename = tmp_path / 'points.gpkg'
+    output = open(str(filename), 'w')
+    writer = make_writer(output, 'gpkg')
+    # a file object given (opened by argparse) is replaced by its filename
+    assert output.closed and writer.filename == str(filename)
+    writer.close()
+    with pytest.raises(ValueError):
+        make_writer(io.StringIO(), 'gpkg')
+    assert isinstance(make_writer(io.StringIO(), 'geojson'),
+                      GeoJSONPointWriter)
+    with pytest.raises(ValueError):
+        make_writer(io.StringIO(), 'shp')